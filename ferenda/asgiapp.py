@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""An ASGI entry point for the ferenda web application. Requires
+Python 3.5 or newer, and is therefore not imported by the ``ferenda``
+package itself -- use :py:func:`ferenda.manager.make_asgi_app`."""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import asyncio
+import sys
+
+
+class ASGIApp(object):
+
+    """Implements an ASGI app on top of a :py:class:`~ferenda.WSGIApp`.
+
+    Requests are routed and handled by the wrapped WSGI app, so the
+    routing, request handlers and search code is shared between the
+    two modes. Each request is run in one of two bounded thread pools,
+    so that the event loop is never blocked: API and search requests
+    (which talk to the fulltext index and the triple store) are run in
+    one, and all other requests (serving files, possibly rendering
+    them on demand) in the other. This way, a number of slow queries
+    can't starve requests for documents. The size of the pools is set
+    with the ``asgiqueryworkers`` and ``asgistaticworkers`` options.
+
+    Response bodies are sent in chunks as they are read, with each
+    read also done in the thread pool.
+
+    :param wsgiapp: The WSGI app to serve
+    :type  wsgiapp: ferenda.WSGIApp
+    """
+
+    def __init__(self, wsgiapp):
+        self.wsgiapp = wsgiapp
+        config = wsgiapp.config
+        self.executors = {
+            'query': ThreadPoolExecutor(max_workers=config.asgiqueryworkers),
+            'static': ThreadPoolExecutor(max_workers=config.asgistaticworkers)}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        elif scope['type'] != 'http':
+            raise ValueError("Can't handle %s requests" % scope['type'])
+        body = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            body.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        environ = self.environ(scope, b''.join(body))
+        executor = self.executors[self.pool(environ['PATH_INFO'])]
+        loop = asyncio.get_event_loop()
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        iterable = await loop.run_in_executor(executor, self.wsgiapp,
+                                              environ, start_response)
+        try:
+            iterator = iter(iterable)
+            # a WSGI app may defer calling start_response until the
+            # first chunk of the body is produced
+            chunk = await loop.run_in_executor(executor, next, iterator, None)
+            await send({'type': 'http.response.start',
+                        'status': int(response['status'].split(" ", 1)[0]),
+                        'headers': [(k.lower().encode("latin-1"),
+                                     v.encode("latin-1"))
+                                    for (k, v) in response['headers']]})
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body',
+                                'body': chunk,
+                                'more_body': True})
+                chunk = await loop.run_in_executor(executor, next,
+                                                   iterator, None)
+            await send({'type': 'http.response.body',
+                        'body': b'',
+                        'more_body': False})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # waiting for running requests mustn't block the
+                # event loop, since their responses are sent from it
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def shutdown(self):
+        """Waits for all running requests to finish, and then shuts down
+        the thread pools."""
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+
+    def pool(self, path):
+        """Returns the name of the thread pool (``"query"`` or
+        ``"static"``) that a request for the given path is run in."""
+        config = self.wsgiapp.config
+        if (path.startswith(config.searchendpoint) or
+                path.startswith(config.apiendpoint) or
+                (config.legacyapi and path.startswith("/-/publ"))):
+            return "query"
+        else:
+            return "static"
+
+    def environ(self, scope, body):
+        """Creates a WSGI environ dict from an ASGI connection scope and the
+        request body."""
+        server = scope.get('server') or ("localhost", 80)
+        environ = {'REQUEST_METHOD': scope['method'],
+                   'SCRIPT_NAME': scope.get('root_path', ''),
+                   'PATH_INFO': scope['path'],
+                   'QUERY_STRING': scope['query_string'].decode("latin-1"),
+                   'SERVER_NAME': server[0],
+                   'SERVER_PORT': str(server[1]),
+                   'SERVER_PROTOCOL': "HTTP/%s" % scope['http_version'],
+                   'wsgi.version': (1, 0),
+                   'wsgi.url_scheme': scope.get('scheme', 'http'),
+                   'wsgi.input': BytesIO(body),
+                   'wsgi.errors': sys.stderr,
+                   'wsgi.multithread': True,
+                   'wsgi.multiprocess': True,
+                   'wsgi.run_once': False}
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for (name, value) in scope['headers']:
+            name = name.decode("latin-1").upper().replace("-", "_")
+            value = value.decode("latin-1")
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = "HTTP_" + name
+            if name in environ:
+                value = environ[name] + "," + value
+            environ[name] = value
+        return environ
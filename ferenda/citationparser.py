@@ -3,8 +3,11 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from builtins import *
 import builtins
+import re
 from copy import copy
 
+import pyparsing
+
 from ferenda.elements import Link, LinkSubject
 
 class CitationParser(object):
@@ -41,6 +44,7 @@ class CitationParser(object):
 
     def __init__(self, *grammars):
         self._grammars = []
+        self._triggers = []
         for grammar in grammars:
             self.add_grammar(grammar)
         self._formatter = None
@@ -54,13 +58,110 @@ class CitationParser(object):
         """
         self._formatter = formatter
 
-    def add_grammar(self, grammar):
+    def add_grammar(self, grammar, trigger=None):
         """Add another grammar.
 
+        A *trigger* is a cheap test that must succeed for the grammar
+        to possibly match a string. Strings that don't contain the
+        trigger aren't scanned by the grammar at all, which is a lot
+        faster, since most strings don't contain any citations. If no
+        trigger is given, one is derived from the grammar if possible.
+
         :param grammar: The grammar to add
         :type grammar: ``pyparsing.ParserElement``
+        :param trigger: A literal string (or list of strings), one of
+                        which must occur in any text matched by the
+                        grammar, or a compiled regular expression that
+                        must match somewhere in any such text.
+        :type trigger: str, list or ``re.RegexObject``
         """
+        if trigger is None:
+            trigger = self.derive_trigger(grammar)
+        elif isinstance(trigger, str):
+            trigger = re.compile(re.escape(trigger))
+        elif isinstance(trigger, (list, tuple, set)):
+            trigger = re.compile("|".join([re.escape(x) for x in
+                                           sorted(trigger, key=len,
+                                                  reverse=True)]))
         self._grammars.append(grammar)
+        self._triggers.append(trigger)
+
+    def derive_trigger(self, grammar):
+        """Try to find a regular expression that must match somewhere in
+        any text that *grammar* matches.
+
+        :param grammar: The grammar to analyze
+        :type grammar: ``pyparsing.ParserElement``
+        :returns: The trigger, or None if no trigger could be derived
+        :rtype: ``re.RegexObject``
+        """
+        pattern = self._trigger_pattern(grammar, set())
+        if pattern is None:
+            return None
+        try:
+            return re.compile(pattern)
+        except re.error:
+            return None
+
+    def _trigger_pattern(self, grammar, seen):
+        # Returns a regex pattern for something that must occur in
+        # every match of grammar, or None if we can't tell. seen
+        # contains the elements we're currently analyzing, to guard
+        # against recursive grammars.
+        if id(grammar) in seen:
+            return None
+        seen = seen | set([id(grammar)])
+        if isinstance(grammar, (pyparsing.Literal, pyparsing.Keyword)):
+            if not grammar.match:
+                return None
+            if (isinstance(grammar, (pyparsing.CaselessLiteral,
+                                     pyparsing.CaselessKeyword)) or
+                    getattr(grammar, 'caseless', False)):
+                return "".join(["[%s%s]" % (re.escape(c.lower()),
+                                            re.escape(c.upper()))
+                                for c in grammar.match])
+            return re.escape(grammar.match)
+        elif isinstance(grammar, pyparsing.Word):
+            return "[%s]" % "".join([re.escape(c) for c in
+                                     sorted(grammar.initChars)])
+        elif isinstance(grammar, pyparsing.Regex):
+            # the regex itself is a necessary condition (note that
+            # oneOf() normally creates Regex objects), as long as it
+            # doesn't depend on any flags
+            if grammar.re.flags & ~re.UNICODE:
+                return None
+            return "(?:%s)" % grammar.re.pattern
+        elif isinstance(grammar, (pyparsing.MatchFirst, pyparsing.Or)):
+            # every alternative must have a trigger
+            patterns = []
+            for expr in grammar.exprs:
+                pattern = self._trigger_pattern(expr, seen)
+                if pattern is None:
+                    return None
+                if pattern not in patterns:
+                    patterns.append(pattern)
+            if not patterns:
+                return None
+            return "|".join(patterns)
+        elif isinstance(grammar, (pyparsing.And, pyparsing.Each)):
+            # every required element must match, so any one of them
+            # will do. Use the first one that has a trigger.
+            for expr in grammar.exprs:
+                pattern = self._trigger_pattern(expr, seen)
+                if pattern is not None:
+                    return pattern
+            return None
+        elif isinstance(grammar, (pyparsing.Optional, pyparsing.ZeroOrMore,
+                                  pyparsing.NotAny)):
+            # these might match the empty string
+            return None
+        elif isinstance(grammar, pyparsing.ParseElementEnhance):
+            # Group, Combine, Suppress, OneOrMore, FollowedBy, Forward
+            # etc -- anything that requires the enclosed expression
+            if grammar.expr is None:
+                return None
+            return self._trigger_pattern(grammar.expr, seen)
+        return None
 
     def parse_string(self, string, predicate="dcterms:references"):
         """Find any citations in a text string, using the configured grammars.
@@ -76,12 +177,16 @@ class CitationParser(object):
         # (string,pyparsing.ParseResult)
         nodes = [string]
         res = nodes  # if self._grammars is None
-        for grammar in self._grammars:
+        for grammar, trigger in zip(self._grammars, self._triggers):
             res = []
             for node in nodes:
                 if not isinstance(node, str):
                     res.append(node)
                     continue
+                if trigger is not None and not trigger.search(node):
+                    # the grammar can't possibly match
+                    res.append(node)
+                    continue
                 matches = grammar.scanString(node)
                 start = 0
                 after = 0
@@ -8,7 +8,6 @@ standard_library.install_aliases()
 from io import StringIO
 from traceback import format_tb
 import datetime
-import hashlib
 import json
 import logging
 import os
@@ -179,7 +178,7 @@ class DocumentEntry(object):
     # entry. Otherwise, it just references it.
     #
     # Note that you can only have one content element.
-    def set_content(self, filename, url, mimetype=None, inline=False):
+    def set_content(self, filename, url, mimetype=None, inline=False, md5=None):
         """Sets the ``content`` property and calculates md5 hash for the file
 
         :param filename: The full path to the document file
@@ -189,6 +188,8 @@ class DocumentEntry(object):
                          guess from file extension.
         :param inline: whether to inline the document content in the file or
                        refer to *url*
+        :param md5: The md5 hash of the file, if already known (eg. from
+                    :py:meth:`ferenda.DocumentStore.digest`)
         """
         if not mimetype:
             mimetype = self.guess_type(filename)
@@ -206,9 +207,11 @@ class DocumentEntry(object):
         else:
             self.content['markup'] = None
             self.content['src'] = url
-            self.content['hash'] = "md5:%s" % self.calculate_md5(filename)
+            if md5 is None:
+                md5 = self.calculate_md5(filename)
+            self.content['hash'] = "md5:%s" % md5
 
-    def set_link(self, filename, url, mimetype=None):
+    def set_link(self, filename, url, mimetype=None, md5=None):
         """Sets the ``link`` property and calculate md5 hash for the RDF metadata.
 
         :param filename: The full path to the RDF file for a document
@@ -216,20 +219,21 @@ class DocumentEntry(object):
                     RDF file
         :param mimetype: The MIME-type used in the atom feed. If not provided,
                          guess from file extension.
+        :param md5: The md5 hash of the file, if already known (eg. from
+                    :py:meth:`ferenda.DocumentStore.digest`)
         """
         if not mimetype:
             mimetype = self.guess_type(filename)
         self.link['href'] = url
         self.link['type'] = mimetype
         self.link['length'] = os.path.getsize(filename)
-        self.link['hash'] = "md5:%s" % self.calculate_md5(filename)
+        if md5 is None:
+            md5 = self.calculate_md5(filename)
+        self.link['hash'] = "md5:%s" % md5
 
     def calculate_md5(self, filename):
         """Given a filename, return the md5 value for the file's content."""
-        c = hashlib.md5()
-        with open(filename, 'rb') as fp:
-            c.update(fp.read())
-        return c.hexdigest()
+        return util.file_md5(filename)
 
     def guess_type(self, filename):
         """Given a filename, return a MIME-type based on the file extension."""
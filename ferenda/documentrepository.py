@@ -19,14 +19,17 @@ import locale
 import calendar
 import codecs
 import difflib
-import filecmp
 import functools
+import hashlib
 import inspect
 import json
 import logging
 import logging.handlers
+import multiprocessing
 import os
+import pickle
 import re
+import shutil
 import socket
 import sys
 import time
@@ -390,16 +393,19 @@ class DocumentRepository(object):
         """
         # in most cases, the user of the Docrepo object won't want to
         # look at the defined ontologies. But in case one does!
-        o = Graph()
+        paths = []
+        prefixes = []
         for prefix, uri in self.ns.items():
             # , "foaf", "skos", "dcterms", "bibo", "prov"):
             if prefix in ("rdf", "rdfs", "owl"):
                 continue
             ontopath = "vocab/%s.ttl" % prefix
             if self.resourceloader.exists(ontopath):
-                with self.resourceloader.open(ontopath) as fp:
-                    o.parse(data=fp.read(), format="turtle")                 
-                    o.bind(prefix, uri)
+                paths.append(self.resourceloader.filename(ontopath))
+                prefixes.append((prefix, uri))
+        o = util.load_graph(paths, cachedir=self.graphcachedir)
+        for prefix, uri in prefixes:
+            o.bind(prefix, uri)
         return o
 
     @cached_property
@@ -410,14 +416,21 @@ class DocumentRepository(object):
         series in which they're published, and so on. The data is
         taken from ``extra/[repoalias].ttl``.
         """
-        cd = Graph()
+        paths = []
         for cls in inspect.getmro(self.__class__):
             if hasattr(cls, "alias"):
                 commonpath = "extra/%s.ttl" % cls.alias
                 if self.resourceloader.exists(commonpath):
-                    with self.resourceloader.open(commonpath) as fp:
-                        cd.parse(data=fp.read(), format="turtle")                 
-        return cd
+                    paths.append(self.resourceloader.filename(commonpath))
+        return util.load_graph(paths, cachedir=self.graphcachedir)
+
+    @property
+    def graphcachedir(self):
+        """The directory where parsed RDF resources (like
+        :py:data:`~ferenda.DocumentRepository.commondata`) are cached
+        in a fast-loading format. See :py:func:`ferenda.util.load_graph`.
+        """
+        return os.sep.join([self.config.datadir, "cache", "graphs"])
 
     @property
     def config(self):
@@ -535,12 +548,16 @@ class DocumentRepository(object):
             'indextype': 'WHOOSH',
             'indexlocation': 'data/whooshindex',
             'combineresources': False,
+            'fingerprintresources': False,
             'staticsite': False,
             'legacyapi': False,
             'sitename': 'MySite',
             'sitedescription': 'Just another Ferenda site',
             'apiendpoint': "/api/",
             'searchendpoint': "/search/",
+            'cachecontrol': [],
+            'asgiqueryworkers': 4,
+            'asgistaticworkers': 16,
         }
 
     @classmethod
@@ -984,6 +1001,8 @@ with the *config* object as single parameter.
                     if isinstance(etag, bytes):
                         etag = etag.decode()
                     fp.write(etag)
+            self.store.record_digest(filename,
+                                     hashlib.md5(response.content).hexdigest())
         return updated
 
     def download_name_file(self, tmpfile, basefile, assumedfile):
@@ -994,7 +1013,8 @@ with the *config* object as single parameter.
         existing file.
 
         """
-        return not filecmp.cmp(new, existing, shallow=False)
+        # new is a temporary file, so its digest isn't recorded
+        return util.file_md5(new) != self.store.digest(existing)
 
     def remote_url(self, basefile):
         """Get the URL of the source document at it's remote location,
@@ -1383,11 +1403,13 @@ with the *config* object as single parameter.
         fp.close()
         with open(tmpfile, "wb") as fp:
             fp.write(res)
-        util.replace_if_different(tmpfile, outfile)
+        digest = hashlib.md5(res).hexdigest()
+        self.store.replace_if_different(tmpfile, outfile, digest=digest)
         # it's a bit nonsensical to first use replace_if_different and
         # then go ahead and update the timestamp, but it helps those
         # cases where a file gets parsed again and again and again.
         os.utime(outfile, None)  # update access/modified timestamp
+        self.store.record_digest(outfile, digest)
         return res
 
     def render_xhtml_tree(self, doc):
@@ -1646,19 +1668,25 @@ with the *config* object as single parameter.
 
         log = cls._setup_logger(cls.alias)
 
+        # index anything that an earlier, unfinished run left in the
+        # fulltext spool (see below), so that it isn't lost or mixed
+        # up with this run.
+        spooldir = docstore.resourcepath("fulltext/_spool")
+        if config.fulltextindex and os.path.exists(spooldir):
+            log.warning("Indexing resources left in %s by an unfinished run" %
+                        spooldir)
+            cls._index_spool(config, spooldir, log)
+
         # check if we need to work at all.
         xhtmlfiles = (docstore.distilled_path(x)
                       for x in docstore.list_basefiles_for("generate"))
         if (not config.force and util.outfile_is_newer(xhtmlfiles, dumppath)):
             if 'upload' in config and config.upload:
-                log.info("Clearing context %s before uploading dump" % (
-                    context))
+                log.info("Replacing context %s with %s" % (context, dumppath))
                 store = TripleStore.connect(config.storetype,
                                             config.storelocation,
                                             config.storerepository)
-                store.clear(context)
-                log.info("Adding %s to %s" % (dumppath, context))
-                store.add_serialized_file(dumppath, "nt", context)
+                store.replace_serialized_file(dumppath, "nt", context)
             return False  # signals to Manager that no work needs to be done
 
         if config.force:
@@ -1684,6 +1712,11 @@ with the *config* object as single parameter.
             FulltextIndex.connect(config.indextype,
                                   config.indexlocation,
                                   repos=repos)
+            # Rather than having every process update the index
+            # (committing once per document), relate_fulltext adds
+            # everything to a spool directory, which is indexed in
+            # one large batch by relate_all_teardown.
+            util.mkdir(spooldir)
 
         # Bulk upload: We implemented an alternate way of loading the
         # triplestore, where we didn't POST into the triplestore
@@ -1708,7 +1741,10 @@ with the *config* object as single parameter.
     def relate_all_teardown(cls, config, *args, **kwargs):
         """Runs any cleanup action needed after relating all documents in a
         docrepo. The default implementation dumps all RDF data loaded
-        into the triplestore into one giant N-Triples file.
+        into the triplestore into one giant N-Triples file, which is
+        then also serialized in the other RDF formats that the
+        requesthandler can serve (``dump.ttl``, ``dump.rdf`` and so
+        on).
 
         .. note::
 
@@ -1761,8 +1797,37 @@ with the *config* object as single parameter.
             util.ensure_dir(dumppath)
             with open(dumppath, "w"):
                 pass
+
+        # Serialize the dump in all other formats that the
+        # requesthandler can serve, so that it can just stream them.
+        cls._serialize_dump(dumppath, log)
+
+        # If relate_fulltext has spooled resources (see
+        # relate_all_setup), add them to the fulltext index.
+        spooldir = docstore.resourcepath("fulltext/_spool")
+        if os.path.exists(spooldir):
+            cls._index_spool(config, spooldir, log)
         return True
 
+    @classmethod
+    def _index_spool(cls, config, spooldir, log):
+        # if indexing fails, the spool directory is kept, and indexed
+        # by the next relate_all_setup
+        values = {'resources': 0,
+                  'spooldir': spooldir}
+        with util.logtime(log.info,
+                          "Indexed %(resources)s resources from %(spooldir)s (%(elapsed).3f sec)",
+                          values):
+            index = FulltextIndex.connect(config.indextype,
+                                          config.indexlocation,
+                                          repos=[])
+            try:
+                values['resources'] = fulltextindex.FulltextSpool(spooldir).replay(index)
+                index.optimize()
+            finally:
+                index.close()
+        shutil.rmtree(spooldir)
+
     @decorators.action
     @decorators.updateentry('relate')
     def relate(self, basefile, otherrepos=[]):
@@ -1834,13 +1899,56 @@ with the *config* object as single parameter.
                 entry.indexed_ft = datetime.now()
         entry.save()
 
+    @classmethod
+    def _serialize_dump(cls, dumppath, log):
+        # Serializes the N-Triples dump at dumppath in every other
+        # RDF format that our requesthandler supports, into files
+        # alongside the dump (eg. dump.ttl).
+        formats = [(suffix, format) for (suffix, format)
+                   in sorted(cls.requesthandler_class._rdfsuffixes.items())
+                   if format != "nt"]
+        if not formats:
+            return
+        g = Graph()
+        values = {'dumpfile': dumppath}
+        try:
+            with util.logtime(log.debug,
+                              "Loaded %(triplecount)s triples from %(dumpfile)s (%(elapsed).3f sec)",
+                              values):
+                g.parse(dumppath, format="nt")
+                values['triplecount'] = len(g)
+        except Exception as e:
+            log.warning("Couldn't load %s: %s: %s" %
+                        (dumppath, e.__class__.__name__, e))
+            return
+        for suffix, format in formats:
+            outpath = os.path.splitext(dumppath)[0] + "." + suffix
+            tmppath = outpath + ".tmp"
+            try:
+                with util.logtime(log.info,
+                                  "Serialized %(dumpfile)s as %(format)s (%(elapsed).3f sec)",
+                                  {'dumpfile': outpath, 'format': format}):
+                    with open(tmppath, "wb") as fp:
+                        g.serialize(fp, format=format)
+                util.robust_rename(tmppath, outpath)
+            except Exception as e:
+                # eg. if the rdflib plugin for a format isn't installed
+                log.warning("Couldn't serialize %s as %s: %s: %s" %
+                            (dumppath, format, e.__class__.__name__, e))
+                util.robust_remove(tmppath)
+
     def _get_triplestore(self, **kwargs):
-        if not hasattr(self, '_triplestore'):
-            self._triplestore = TripleStore.connect(self.config.storetype,
-                                                    self.config.storelocation,
-                                                    self.config.storerepository,
-                                                    **kwargs)
-        return self._triplestore
+        # Not all stores can be shared between threads, and none of
+        # them survive a fork, so each process and thread gets its
+        # own, which is closed when the thread finishes.
+        if not hasattr(self, '_triplestores'):
+            self._triplestores = util.PerThread(
+                lambda: TripleStore.connect(self.config.storetype,
+                                            self.config.storelocation,
+                                            self.config.storerepository,
+                                            **kwargs),
+                close=lambda store: store.close())
+        return self._triplestores.get()
 
     def relate_triples(self, basefile, removesubjects=False):
         """Insert the (previously distilled) RDF statements into the
@@ -1849,14 +1957,17 @@ with the *config* object as single parameter.
         :param basefile: The basefile for the document containing the
                          RDF statements.
         :type  basefile: str
-        :param removesubjects: Whether to remove all identified subjects
-                               from the triplestore beforehand (to clear
-                               the previous version of this basefile's
-                               metadata). FIXME: not yet used
+        :param removesubjects: Whether to remove all statements about the
+                               document (and any fragments of it, like
+                               ``<uri>#S1``) from the triplestore
+                               beforehand (to clear the previous version
+                               of this basefile's metadata). Statements
+                               about other subjects are kept, since
+                               other documents may have made them.
         :type  removesubjects: bool
         :returns: None
         """
-        ts = self._get_triplestore()  # init self._triplestore
+        ts = self._get_triplestore()
         with util.logtime(self.log.debug,
                           "%(basefile)s: Added %(rdffile)s to context %(context)s (%(elapsed).3f sec)",
                           {'basefile': basefile,
@@ -1866,24 +1977,37 @@ with the *config* object as single parameter.
                            'triplestore': self.config.storelocation}):
             with open(self.store.distilled_path(basefile), "rb") as fp:
                 data = fp.read()
-            ts.add_serialized(data, format="xml", context=self.dataset_uri())
+            if removesubjects:
+                # only the document and its fragments are removed.
+                # Finding them in the rdf:about attributes avoids
+                # parsing the statements twice.
+                uri = self.canonical_uri(basefile)
+                subjects = set([uri])
+                for el in etree.fromstring(data).iter():
+                    about = el.get("{http://www.w3.org/1999/02/22-rdf-syntax-ns#}about")
+                    if about and about.startswith(uri + "#"):
+                        subjects.add(about)
+                ts.replace_subjects(subjects, data, format="xml",
+                                    context=self.dataset_uri())
+            else:
+                ts.add_serialized(data, format="xml", context=self.dataset_uri())
 
     def _get_fulltext_indexer(self, repos, batchoptimize=False):
+        # while relating all documents, updates are spooled and
+        # indexed in one batch at the end (see relate_all_setup)
+        spooldir = self.store.resourcepath("fulltext/_spool")
+        if 'all' in self.config and self.config.all is True:
+            if os.path.exists(spooldir):
+                return fulltextindex.FulltextSpool(spooldir)
+        elif os.path.exists(spooldir) and not hasattr(self, '_fulltextindexer'):
+            self.log.warning("%s exists, but is only indexed by relate --all" %
+                             spooldir)
         if not hasattr(self, '_fulltextindexer'):
 
             idx = FulltextIndex.connect(self.config.indextype,
                                         self.config.indexlocation,
                                         repos=repos)
             self._fulltextindexer = idx
-
-            # The batchwriter functionality seems a litte broken --
-            # gave a "ValueError: seek of closed file" error. Since
-            # it's used to speed things up, and we now have
-            # ElasticSearch support for that, it's disabled until
-            # further notice.
-            # if 'all' in self.config:
-            #     self._fulltextindexer._batchwriter = True
-
         return self._fulltextindexer
 
     def relate_dependencies(self, basefile, repos=[]):
@@ -2007,7 +2131,7 @@ parsed document path to that documents dependency file."""
                 values['resources'] += 1
                 values['words'] += len(plaintext.split())
 
-            indexer.commit()  # NB: Destroys indexer._writer
+            indexer.commit()
 
     def _relate_fulltext_resources(self, body):
         res = []
@@ -2091,12 +2215,17 @@ parsed document path to that documents dependency file."""
                 ]
 
     def faceted_data(self):
-        """Provides a list of dicts, each containing a row of information
-        about a single document in the repository. The exact fields
-        provided are controlled by the list of
+        """Provides a sequence of dicts, each containing a row of
+        information about a single document in the repository. The
+        exact fields provided are controlled by the list of
         :py:class:`~ferenda.Facet` objects returned by
         :py:meth:`~ferenda.DocumentRepository.facet`.
 
+        The rows are cached in ``toc/faceted_data.jsonl`` (one row per
+        line) and the returned sequence reads them from there each
+        time it's iterated, so that they never all need to be in
+        memory at the same time.
+
         .. note::
 
            The same document can occur multiple times if any of it's
@@ -2108,38 +2237,136 @@ parsed document path to that documents dependency file."""
         # function (the call to facet_query and facet_select. Custom
         # implementations might prefer to override facet_select
         # (eg. to add additional useful data).
-        cachepath = self.store.resourcepath("toc/faceted_data.json")
+        cachepath = self.store.resourcepath("toc/faceted_data.jsonl")
         dumppath = self.store.resourcepath("distilled/dump.nt")
         if ((not self.config.force) and
                 os.path.exists(cachepath) and
                 util.outfile_is_newer([dumppath], cachepath)):
             self.log.debug("Loading faceted_data from %s" % cachepath)
-            data = json.load(open(cachepath))
         else:
-            data = self.facet_select(self.facet_query(self.dataset_uri()))
-            # make sure the dataset contains no duplicate entries (as determined by URI)
+            # write the rows as they are returned from the triple
+            # store, making sure the dataset contains no duplicate
+            # entries (as determined by URI). The cache file is
+            # written under a temporary name so that an interrupted
+            # run doesn't leave a partial cache.
+            tmppath = cachepath + ".tmp"
+            util.ensure_dir(tmppath)
             uris = set()
-            dupes = []
-            for idx, row in enumerate(list(data)):
-                if row['uri'] not in uris:
+            self.log.debug("Saving faceted_data to %s" % cachepath)
+            with open(tmppath, "w") as fp:
+                for idx, row in enumerate(self.facet_select(
+                        self.facet_query(self.dataset_uri()))):
+                    if row['uri'] in uris:
+                        self.log.warning("faceted_data: found duplicate of uri %s at #%s, skipping" % (row['uri'], idx))
+                        continue
                     uris.add(row['uri'])
-                else:
-                    self.log.warning("faceted_data: found duplicate of uri %s at #%s" % (row['uri'], idx))
-                    dupes.append(idx)
-            for idx in reversed(dupes):
-                self.log.warning("faceted_data: popping %s" % idx)
-                data.pop(idx) # note
+                    fp.write(json.dumps(row, separators=(',', ':')) + "\n")
             uris = None
+            util.robust_rename(tmppath, cachepath)
+        return util.JSONLines(cachepath)
+
+    def facet_statistics(self, otherrepos=[]):
+        """Provides precomputed statistics for all facets in this
+        repository that have a ``dimension_type``, as used by the
+        ``;stats`` API call. For each such facet (in the order returned
+        by :py:meth:`~ferenda.DocumentRepository.facets`) there is a
+        dict with the keys ``rdftype``, ``binding`` and ``postings``,
+        the latter being a list of ``[observation, [uri, ...]]`` pairs,
+        ie. every value that the facet selector returns and the URIs
+        of all documents for which it returns that value.
+
+        The statistics are calculated from the rows returned by
+        :py:meth:`~ferenda.DocumentRepository.faceted_data` and cached
+        in ``toc/facet_statistics.json``. The facet selectors are given
+        the graph returned by
+        :py:meth:`~ferenda.DocumentRepository.facet_resource_graph`
+        for this repo and *otherrepos*.
+
+        """
+        cachepath = self.store.resourcepath("toc/facet_statistics.json")
+        datapath = self.store.resourcepath("toc/faceted_data.jsonl")
+        dumppath = self.store.resourcepath("distilled/dump.nt")
+        if ((not self.config.force) and
+                os.path.exists(cachepath) and
+                util.outfile_is_newer([dumppath, datapath], cachepath)):
+            self.log.debug("Loading facet_statistics from %s" % cachepath)
+            with open(cachepath) as fp:
+                return json.load(fp)
+        stats = self.facet_postings(self.faceted_data(),
+                                    self.facet_resource_graph(otherrepos))
+        util.ensure_dir(cachepath)
+        with open(cachepath, "w") as fp:
+            self.log.debug("Saving facet_statistics to %s" % cachepath)
+            json.dump(stats, fp, default=util.json_default_date)
+        return stats
+
+    def facet_resource_graph(self, otherrepos=[]):
+        """Returns a graph with the extra data (see
+        :py:data:`~ferenda.DocumentRepository.commondata`) of this repo
+        and all of *otherrepos*, and with the namespaces of all of them
+        bound. This is the graph passed to facet selectors when
+        calculating :py:meth:`~ferenda.DocumentRepository.facet_statistics`,
+        since a facet may use labels defined by another repo. The result
+        doesn't depend on which of the repos it's called on.
+
+        """
+        repos = sorted([self] + [r for r in otherrepos if r is not self],
+                       key=lambda r: r.alias)
+        paths = []
+        for repo in repos:
+            for cls in inspect.getmro(repo.__class__):
+                if hasattr(cls, "alias"):
+                    resourcename = "extra/%s.ttl" % cls.alias
+                    if repo.resourceloader.exists(resourcename):
+                        path = repo.resourceloader.filename(resourcename)
+                        if path not in paths:
+                            paths.append(path)
+        resource_graph = util.load_graph(sorted(paths),
+                                         cachedir=self.graphcachedir)
+        for repo in repos:
+            for prefix, ns in repo.make_graph().namespaces():
+                resource_graph.bind(prefix, ns)
+        return resource_graph
+
+    def facet_postings(self, data, resource_graph):
+        """Calculates the postings for all facets in this repository
+        that have a ``dimension_type``, by running the facet selectors
+        over *data* (rows like those returned by
+        :py:meth:`~ferenda.DocumentRepository.faceted_data`), with
+        *resource_graph* as their third argument. The result is a list
+        like the one returned by
+        :py:meth:`~ferenda.DocumentRepository.facet_statistics`, which
+        is not cached.
 
-
-            util.ensure_dir(cachepath)
-            with open(cachepath, "w") as fp:
-                self.log.debug("Saving faceted_data to %s" % cachepath)
-                s = json.dumps(data, indent=4, separators=(', ', ': '))
-                fp.write(s)
-            if os.path.getsize(cachepath) == 0:
-                util.robust_remove(cachepath)
-        return data
+        """
+        qname_graph = self.make_graph()
+        facets = []
+        for facet in self.facets():
+            if not facet.dimension_type:
+                continue
+            binding = qname_graph.qname(facet.rdftype).replace(":", "_")
+            facets.append((facet, binding, OrderedDict()))
+        # go through the rows once, collecting postings for all facets
+        for row in data:
+            for facet, binding, postings in facets:
+                try:
+                    if facet.dimension_type == "ref":
+                        observation = Facet.defaultselector(row, binding)
+                    else:
+                        observation = facet.selector(row, binding,
+                                                     resource_graph)
+                except Exception:
+                    # most selectors rely on information that just
+                    # isn't present in every row
+                    continue
+                if observation is not None:
+                    postings.setdefault(observation, set()).add(row['uri'])
+        stats = []
+        for facet, binding, postings in facets:
+            stats.append({'rdftype': str(facet.rdftype),
+                          'binding': binding,
+                          'postings': [[k, sorted(v)] for k, v in postings.items()]})
+        return stats
 
     def facet_query(self, context):
         """Constructs a SPARQL SELECT query that fetches all
@@ -2240,13 +2467,15 @@ WHERE {
                         If None, search entire triplestore.
         :type  context: str
         :returns: The results of the query, as python objects
-        :rtype: set of dicts"""
+        :rtype: iterable of dicts"""
         store = TripleStore.connect(self.config.storetype,
                                     self.config.storelocation,
                                     self.config.storerepository)
-        res = store.select(query, "python")
-        store.close()
-        return res
+        try:
+            for row in store.select(query, "iterator"):
+                yield row
+        finally:
+            store.close()
 
     #
     #
@@ -2592,7 +2821,7 @@ WHERE {
             self.log.info("%s: Not creating TOC (config has tabs=False)" % self.alias)
             return
         tocindex = self.store.resourcepath("toc/index.html")
-        faceted_data = self.store.resourcepath("toc/faceted_data.json")
+        faceted_data = self.store.resourcepath("toc/faceted_data.jsonl")
         if (not self.config.force) and util.outfile_is_newer([faceted_data], tocindex):
             self.log.debug("Not regenerating TOCs")
             return
@@ -2604,6 +2833,11 @@ WHERE {
             data = self.faceted_data()
             params['rowcount'] = len(data)
         if len(data) > 0:
+            self.facet_statistics(otherrepos)
+            # toc_pagesets and toc_select_for_pages go through all
+            # rows once for each facet, and the latter keeps them all
+            # anyway, so read and decode the rows only once
+            data = list(data)
             facets = self.facets()
             pagesets = self.toc_pagesets(data, facets)
             pagecontent = self.toc_select_for_pages(data, pagesets, facets)
@@ -2742,18 +2976,22 @@ WHERE {
                     documents[key].append(row)
                 except KeyError:
                     pass
+            pages = defaultdict(list)
+            for page in pageset.pages:
+                pages[page.linktext].append(page)
+            keyfunc = functools.partial(facet.key,
+                                        binding=binding,
+                                        resource_graph=self.commondata)
             for key in documents.keys():
                 # find appropriate page in pageset and read it's basefile
-                for page in pageset.pages:
-                    if page.linktext == key:
-                        keyfunc = functools.partial(facet.key,
-                                                    binding=binding,
-                                                    resource_graph=self.commondata)
-                        s = sorted(documents[key],
-                                   key=keyfunc,
-                                   reverse=facet.key_descending)
-                        res[(page.binding, page.value)] = [self.toc_item(binding, row)
-                                                           for row in s]
+                if key not in pages:
+                    continue
+                s = sorted(documents[key],
+                           key=keyfunc,
+                           reverse=facet.key_descending)
+                items = [self.toc_item(binding, row) for row in s]
+                for page in pages[key]:
+                    res[(page.binding, page.value)] = items
         return res
 
     def toc_item(self, binding, row):
@@ -2767,6 +3005,12 @@ WHERE {
         """Creates a set of TOC pages by calling
          :meth:`~ferenda.DocumentRepository.toc_generate_page`.
 
+        Pages whose document list and navigation are unchanged since
+        the last run (as recorded in ``toc/fingerprints.json``) are
+        not re-generated, unless the ``force`` option is set. If the
+        ``processes`` option is larger than 1, pages are generated in
+        parallel.
+
         :param pagecontent: Result from
                             :meth:`~ferenda.DocumentRepository.toc_select_for_pages`
         :param pagesets: Result from
@@ -2774,11 +3018,82 @@ WHERE {
         :param otherrepos: A list of document repository instances
 
         """
+        # Each page is fingerprinted by its document list and the
+        # navigation (which lists all pages), so that pages whose
+        # content hasn't changed since last time aren't re-generated.
+        fingerprintfile = self.store.resourcepath("toc/fingerprints.json")
+        fingerprints = {}
+        if os.path.exists(fingerprintfile) and not self.config.force:
+            with open(fingerprintfile) as fp:
+                fingerprints = json.load(fp)
+        conffile = os.path.abspath(
+            os.sep.join([self.config.datadir, 'rsrc', 'resources.xml']))
+        # pages must also be re-generated when the templates change
+        # (eg. after upgrading ferenda)
+        dependencies = [conffile] + self._toc_templates()
+        nav = [(pageset.label, [(page.linktext, page.title, page.binding,
+                                 page.value) for page in pageset.pages])
+               for pageset in pagesets]
+        navhash = hashlib.sha1(pickle.dumps(nav, protocol=2))
         paths = []
+        jobs = []
+        newfingerprints = {}
         for (binding, value), documents in sorted(pagecontent.items()):
-            paths.append(self.toc_generate_page(
-                binding, value, documents, pagesets, None, otherrepos))
-        return paths
+            basefile = binding + "/" + value
+            outfile = self.store.resourcepath("toc/%s.html" % basefile)
+            h = navhash.copy()
+            h.update(pickle.dumps(documents, protocol=2))
+            newfingerprints[basefile] = h.hexdigest()
+            if (fingerprints.get(basefile) == newfingerprints[basefile] and
+                    util.outfile_is_newer(dependencies, outfile)):
+                paths.append(outfile)
+            else:
+                jobs.append((binding, value, documents))
+        self.log.debug("toc: %s pages unchanged, generating %s" %
+                       (len(paths), len(jobs)))
+        paths.extend(self._toc_generate_jobs(jobs, pagesets, otherrepos))
+        util.ensure_dir(fingerprintfile)
+        with open(fingerprintfile, "w") as fp:
+            json.dump(newfingerprints, fp, indent=2, sort_keys=True)
+        return sorted(paths)
+
+    def _toc_templates(self):
+        # The files for xsl/toc.xsl and all templates it includes or
+        # imports, directly or indirectly
+        xslns = "{http://www.w3.org/1999/XSL/Transform}"
+        templates = []
+        queue = ["toc.xsl"]
+        while queue:
+            resourcename = "xsl/" + queue.pop(0)
+            if not self.resourceloader.exists(resourcename):
+                continue
+            filename = self.resourceloader.filename(resourcename)
+            if filename in templates:
+                continue
+            templates.append(filename)
+            for el in etree.parse(filename).iter(xslns + "include",
+                                                  xslns + "import"):
+                queue.append(el.get("href"))
+        return templates
+
+    def _toc_generate_jobs(self, jobs, pagesets, otherrepos):
+        # Generates the given pages, in parallel if configured to use
+        # several processes. The worker processes are forked after
+        # the jobs are stored on self, so that only job indexes has
+        # to be passed to them.
+        if (self.config.processes > 1 and len(jobs) > 1 and
+                _forkcontext() is not None):
+            self._tocjobs = jobs, pagesets, otherrepos
+            pool = _forkcontext().Pool(self.config.processes,
+                                       _toc_init_worker, (self,))
+            try:
+                return pool.map(_toc_generate_job, range(len(jobs)))
+            finally:
+                pool.terminate()
+                del self._tocjobs
+        return [self.toc_generate_page(binding, value, documents, pagesets,
+                                       None, otherrepos=otherrepos)
+                for (binding, value, documents) in jobs]
 
     def toc_generate_first_page(self, pagecontent, pagesets, otherrepos=[]):
         """Generate the main page of TOC pages."""
@@ -2827,11 +3142,7 @@ WHERE {
         
         doc.body = self.toc_generate_page_body(documentlist, nav)
         
-        conffile = os.path.abspath(
-            os.sep.join([self.config.datadir, 'rsrc', 'resources.xml']))
-        transformer = Transformer('XSLT', "xsl/toc.xsl", "xsl",
-                                  resourceloader=self.resourceloader,
-                                  config=conffile)
+        transformer = self._toc_transformer()
         # FIXME: This is a naive way of calculating the relative depth
         # of the outfile.
 
@@ -2862,6 +3173,17 @@ WHERE {
         self.log.info("Created %s" % outfile)
         return outfile
 
+    def _toc_transformer(self):
+        # Compiling toc.xsl is expensive, so it's done once per process
+        if getattr(self, '_toctransformer', (None, None))[0] != os.getpid():
+            conffile = os.path.abspath(
+                os.sep.join([self.config.datadir, 'rsrc', 'resources.xml']))
+            self._toctransformer = (os.getpid(),
+                                    Transformer('XSLT', "xsl/toc.xsl", "xsl",
+                                                resourceloader=self.resourceloader,
+                                                config=conffile))
+        return self._toctransformer[1]
+
     def toc_generate_page_body(self, documentlist, nav):
         ul = UnorderedList([ListItem(x) for x in documentlist], role='main')
         return Body([nav,
@@ -2878,7 +3200,7 @@ WHERE {
         """
 
         feedindex = self.store.resourcepath("news/main.atom")
-        faceted_data = self.store.resourcepath("toc/faceted_data.json")
+        faceted_data = self.store.resourcepath("toc/faceted_data.jsonl")
         if (not self.config.force) and util.outfile_is_newer([faceted_data], feedindex):
             self.log.debug("Not regenerating feeds")
             return
@@ -3156,22 +3478,25 @@ WHERE {
 
             # Set links to RDF metadata and document content
             if not entry.link:
-                entry.set_link(self.store.distilled_path(basefile),
-                               self.distilled_url(basefile))
+                distilled = self.store.distilled_path(basefile)
+                entry.set_link(distilled, self.distilled_url(basefile),
+                               md5=self.store.digest(distilled))
                 dirty = True
 
             # If we just republish eg. the original PDF file and don't
             # attempt to parse/enrich the document
             if not entry.content:
                 if (self.config.republishsource):
-                    entry.set_content(self.store.downloaded_path(basefile),
-                                      self.downloaded_url(basefile))
+                    downloaded = self.store.downloaded_path(basefile)
+                    entry.set_content(downloaded, self.downloaded_url(basefile),
+                                      md5=self.store.digest(downloaded))
                 else:
                     # the parsed (machine reprocessable) version. The
                     # browser-ready version is referenced with the <link>
                     # element, separate from the set_link <link>
-                    entry.set_content(self.store.parsed_path(basefile),
-                                      self.parsed_url(basefile))
+                    parsed = self.store.parsed_path(basefile)
+                    entry.set_content(parsed, self.parsed_url(basefile),
+                                      md5=self.store.digest(parsed))
                 dirty = True
             if dirty:
                 entry.save()
@@ -3247,6 +3572,13 @@ WHERE {
                             x this amount.
         :type archivesize: int
 
+        Archives are append-only: once an entry has been moved to an
+        archive it stays there, and an archive file is only rewritten
+        if any of its entries has changed or been removed. Which
+        entries are in which archive is recorded in a manifest file
+        (``news/[slug].manifest.json``). If ``config.force`` is set, or
+        the title or archivesize changes, all archives are recreated.
+
         """
 
         # This nested func does most of heavy lifting, the main
@@ -3321,7 +3653,8 @@ WHERE {
             # tmpfile = mkstemp()[1]
             with open(tmpfile, "wb") as fp:
                 fp.write(res)
-            util.replace_if_different(tmpfile, feedfile)
+            self.store.replace_if_different(tmpfile, feedfile,
+                                            digest=hashlib.md5(res).hexdigest())
             return feedfile
 
         assert isinstance(entries, list), 'entries should be a list, not %s' % type(entries)
@@ -3329,33 +3662,99 @@ WHERE {
         # not sure abt this - should be uri of dataset?
         feedid = feedurl
 
+        # Archives are treated as append-only: once an entry has been
+        # placed in an archive, it stays there. The manifest records
+        # which entries each archive contains (and a fingerprint of
+        # each archived entry), so that only the head feed, new
+        # archives and archives with changed entries need to be
+        # written.
+        manifestfile = self.store.resourcepath("news/%s.manifest.json" % slug)
+        manifest = None
+        if os.path.exists(manifestfile) and not self.config.force:
+            try:
+                with open(manifestfile) as fp:
+                    manifest = json.load(fp)
+                if (manifest['archivesize'] != archivesize or
+                        manifest['title'] != title or
+                        manifest['feedurl'] != feedurl):
+                    manifest = None
+            except (ValueError, KeyError, TypeError) as e:
+                # a damaged manifest just means that all archives are
+                # written again
+                self.log.warning("Couldn't read %s: %s" % (manifestfile, e))
+                manifest = None
+        if manifest is None:
+            manifest = {'archivesize': archivesize,
+                        'title': title,
+                        'feedurl': feedurl,
+                        'archives': [],
+                        'fingerprints': {}}
+        archives = manifest['archives']
+        oldfingerprints = manifest['fingerprints']
+        byuri = dict([(entry['uri'], entry) for entry in entries])
+        archived = set(chain.from_iterable(archives))
+        dirty = set()
+        for idx, uris in enumerate(archives):
+            # entries that are no longer published are removed from
+            # their archive, changed entries are updated in place
+            kept = [uri for uri in uris if uri in byuri]
+            if (kept != uris or
+                    any(oldfingerprints.get(uri) != self._news_fingerprint(byuri[uri])
+                        for uri in kept) or
+                    not os.path.exists(self.store.resourcepath(
+                        "feed/%s-archive-%s.atom" % (slug, idx + 1)))):
+                archives[idx] = kept
+                dirty.add(idx)
+
         # assume entries are sorted newest first
-        # could be simplified with more_itertools.chunked?
-        cnt = 0
-        res = []
-        # print("chunking...")
-        while len(entries) >= archivesize * 2:
-            cnt += 1
-            archiveentries = entries[-archivesize:]
-            entries[:] = entries[:-archivesize]
+        head = [entry for entry in entries if entry['uri'] not in archived]
+        while len(head) >= archivesize * 2:
+            archives.append([entry['uri'] for entry in head[-archivesize:]])
+            head = head[:-archivesize]
+            dirty.add(len(archives) - 1)
+            if len(archives) > 1:
+                # the next-archive link of the previously newest
+                # archive changes
+                dirty.add(len(archives) - 2)
 
+        res = []
+        for idx, uris in enumerate(archives):
+            cnt = idx + 1
+            suffix = '-archive-%s' % cnt
+            if idx not in dirty:
+                res.append(self.store.resourcepath("feed/%s%s.atom" % (slug, suffix)))
+                continue
             if cnt > 1:
                 prev = "%s-archive-%s.atom" % (slug, cnt - 1)
             else:
                 prev = None
-            if len(entries) < archivesize * 2:
+            if cnt == len(archives):
                 next = "%s.atom" % slug
             else:
                 next = "%s-archive-%s.atom" % (slug, cnt + 1)
-            suffix = suffix = '-archive-%s' % cnt
-            res.append(write_file(archiveentries, suffix=suffix,
+            res.append(write_file([byuri[uri] for uri in uris], suffix=suffix,
                                   prevarchive=prev,
                                   nextarchive=next))
-
-        res.insert(0, write_file(entries,
-                                 prevarchive="%s-archive-%s.atom" % (slug, cnt)))
+        if archives:
+            prev = "%s-archive-%s.atom" % (slug, len(archives))
+        else:
+            prev = None
+        res.insert(0, write_file(head, prevarchive=prev))
+
+        manifest['fingerprints'] = dict(
+            [(uri, self._news_fingerprint(byuri[uri]))
+             for uri in chain.from_iterable(archives)])
+        # write atomically, so that an interrupted run never leaves
+        # a truncated manifest
+        util.writefile_atomic(manifestfile, json.dumps(manifest).encode("utf-8"))
+        self.log.debug("feed %s: wrote %s of %s archives" %
+                       (slug, len(dirty), len(archives)))
         return res
 
+    def _news_fingerprint(self, entry):
+        return hashlib.sha1(json.dumps(entry, sort_keys=True,
+                                       default=str).encode("utf-8")).hexdigest()
+
     def frontpage_content(self, primary=False):
         """If the module wants to provide any particular content on the
         frontpage, it can do so by returning a XHTML fragment (in text
@@ -3529,3 +3928,29 @@ WHERE {
                         pass
                 log.addHandler(NullHandler())
         return log
+
+
+def _forkcontext():
+    # Returns a multiprocessing context (or module) that starts new
+    # processes by forking, or None if forking isn't possible on this
+    # platform
+    if hasattr(multiprocessing, 'get_context'):
+        if 'fork' in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context('fork')
+    elif sys.platform != "win32":  # pragma: no cover
+        return multiprocessing
+
+
+_tocrepo = None
+
+
+def _toc_init_worker(repo):
+    global _tocrepo
+    _tocrepo = repo
+
+
+def _toc_generate_job(idx):
+    jobs, pagesets, otherrepos = _tocrepo._tocjobs
+    binding, value, documents = jobs[idx]
+    return _tocrepo.toc_generate_page(binding, value, documents, pagesets,
+                                      None, otherrepos=otherrepos)
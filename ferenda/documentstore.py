@@ -5,15 +5,44 @@ from builtins import *
 
 from contextlib import contextmanager
 from tempfile import NamedTemporaryFile
-import filecmp
+import hashlib
 import os
 import shutil
+import sqlite3
 from urllib.parse import quote, unquote
 
 from ferenda import util
 from ferenda import errors
 
 
+class _DigestFile(object):
+    # wraps a file object opened for writing in binary mode, and
+    # calculates the md5 digest of everything written to it.
+    def __init__(self, fp):
+        self.__dict__['_fp'] = fp
+        self.__dict__['_md5'] = hashlib.md5()
+
+    def write(self, data):
+        self._md5.update(data)
+        return self._fp.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def hexdigest(self):
+        return self._md5.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._fp, name, value)
+
+    def __iter__(self):
+        return iter(self._fp)
+
+
 class DocumentStore(object):
 
     """
@@ -51,16 +80,18 @@ class DocumentStore(object):
         if "w" in mode:
             fp = NamedTemporaryFile(mode, delete=False)
             fp.realname = filename
+            if "b" in mode:
+                fp = _DigestFile(fp)
             try:
                 yield fp
             finally:
                 tempname = fp.name
                 fp.close()
-                if not os.path.exists(filename) or not filecmp.cmp(tempname, filename):
-                    util.ensure_dir(filename)
-                    shutil.move(tempname, filename)
+                if "b" in mode:
+                    digest = fp.hexdigest()
                 else:
-                    os.unlink(tempname)
+                    digest = util.file_md5(tempname)
+                self.replace_if_different(tempname, filename, digest=digest)
         else:
             if "a" in mode and not os.path.exists(filename):
                 util.ensure_dir(filename)
@@ -71,6 +102,149 @@ class DocumentStore(object):
             finally:
                 fp.close()
 
+    def replace_if_different(self, src, dst, archivefile=None, digest=None):
+        """Like :py:func:`ferenda.util.replace_if_different`, but
+        compares the md5 digest of *src* with the recorded digest of
+        *dst* (see :py:meth:`~ferenda.DocumentStore.digest`) instead
+        of comparing the files byte by byte. The digest of *dst* is
+        recorded afterwards.
+
+        :param digest: The md5 digest of *src*, if already known
+                       (otherwise it's calculated)
+        :type  digest: str
+        :returns: True if src was moved to dst, False otherwise
+        :rtype: bool
+        """
+        if digest is None:
+            digest = util.file_md5(src)
+        if digest == self.digest(dst):
+            os.unlink(src)
+            return False
+        util.ensure_dir(dst)
+        if archivefile and os.path.exists(dst):
+            util.robust_rename(dst, archivefile)
+        shutil.move(src, dst)
+        self.record_digest(dst, digest)
+        return True
+
+    def digest(self, filename):
+        """Returns the md5 digest (as a hex string) of the contents of
+        *filename*, or None if it doesn't exist.
+
+        Files written through this store (using
+        :py:meth:`~ferenda.DocumentStore.open` and similar methods) have
+        their digest calculated while being written, and recorded in a
+        per-repo digest table. As long as the size and modification
+        time of such a file is unchanged, the recorded digest is
+        returned without reading the file. Other files are hashed, and
+        their digests recorded for next time.
+
+        :param filename: The full path to a file
+        :type  filename: str
+        :returns: The md5 digest, or None
+        :rtype: str
+        """
+        key = self._digestkey(filename)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            if key is not None:
+                self._forget_digests([key])
+            return None
+        if key is not None:
+            try:
+                with self._digestdb() as db:
+                    row = db.execute(
+                        "SELECT size, mtime, md5 FROM digests WHERE path = ?",
+                        (key,)).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row and row[0] == st.st_size and row[1] == st.st_mtime:
+                return row[2]
+        digest = util.file_md5(filename)
+        self.record_digest(filename, digest, st)
+        return digest
+
+    def record_digest(self, filename, digest, stat=None):
+        """Records the md5 digest of *filename*, which must exist, in the
+        digest table. Call this after writing a file by other means
+        than through this store, if the digest of the content is known
+        already.
+
+        :param filename: The full path to a file
+        :type  filename: str
+        :param digest: The md5 digest of the file
+        :type  digest: str
+        """
+        key = self._digestkey(filename)
+        if key is None:
+            return
+        if stat is None:
+            stat = os.stat(filename)
+        try:
+            with self._digestdb() as db:
+                db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                           (key, stat.st_size, stat.st_mtime, digest))
+        except sqlite3.Error:
+            # the digest table is only a cache -- if it can't be
+            # written, digests will be recalculated as needed
+            pass
+
+    def prune_digests(self):
+        """Removes the recorded digests of all files that no longer
+        exist from the digest table.
+
+        :returns: The number of removed digests
+        :rtype: int
+        """
+        if not os.path.exists(self.resourcepath("digests.db")):
+            return 0
+        try:
+            with self._digestdb() as db:
+                keys = [row[0] for row in db.execute("SELECT path FROM digests")]
+        except sqlite3.Error:
+            return 0
+        missing = [key for key in keys if not os.path.exists(
+            self.datadir + os.sep + key.replace("/", os.sep))]
+        self._forget_digests(missing)
+        return len(missing)
+
+    def _forget_digests(self, keys):
+        if not keys or not os.path.exists(self.resourcepath("digests.db")):
+            return
+        try:
+            with self._digestdb() as db:
+                db.executemany("DELETE FROM digests WHERE path = ?",
+                               [(key,) for key in keys])
+        except sqlite3.Error:
+            pass
+
+    def _digestkey(self, filename):
+        # only files below datadir are recorded in the digest table
+        relpath = os.path.relpath(filename, self.datadir)
+        if relpath.startswith(os.pardir):
+            return None
+        return relpath.replace(os.sep, "/")
+
+    @contextmanager
+    def _digestdb(self):
+        # The connection is closed after each operation, so that no
+        # connections are kept for finished threads or removed
+        # datadirs (and, on Windows, so that the datadir can be
+        # removed). Opening a sqlite database is cheap compared to
+        # hashing a file.
+        path = self.resourcepath("digests.db")
+        util.ensure_dir(path)
+        db = sqlite3.connect(path, timeout=30)
+        try:
+            db.execute("PRAGMA synchronous = OFF")
+            db.execute("CREATE TABLE IF NOT EXISTS digests "
+                       "(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, md5 TEXT)")
+            yield db
+            db.commit()
+        finally:
+            db.close()
+
     # TODO: Maybe this is a worthwhile extension to the API? Could ofc
     # easily be done everywhere where a non-document related path is
     # needed.
@@ -163,7 +337,6 @@ class DocumentStore(object):
         else:
             return unixpath.replace("/", os.sep)
 
-    @contextmanager
     def open(self, basefile, maindir, suffix, mode="r", version=None, attachment=None):
         """Context manager that opens files for reading or writing. The
         parameters are the same as for
@@ -182,18 +355,7 @@ class DocumentStore(object):
 
         """
         filename = self.path(basefile, maindir, suffix, version, attachment)
-        fp = NamedTemporaryFile(mode, delete=False)
-        fp.realname = filename
-        try:
-            yield fp
-        finally:
-            tempname = fp.name
-            fp.close()
-            if not os.path.exists(filename) or not filecmp.cmp(tempname, filename):
-                util.ensure_dir(filename)
-                shutil.move(tempname, filename)
-            else:
-                os.unlink(tempname)
+        return self._open(filename, mode)
 
     def list_basefiles_for(self, action, basedir=None):
         """Get all available basefiles that can be used for the
@@ -27,8 +27,10 @@ import ast
 import datetime
 import json
 import logging
+import pickle
 import re
 import inspect
+import struct
 import xml.etree.cElementTree as ET
 import sys
 from collections import OrderedDict
@@ -48,10 +50,22 @@ E = ElementMaker(namespace="http://www.w3.org/1999/xhtml",
                  nsmap={None: "http://www.w3.org/1999/xhtml"})
 
 
+# Version of the binary serialization format. Data serialized with
+# another version can't be deserialized.
+BINARY_VERSION = 1
+_BINARY_MAGIC = b"FERENDA-ELEMENTS"
+
+
 def serialize(root, format="xml"):
     """Given any :py:class:`~ferenda.elements.AbstractElement` *root*
     object, returns a XML serialization of *root*, recursively.
 
+    If *format* is ``"json"``, a JSON serialization is returned
+    instead. If *format* is ``"binary"``, a compact binary
+    serialization (as bytes) that is much faster to create and read
+    than the JSON format, but supports exactly the same objects, is
+    returned.
+
     """
     if format == "xml":
         t = __serialize_xml(root)
@@ -61,6 +75,10 @@ def serialize(root, format="xml"):
         t = __serialize_json(root)
         r = json.dumps(t, indent=4, ensure_ascii=False, sort_keys=True)
         return r
+    elif format == "binary":
+        t = __serialize_binary(root)
+        return (_BINARY_MAGIC + struct.pack(">H", BINARY_VERSION) +
+                pickle.dumps(t, 2))
     else:
         raise ValueError("Invalid serialization format: %s" % format)
 
@@ -89,6 +107,17 @@ def deserialize(xmlstr, format="xml", caller_globals=None):
         root = json.loads(xmlstr)
         t = __deserialize_json(root)
         return t
+    elif format == "binary":
+        headerlen = len(_BINARY_MAGIC) + 2
+        if xmlstr[:len(_BINARY_MAGIC)] != _BINARY_MAGIC:
+            raise ValueError("Not a binary serialization")
+        version = struct.unpack(">H", xmlstr[len(_BINARY_MAGIC):headerlen])[0]
+        if version != BINARY_VERSION:
+            raise ValueError("Can't deserialize binary format version %s "
+                             "(expected %s)" % (version, BINARY_VERSION))
+        return __deserialize_binary(pickle.loads(xmlstr[headerlen:]))
+    else:
+        raise ValueError("Invalid serialization format: %s" % format)
 
 
 class AbstractElement(object):
@@ -703,19 +732,7 @@ def __serialize_json(node):
     elif type(node) == dict or type(node).__name__ == "dict":
         return native(dict([(k, __serialize_json(v)) for k, v in node.items()]))
     else:
-        if node.__class__.__module__ in ('builtins', '__builtin__'):
-            # py2 workaround -- we want a str to be known as 'str' always, but py2
-            # thinks they're called 'unicode'...
-            if type(node) == str:
-                typename = "str"
-            elif type(node) == bytes:
-                typename = "bytes"
-            else:
-                typename = node.__class__.__name__
-        else:
-            typename = node.__class__.__module__ + "." + node.__class__.__name__
-
-        e = {'@class': typename}
+        e = {'@class': _typename(node)}
         if hasattr(node, '__dict__'):
             for key in [x for x in list(node.__dict__.keys()) if not x.startswith('_')]:
                 val = node.__dict__[key]
@@ -749,30 +766,130 @@ def __serialize_json(node):
             e['@content'] = repr(node)
         return e
 
+def _typename(node):
+    if node.__class__.__module__ in ('builtins', '__builtin__'):
+        # py2 workaround -- we want a str to be known as 'str' always, but py2
+        # thinks they're called 'unicode'...
+        if type(node) == str:
+            return "str"
+        elif type(node) == bytes:
+            return "bytes"
+        else:
+            return node.__class__.__name__
+    else:
+        return node.__class__.__module__ + "." + node.__class__.__name__
+
+
+def __serialize_binary(root):
+    # The tree is converted to a structure of native python objects
+    # which is then pickled. Native str, int, bool, list and dict
+    # objects are stored as-is. All other objects are stored as
+    # tuples: (typeidx, content, attrval1, attrval2, ...), where
+    # typeidx points into a table of (classname, (attrname1,
+    # attrname2, ...)) tuples, so that class and attribute names are
+    # only stored once for each distinct class/attribute layout. The
+    # information stored is exactly the same as for the JSON format,
+    # except that graphs are stored as N-Triples.
+    types = {}
+    table = []
+
+    def encode(node):
+        t = type(node)
+        if t in (str, int, bool) or t.__name__ == "unicode":
+            return node
+        elif t == list:
+            return [encode(x) for x in node]
+        elif t == dict or t.__name__ == "dict":
+            return native(dict([(k, encode(v)) for k, v in node.items()]))
+        attrs = {}
+        if hasattr(node, '__dict__'):
+            for key, val in node.__dict__.items():
+                if (key.startswith('_') or val is None or
+                        isinstance(val, logging.Logger)):
+                    continue
+                attrs[key] = val
+        if isinstance(node, list) or isinstance(node, tuple):
+            content = [encode(x) for x in node]
+        elif isinstance(node, dict):
+            content = native(dict([(k, encode(v)) for k, v in node.items()]))
+        elif isinstance(node, bytes):
+            content = node.decode()
+        elif isinstance(node, str):
+            content = str(node)
+        elif isinstance(node, pyparsing.ParseResults):
+            attrs['name'] = node.getName()
+            content = repr(node)
+        elif isinstance(node, Graph):
+            attrs['identifier'] = node.identifier
+            # N-Triples is fast to create and parse, but doesn't
+            # include namespace bindings
+            content = (node.serialize(format="nt").decode('utf-8'),
+                       [(str(prefix), str(ns)) for (prefix, ns) in node.namespaces()])
+        else:
+            content = repr(node)
+        names = tuple(sorted(attrs))
+        key = (_typename(node), names)
+        idx = types.get(key)
+        if idx is None:
+            idx = types[key] = len(table)
+            table.append(key)
+        return (idx, content) + tuple([encode(attrs[k]) for k in names])
+
+    root = encode(root)
+    return (table, root)
+
+
+def __deserialize_binary(data):
+    table, root = data
+    types = [(_find_class(typename), names) for (typename, names) in table]
+
+    def decode(node):
+        t = type(node)
+        if t == tuple:
+            cls, names = types[node[0]]
+            attribs = dict(zip(names, [decode(v) for v in node[2:]]))
+            return _construct(cls, node[1], attribs, decode, "nt")
+        elif t == list:
+            return [decode(x) for x in node]
+        elif t == dict:
+            return dict([(k, decode(v)) for k, v in node.items()])
+        else:
+            return node
+
+    return decode(root)
+
+
 _state = {'fontspec': None}
+_classes = {}
+
+
+def _find_class(nodetype):
+    if nodetype in _classes:
+        return _classes[nodetype]
+    try:
+        modulename, classname = nodetype.rsplit(".", 1)
+        __import__(modulename)
+        m = sys.modules[modulename]
+        for name, cls in inspect.getmembers(m, inspect.isclass):
+            if name == classname:
+                break  # setting cls to what we want
+    # "need more than 1 value to unpack": we have a builtin type like str, int, bool
+    except ValueError:
+        cls = {'str': str,
+               'int': int,
+               'bool': bool,
+               'bytes': bytes}[nodetype]
+    _classes[nodetype] = cls
+    return cls
 
 
 def __deserialize_json(node):
-    from ferenda.pdfreader import PDFReader, Textbox
-    from ferenda import Document
     nodetype = None
     if hasattr(node, 'get'):
         nodetype = node.get("@class")
     # 1. get the appropriate class object
     if nodetype:
-        try:
-            modulename, classname = nodetype.rsplit(".", 1)
-            __import__(modulename)
-            m = sys.modules[modulename]
-            for name, cls in inspect.getmembers(m, inspect.isclass):
-                if name == classname:
-                    break  # setting cls to what we want
-        # "need more than 1 value to unpack": we have a builtin type like str, int, bool
-        except ValueError:
-            cls = {'str': str,
-                   'int': int,
-                   'bool': bool,
-                   'bytes': bytes}[nodetype]
+        cls = _find_class(nodetype)
         content = node['@content']
     else:
         # native objects (int, str, bool, list, dict (which is
@@ -786,6 +903,14 @@ def __deserialize_json(node):
     if hasattr(node, 'items'):
         attribs = dict([(k, __deserialize_json(v))
                         for k, v in node.items() if not k.startswith("@")])
+    return _construct(cls, content, attribs, __deserialize_json, "xml")
+
+
+def _construct(cls, content, attribs, decode, graphformat):
+    # creates an object of class cls from content and attribs, which
+    # have been decoded from either the JSON or the binary format.
+    from ferenda.pdfreader import PDFReader, Textbox
+    from ferenda import Document
 
     # hack for deserializing pdfreader objects -- store the current
     # fontspecs dict as soon as we see it, we'll be needing it every
@@ -799,9 +924,9 @@ def __deserialize_json(node):
     if issubclass(cls, list):
         if issubclass(cls, Textbox):
             attribs['fontspec'] = _state['fontspec']
-        o = cls([__deserialize_json(x) for x in content], **attribs)
+        o = cls([decode(x) for x in content], **attribs)
     elif issubclass(cls, dict):
-        o = cls([(k, __deserialize_json(v)) for k, v in content.items()], **attribs)
+        o = cls([(k, decode(v)) for k, v in content.items()], **attribs)
     elif issubclass(cls, bytes):
         # assume only ascii
         o = cls(content.encode(), **attribs)
@@ -821,12 +946,17 @@ def __deserialize_json(node):
         o = cls([])
         parent = None
         accumNames = {}
-        name = node['name']
+        name = attribs['name']
         o.__setstate__((tocdict[0], (tocdict[1], parent, accumNames, name)))
     elif issubclass(cls, Graph):
-        # first create the graph identifier (BNode or URIRef object)
-        i = __deserialize_json(node['identifier'])
-        o = cls(identifier=i).parse(data=content)
+        # the graph identifier (BNode or URIRef object) has already
+        # been created
+        o = cls(identifier=attribs['identifier'])
+        if graphformat == "nt":
+            content, bindings = content
+            for (prefix, ns) in bindings:
+                o.bind(prefix, ns)
+        o.parse(data=content, format=graphformat)
     elif issubclass(cls, Document):
         o = cls(**attribs)  # no actual content, only attributes/properties
     else:
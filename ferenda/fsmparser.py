@@ -22,6 +22,14 @@ class FSMParser():
 
     """
 
+    memoize = False
+    """If True, the result of every recognizer is cached for the
+    current chunk, so that a recognizer is called at most once per
+    chunk even if the chunk is analyzed in several states (eg. after a
+    transition that returns to a parent state). Only enable this if
+    your recognizers depend solely on the chunk(s) in the reader, not
+    on the current state of the parser."""
+
     def __init__(self):
         self.debug = False
         self.transitions = None  # set by set_transitions
@@ -32,6 +40,9 @@ class FSMParser():
         self.initial_constructor = None
         # pseudo-internal
         self._state_stack = []
+        self._applicable = None  # set by _compile_transitions()
+        self._memo = {}
+        self._memo_pos = None
         self.log = logging.getLogger(__name__)
 
     def _debug(self, msg):
@@ -49,6 +60,7 @@ class FSMParser():
         order to recognize symbols from the stream of text
         chunks. Recognizers are tried in the order specified here."""
         self.recognizers = args
+        self._compile_transitions()
 
     def set_transitions(self, transitions):
         """Set the transition table for the state matchine.
@@ -67,16 +79,34 @@ class FSMParser():
             if (not isinstance(before_states, (list, tuple))):
                 before_states = [before_states]
             for before_state in before_states:
-                if callable(after):
-                    self._debug("%r,%s() -> %s()" %
-                                (before_state, recognizer.__name__, after.__name__))
-                elif callable(after[0]):
-                    self._debug("%r,%s() -> %s(), %r" %
-                                (before_state, recognizer.__name__, after[0].__name__, after[1]))
-                else:
-                    self._debug("%r,%s() -> %r, %r" %
-                                (before_state, recognizer.__name__, after[0], after[1]))
+                if self.debug:
+                    if callable(after):
+                        self._debug("%r,%s() -> %s()" %
+                                    (before_state, recognizer.__name__, after.__name__))
+                    elif callable(after[0]):
+                        self._debug("%r,%s() -> %s(), %r" %
+                                    (before_state, recognizer.__name__, after[0].__name__, after[1]))
+                    else:
+                        self._debug("%r,%s() -> %r, %r" %
+                                    (before_state, recognizer.__name__, after[0], after[1]))
                 self.transitions[(before_state, recognizer)] = after
+        self._compile_transitions()
+
+    def _compile_transitions(self):
+        # Creates a table mapping each state to the recognizers that
+        # are applicable in that state, in the order specified by
+        # set_recognizers, so that analyze_symbol doesn't need to scan
+        # the entire transition table for every chunk.
+        if self.transitions is None or self.recognizers is None:
+            self._applicable = None
+            return
+        applicable = {}
+        for (state, recognizer) in self.transitions:
+            applicable.setdefault(state, set()).add(recognizer)
+        self._applicable = {}
+        for state, recognizers in applicable.items():
+            self._applicable[state] = tuple([r for r in self.recognizers
+                                             if r in recognizers])
 
     def parse(self, chunks):
         """Parse a document in the form of an iterable of suitable
@@ -103,7 +133,12 @@ class FSMParser():
         :type initialconstructor: callable
         :returns: A document object tree.
         """
-        self._debug("Starting parse")
+        if self.debug:
+            self._debug("Starting parse")
+        if self._applicable is None:
+            self._compile_transitions()
+        self._memo = {}
+        self._memo_pos = None
         self.reader = Peekable(chunks)
         self._state_stack = [self.initial_state]
         return self.initial_constructor(self)
@@ -111,42 +146,52 @@ class FSMParser():
     def analyze_symbol(self):
         """Internal function used by make_children()"""
         try:
-            rawchunk = self.reader.peek()
-            chunk = str(rawchunk)
-            # chunk = repr(rawchunk)
-            if len(chunk) > 90:
-                # chunk = chunk[:25] + "[...]" + chunk[-10:]
-                seg = (chunk[:25], chunk[-10:])
-                try:
-                    chunk = "%s [...] %s" % seg
-                except UnicodeDecodeError:
-                    chunk = "%r [...] %r" % seg
-            else:
-                chunk = chunk
-
+            self.reader.peek()
         except StopIteration:
-            self._debug("We're done!")
+            if self.debug:
+                self._debug("We're done!")
             return None
 
-        applicable_tmp = [x[1]
-                          for x in self.transitions.keys() if x[0] == self._state_stack[-1]]
-        # Create correct sorting of applicable_recognizers
-        applicable_recognizers = []
-        for recognizer in self.recognizers:
-            if recognizer in applicable_tmp:
-                applicable_recognizers.append(recognizer)
-
-        applicable_display = ", ".join([x.__name__ for x in applicable_recognizers])
+        applicable_recognizers = self._applicable.get(self._state_stack[-1], ())
+        if self.memoize:
+            if self._memo_pos != self.reader.consumed:
+                self._memo = {}
+                self._memo_pos = self.reader.consumed
+            memo = self._memo
         for recognizer in applicable_recognizers:
-            if recognizer(self):
-                self._debug("Tested '%s' against %s -> %s " %
-                            (chunk, applicable_display,
-                             recognizer.__name__))
-                # self._debug("%r -> %s" % (chunk, recognizer.__name__))
+            if self.memoize:
+                if recognizer in memo:
+                    result = memo[recognizer]
+                else:
+                    result = memo[recognizer] = recognizer(self)
+            else:
+                result = recognizer(self)
+            if result:
+                if self.debug:
+                    self._debug("Tested '%s' against %s -> %s " %
+                                (self._chunk_display(),
+                                 self._recognizers_display(applicable_recognizers),
+                                 recognizer.__name__))
                 return recognizer
         raise FSMStateError(
             "No recognizer match for %s (tried %s)" %
-            (chunk, applicable_display))
+            (self._chunk_display(),
+             self._recognizers_display(applicable_recognizers)))
+
+    def _chunk_display(self):
+        # a shortened version of the current chunk, for use in debug
+        # and error messages
+        chunk = str(self.reader.peek())
+        if len(chunk) > 90:
+            seg = (chunk[:25], chunk[-10:])
+            try:
+                chunk = "%s [...] %s" % seg
+            except UnicodeDecodeError:
+                chunk = "%r [...] %r" % seg
+        return chunk
+
+    def _recognizers_display(self, recognizers):
+        return ", ".join([x.__name__ for x in recognizers])
 
     def transition(self, currentstate, symbol):
         """Internal function used by make_children()"""
@@ -184,24 +229,28 @@ class FSMParser():
         :returns: The same ``parent`` object.
 
         """
-        self._debug("Making children for %s" % parent.__class__.__name__)
+        debug = self.debug
+        if debug:
+            self._debug("Making children for %s" % parent.__class__.__name__)
         while True:  # we'll break out of this when transition()
                     # returns a constructor that is False
             symbol = self.analyze_symbol()
             if symbol is None:  # no more symbols
-                self._debug("We're done!")
+                if debug:
+                    self._debug("We're done!")
                 return parent
 
             (constructor, newstate) = self.transition(self._state_stack[-1],
                                                       symbol)
 
-            if constructor is False:
-                self._debug("transition(%r,%s()) -> (False,%r)" %
-                            (self._state_stack[-1], symbol.__name__, newstate))
-            else:
-                self._debug("transition(%r,%s()) -> (%s(),%r)" %
-                            (self._state_stack[-1], symbol.__name__,
-                             constructor.__name__, newstate))
+            if debug:
+                if constructor is False:
+                    self._debug("transition(%r,%s()) -> (False,%r)" %
+                                (self._state_stack[-1], symbol.__name__, newstate))
+                else:
+                    self._debug("transition(%r,%s()) -> (%s(),%r)" %
+                                (self._state_stack[-1], symbol.__name__,
+                                 constructor.__name__, newstate))
 
             # if transition() indicated that we should change state,
             # first find out whether the constructor will call
@@ -210,7 +259,8 @@ class FSMParser():
             # attribute (set by the @ferenda.decorators.newstate
             # decorator)
             if newstate and not hasattr(constructor, 'newstate'):
-                self._debug("Changing top of state stack (%r->%r)" %
+                if debug:
+                    self._debug("Changing top of state stack (%r->%r)" %
                             (self._state_stack[-1], newstate))
                 self._state_stack[-1] = newstate
 
@@ -218,7 +268,8 @@ class FSMParser():
                 try:
                     element = self.make_child(constructor, newstate)
                 except StopIteration:
-                    self._debug("Couldn't make child -- seems we're done!")
+                    if debug:
+                        self._debug("Couldn't make child -- seems we're done!")
                     element = None
                 if element is not None:
                     parent.append(element)
@@ -228,9 +279,10 @@ class FSMParser():
                 # FIXME: we have no regular test case for this path,
                 # but integrationRFC excercises it
                 if newstate:
-                    self._debug(
-                        "Changing the state we'll return to (self._state_stack[-2])")
-                    self._debug("  (from %r to %r)" % (self._state_stack[-2], newstate))
+                    if debug:
+                        self._debug(
+                            "Changing the state we'll return to (self._state_stack[-2])")
+                        self._debug("  (from %r to %r)" % (self._state_stack[-2], newstate))
                     self._state_stack[-2] = newstate
                 return parent
 
@@ -242,6 +294,7 @@ class Peekable(object):
     def __init__(self, iterable):
         self._iterable = iter(iterable)
         self._cache = deque()
+        self.consumed = 0  # number of items returned by next()
 
     def __iter__(self):
         return self
@@ -253,6 +306,7 @@ class Peekable(object):
     def __next__(self):
         self._fillcache()
         result = self._cache.popleft()
+        self.consumed += 1
         return result
 
     # useful alias
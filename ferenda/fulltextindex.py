@@ -5,15 +5,20 @@ from builtins import *
 from future import standard_library
 standard_library.install_aliases()
 
+from collections import OrderedDict
 from datetime import date, datetime, MAXYEAR, MINYEAR
 from urllib.parse import quote
 from copy import deepcopy
 import itertools
 import json
 import math
+import os
+import pickle
 import re
 import shutil
+import socket
 import tempfile
+import threading
 
 import requests
 import requests.exceptions
@@ -36,6 +41,22 @@ class FulltextIndex(object):
     indextypes = {}  # this is repopulated at the very end of this
                      # module, when the classes we need to specify are
                      # defined.
+
+    batchsize = 1000
+    """In batch mode (see :py:meth:`start_batch`), the max number of
+    updated resources to keep before committing them."""
+
+    batchbytes = 32 * 1024 * 1024
+    """In batch mode, the max amount of pending data to keep before
+    committing it (measured in characters of text for Whoosh, and in
+    bytes of request data for ElasticSearch)."""
+
+    _batch = None
+
+    querycachesize = 100
+    """The max number of query results to keep in the query result
+    cache. Cached results are only used as long as the index hasn't
+    changed (see :py:meth:`generation`). Set to 0 to disable caching."""
     
     @classmethod
     def connect(cls, indextype, location, repos):
@@ -52,6 +73,9 @@ class FulltextIndex(object):
 
     def __init__(self, location, repos):
         self.location = location
+        self._querycache = OrderedDict()
+        self._querygeneration = None
+        self._querycachelock = threading.Lock()
         if self.exists():
             self.index = self.open()
         else:
@@ -151,9 +175,43 @@ class FulltextIndex(object):
         raise NotImplementedError  # pragma: no cover
 
     def commit(self):
-        """Commit all pending updates to the fulltext index."""
+        """Commit all pending updates to the fulltext index.
+
+        In batch mode, pending updates are only committed once there
+        are :py:attr:`batchsize` resources or :py:attr:`batchbytes`
+        characters of text pending."""
         raise NotImplementedError  # pragma: no cover
 
+    def start_batch(self):
+        """Start batch mode, for when a large number of resources are to be
+        updated. Until :py:meth:`end_batch` is called,
+        :py:meth:`~ferenda.FulltextIndex.commit` only commits when
+        enough updates have accumulated."""
+        self._batch = [0, 0]  # resources, characters
+
+    def end_batch(self):
+        """Commit all pending updates and end batch mode."""
+        self._batch = None
+        self.commit()
+
+    def _batch_add(self, size):
+        # keep track of pending updates in batch mode
+        if self._batch is not None:
+            self._batch[0] += 1
+            self._batch[1] += size
+
+    def _batch_full(self):
+        # whether pending updates should be committed now (always
+        # true when not in batch mode)
+        return (self._batch is None or
+                self._batch[0] >= self.batchsize or
+                self._batch[1] >= self.batchbytes)
+
+    def optimize(self):
+        """Optimize the index after a large number of updates, eg by merging
+        index segments. The default implementation does nothing."""
+        pass
+
     def close(self):
         """Commits all pending updates and closes the index."""
         raise NotImplementedError  # pragma: no cover
@@ -181,8 +239,59 @@ class FulltextIndex(object):
            simple full text queries are possible.
 
         """
+        generation = None
+        if self.querycachesize:
+            generation = self.generation()
+        if generation is None:
+            return self._query(q, pagenum, pagelen, **kwargs)
+        key = self._query_key(q, pagenum, pagelen, kwargs)
+        with self._querycachelock:
+            if generation != self._querygeneration:
+                # the index has changed, all cached results are stale
+                self._querycache.clear()
+                self._querygeneration = generation
+            result = self._querycache.pop(key, None)
+        if result is None:
+            result = self._query(q, pagenum, pagelen, **kwargs)
+        with self._querycachelock:
+            if generation == self._querygeneration:
+                if (key not in self._querycache and
+                        len(self._querycache) >= self.querycachesize):
+                    self._querycache.popitem(last=False)
+                self._querycache[key] = result  # most recently used last
+        # callers may modify the result, so don't hand out the cached
+        # objects
+        return deepcopy(result)
+
+    def _query(self, q, pagenum, pagelen, **kwargs):
+        # does the actual querying for query()
         raise NotImplementedError  # pragma: no cover
 
+    def _query_key(self, q, pagenum, pagelen, kwargs):
+        # returns a normalized, hashable version of the query
+        # parameters
+        if q:
+            q = " ".join(q.split())
+        params = []
+        for k, v in sorted(kwargs.items()):
+            if isinstance(v, SearchModifier):
+                v = (v.__class__.__name__,) + tuple(v.values)
+            elif isinstance(v, list):
+                v = tuple(v)
+            params.append((k, v))
+        return q, int(pagenum), int(pagelen), tuple(params)
+
+    def generation(self):
+        """Returns a value that changes whenever the index changes in a way
+        that might affect query results (eg when updates are
+        committed). Used to invalidate the query result cache.
+
+        The default implementation returns None, meaning that the
+        generation can't be determined and query results aren't
+        cached.
+        """
+        return None
+
     # subclasses can override fieldmapping, and have
     # to_native_field/from_native_field work on their overridden
     # fieldmapping
@@ -225,6 +334,90 @@ class FulltextIndex(object):
         raise errors.SchemaMappingError("Native field %s cannot be mapped" % fieldobject)
 
 
+class FulltextSpool(object):
+
+    """Stores updates to a fulltext index in files in a spool directory,
+    so that they can later be added to the index in one large batch
+    by :py:meth:`replay`. Each process uses its own file, so any
+    number of processes can write to the same spool directory.
+
+    This class implements the parts of the
+    :py:class:`~ferenda.FulltextIndex` API needed for updating.
+
+    :param directory: The path to the spool directory
+    :type  directory: str
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._pending = []
+
+    def update(self, uri, repo, basefile, text, **kwargs):
+        """Add a resource to the spool. See
+        :py:meth:`ferenda.FulltextIndex.update`."""
+        kwargs.update({'uri': uri,
+                       'repo': repo,
+                       'basefile': basefile,
+                       'text': text})
+        self._pending.append(kwargs)
+
+    def commit(self):
+        """Write all pending resources to this process' spool file."""
+        if not self._pending:
+            return
+        filename = "%s-%s.pickle" % (socket.gethostname(), os.getpid())
+        with open(os.path.join(self.directory, filename), "ab") as fp:
+            for kwargs in self._pending:
+                pickle.dump(kwargs, fp, protocol=2)
+        self._pending = []
+
+    def close(self):
+        self.commit()
+
+    def replay(self, index):
+        """Update *index* with all resources in the spool directory, in batch
+        mode, and then remove the spool files.
+
+        :param index: The index to update
+        :type  index: ferenda.FulltextIndex
+        :returns: The number of updated resources
+        :rtype: int
+        """
+        count = 0
+        # oldest first, so that if a resource occurs in more than one
+        # spool file (from an earlier interrupted run) the latest
+        # version wins.
+        filenames = sorted([os.path.join(self.directory, f)
+                            for f in os.listdir(self.directory)],
+                           key=os.path.getmtime)
+        index.start_batch()
+        try:
+            for filename in filenames:
+                with open(filename, "rb") as fp:
+                    while True:
+                        try:
+                            kwargs = pickle.load(fp)
+                        except EOFError:
+                            break
+                        except Exception as e:
+                            # probably the last, truncated, entry of a
+                            # process that was killed while writing
+                            logging.getLogger("ferenda.fulltextindex").warning(
+                                "%s: Couldn't read spooled resource: %s" % (filename, e))
+                            break
+                        index.update(**kwargs)
+                        index.commit()
+                        count += 1
+        finally:
+            # always leave batch mode, so that the index isn't left
+            # with eg. refreshing turned off. The spool files are
+            # kept if replaying failed.
+            index.end_batch()
+        for filename in filenames:
+            os.unlink(filename)
+        return count
+
+
 class IndexedType(object):
 
     """Base class for a fulltext searchengine-independent representation
@@ -402,6 +595,10 @@ class WhooshIndex(FulltextIndex):
 
     def __init__(self, location, repos):
         self._writer = None
+        self._schema = None
+        self._searchers = util.PerThread(lambda: self.index.searcher(),
+                                         close=lambda s: s.close(),
+                                         refresh=lambda s: s.refresh())
         super(WhooshIndex, self).__init__(location, repos)
         self._multiple = {}
         # Initialize self._multiple so that we know which fields may
@@ -433,6 +630,7 @@ class WhooshIndex(FulltextIndex):
         return whoosh.index.create_in(self.location, schema)
 
     def destroy(self):
+        self._close_searchers()
         shutil.rmtree(self.location)
 
     def schema(self):
@@ -445,7 +643,9 @@ class WhooshIndex(FulltextIndex):
         if not self._writer:
             self._writer = self.index.writer()
 
-        s = self.schema()
+        if self._schema is None:
+            self._schema = self.schema()
+        s = self._schema
         for key in kwargs:
             # special-handling of the Resource type -- this is provided as
             # a dict with 'iri' and 'label' keys, and we flatten it to a
@@ -473,22 +673,53 @@ class WhooshIndex(FulltextIndex):
                                      basefile=basefile,
                                      text=text,
                                      **kwargs)
+        self._batch_add(len(text))
 
     def commit(self):
-        if self._writer:
-            self._writer.commit()
+        if self._writer and self._batch_full():
+            if self._batch is not None:
+                # don't merge segments while in batch mode, leave that
+                # to optimize()
+                self._writer.commit(merge=False)
+                self._batch = [0, 0]
+            else:
+                self._writer.commit()
             if not isinstance(self._writer, whoosh.writing.BufferedWriter):
                 # A bufferedWriter can be used again after commit(), a regular writer cannot
                 self._writer = None
 
+    def optimize(self):
+        if self._writer:
+            self._writer.commit(optimize=True)
+            self._writer = None
+        else:
+            self.index.optimize()
+        if self._batch is not None:
+            self._batch = [0, 0]
+
     def close(self):
-        self.commit()
+        self.end_batch()
+        self._close_searchers()
         self.index.close()
 
     def doccount(self):
         return self.index.doc_count()
 
-    def query(self, q=None, pagenum=1, pagelen=10, **kwargs):
+    def searcher(self):
+        """Returns a searcher for the current thread. Searchers are kept
+        between queries and only reopened (re-using unchanged segments)
+        when the index has changed. A searcher is closed when its
+        thread finishes, and after a fork, the new process opens its
+        own searchers."""
+        return self._searchers.get()
+
+    def _close_searchers(self):
+        self._searchers.close_all()
+
+    def generation(self):
+        return self.index.latest_generation()
+
+    def _query(self, q=None, pagenum=1, pagelen=10, **kwargs):
         # 1: Filter on all specified fields (exact or by using ranges)
         filter = []
         for k, v in kwargs.items():
@@ -542,14 +773,13 @@ class WhooshIndex(FulltextIndex):
             query = freetext
         else:
             raise ValueError("Neither q or kwargs specified")
-        with self.index.searcher() as searcher:
-            page = searcher.search_page(query, pagenum, pagelen)
-            res = self._convert_result(page)
-            pager = {'pagenum': pagenum,
-                     'pagecount': page.pagecount,
-                     'firstresult': page.offset + 1,
-                     'lastresult': page.offset + page.pagelen,
-                     'totalresults': page.total}
+        page = self.searcher().search_page(query, pagenum, pagelen)
+        res = self._convert_result(page)
+        pager = {'pagenum': pagenum,
+                 'pagecount': page.pagecount,
+                 'firstresult': page.offset + 1,
+                 'lastresult': page.offset + page.pagelen,
+                 'totalresults': page.total}
         return res, pager
 
     def _convert_result(self, res):
@@ -561,10 +791,22 @@ class WhooshIndex(FulltextIndex):
         for key, fldobj in self.schema().items():
             if isinstance(fldobj, Resource):
                 resourcefields.append(key)
+        # The terms to highlight are the same for every hit on the
+        # page, so find them once instead of once per hit (which is
+        # what Highlighter.highlight_hit does)
+        words = None
+        if len(res) and not hl.can_load_chars(res.results, "text"):
+            from_bytes = res.results.searcher.schema["text"].from_bytes
+            words = frozenset(
+                from_bytes(term[1]) for term in
+                res.results.query_terms(expand=True, fieldname="text"))
 
         for hit in res:
             fields = hit.fields()
-            highlighted = hl.highlight_hit(hit, "text", fields['text'])
+            if words is None:
+                highlighted = hl.highlight_hit(hit, "text", fields['text'])
+            else:
+                highlighted = self._highlight(hl, hit, fields['text'], words)
             if highlighted:
                 fields['text'] = highlighted
             else:
@@ -585,6 +827,20 @@ class WhooshIndex(FulltextIndex):
             l.append(fields)
         return l
 
+    def _highlight(self, hl, hit, text, words, top=3, minscore=1):
+        # Equivalent to hl.highlight_hit(hit, "text", text) when the
+        # text field is re-tokenized, but with the query terms
+        # supplied by the caller.
+        analyzer = hit.searcher.schema["text"].analyzer
+        tokens = analyzer(text, positions=True, chars=True, mode="index",
+                          removestops=False)
+        tokens = whoosh.highlight.set_matched_filter(tokens, words)
+        tokens = hl._merge_matched_tokens(tokens)
+        fragments = hl.fragmenter.fragment_tokens(text, tokens)
+        fragments = whoosh.highlight.top_fragments(fragments, top, hl.scorer,
+                                                   hl.order, minscore=minscore)
+        return hl.formatter.format(fragments)
+
 # Base class for a HTTP-based API (eg. ElasticSearch) the base class
 # delegate the formulation of queries, updates etc to concrete
 # subclasses, expected to return a formattted query/payload etc, and
@@ -635,7 +891,7 @@ class RemoteIndex(FulltextIndex):
             res = requests.get(self.location + relurl)
         return self._decode_count_result(res)
 
-    def query(self, q=None, pagenum=1, pagelen=10, **kwargs):
+    def _query(self, q=None, pagenum=1, pagelen=10, **kwargs):
         relurl, payload = self._query_payload(q, pagenum, pagelen, **kwargs)
         if payload:
             # print("query: POST %s:\n%s" % (self.location + relurl, payload))
@@ -704,32 +960,107 @@ class ElasticSearchIndex(RemoteIndex):
         super(ElasticSearchIndex, self).__init__(location, repos)
 
     def close(self):
-        return self.commit()
+        return self.end_batch()
 
     def commit(self):
         if not self._writer:
             return  # no pending changes to commit
+        if not self._batch_full():
+            return
+        self._bulk()
+        # make sure everything is really comitted (available for
+        # search) before continuing. In batch mode, this is done once
+        # by end_batch instead.
+        if self._batch is None:
+            self._refresh()
+
+    def start_batch(self):
+        super(ElasticSearchIndex, self).start_batch()
+        # Refreshing makes new documents searchable, but creates a new
+        # segment each time. Turn off periodic refreshing until
+        # end_batch.
+        self._refresh_interval = self._get_refresh_interval()
+        self._set_refresh_interval("-1")
+
+    def end_batch(self):
+        if self._batch is None:
+            return self.commit()
+        try:
+            if self._writer:
+                self._bulk()
+        finally:
+            # restore periodic refreshing even if indexing failed. If
+            # no interval was set, null resets it to the default.
+            self._batch = None
+            self._set_refresh_interval(self._refresh_interval)
+        self._refresh()
+
+    def _bulk(self):
         self._writer.seek(0)
-        res = requests.put(self.location + "/_bulk", data=self._writer)
+        res = requests.put(self.location + "_bulk", data=self._writer)
         self._writer.close()
         self._writer = None
+        if self._batch is not None:
+            self._batch = [0, 0]
         try:
             res.raise_for_status()
         except requests.exceptions.HTTPError as e:
             raise errors.IndexingError(str(e) + ": '%s'" % res.text)
         # if the errors field is set to True, errors might have
-        # occurred even though the status code was 200
-        if res.json().get("errors"):
-            raise errors.IndexingError("%s errors when committing, first was %r" %
-                                       (len(res.json()["items"]),
-                                        res.json()["items"][0]))
-        # make sure everything is really comitted (available for
-        # search) before continuing? TODO: Check if this slows
-        # multi-basefile (and multi-threaded) indexing down noticably,
-        # we could just do it at the end of relate_all_teardown.
+        # occurred for some documents even though the status code was
+        # 200
+        result = res.json()
+        if result.get("errors"):
+            failed = []
+            for item in result["items"]:
+                # each item is eg {"index": {"_id": ..., "error": ...}}
+                for action, status in item.items():
+                    if status.get("error"):
+                        failed.append(status)
+                        self.log.error("%s/%s: Indexing failed (%s): %s" %
+                                       (status.get("_type"), status.get("_id"),
+                                        status.get("status"), status["error"]))
+            if self._batch is None:
+                raise errors.IndexingError("%s of %s resources failed when committing, first was %r" %
+                                           (len(failed), len(result["items"]),
+                                            failed[0] if failed else None))
+
+    def _refresh(self):
         r = requests.post(self.location + "_refresh")
         r.raise_for_status()
 
+    def generation(self):
+        # The number of indexing and delete operations together with
+        # the number of refreshes changes whenever new changes become
+        # searchable.
+        try:
+            res = requests.get(self.location + "_stats/indexing,refresh")
+            if res.status_code != 200:
+                return None
+            stats = res.json()["_all"]["primaries"]
+            return (stats["indexing"]["index_total"],
+                    stats["indexing"]["delete_total"],
+                    stats["refresh"]["total"])
+        except (requests.exceptions.RequestException, ValueError,
+                KeyError, TypeError):
+            return None
+
+    def _get_refresh_interval(self):
+        res = requests.get(self.location + "_settings")
+        if res.status_code != 200:
+            return None
+        # the response is keyed on the actual index name
+        for settings in res.json().values():
+            return settings["settings"]["index"].get("refresh_interval")
+
+    def _set_refresh_interval(self, interval):
+        res = requests.put(self.location + "_settings",
+                           json.dumps({"index": {"refresh_interval": interval}}))
+        try:
+            res.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            raise errors.IndexingError(str(e) + ": '%s'" % res.text)
+
     def exists(self):
         r = requests.get(self.location + "_mapping/")
         if r.status_code == 404:
@@ -768,9 +1099,12 @@ class ElasticSearchIndex(RemoteIndex):
             metadata["index"]['parent'] = basefile
         metadata = json.dumps(metadata) + "\n"
         assert "\n" not in payload, "payload contains newlines, must be encoded for bulk API"
-        self._writer.write(metadata.encode("utf-8"))
-        self._writer.write(payload.encode("utf-8"))
+        metadata = metadata.encode("utf-8")
+        payload = payload.encode("utf-8")
+        self._writer.write(metadata)
+        self._writer.write(payload)
         self._writer.write(b"\n")
+        self._batch_add(len(metadata) + len(payload) + 1)
 
     def _query_payload(self, q, pagenum=1, pagelen=10, **kwargs):
         if kwargs.get("repo"):
@@ -72,6 +72,7 @@ DEFAULT_CONFIG = {'loglevel': 'DEBUG',
                   'force': False,
                   'downloadmax': nativeint,
                   'combineresources': False,
+                  'fingerprintresources': False,
                   'staticsite': False,
                   'all': False,
                   'relate': True,
@@ -301,6 +302,25 @@ def make_wsgi_app(inifile=None, **kwargs):
     return cls(repos, **args)
 
 
+def make_asgi_app(inifile=None, **kwargs):
+    """Creates a callable object that can act as an ASGI application by
+    uvicorn, hypercorn, daphne or any other ASGI-compliant webserver.
+    The ASGI app wraps the WSGI app created by :py:func:`make_wsgi_app`
+    (see :py:class:`~ferenda.asgiapp.ASGIApp`). Requires Python 3.5 or
+    newer.
+
+    :param inifile: The full path to a ``ferenda.ini`` configuration file
+    :type inifile: str
+    :param \*\*kwargs: Configuration values for the wsgi app, see
+                         :py:func:`make_wsgi_app`.
+    :returns: An ASGI application
+    :rtype: callable
+
+    """
+    from ferenda.asgiapp import ASGIApp
+    return ASGIApp(make_wsgi_app(inifile, **kwargs))
+
+
 loglevels = {'DEBUG': logging.DEBUG,
              'INFO': logging.INFO,
              'WARNING': logging.WARNING,
@@ -774,6 +794,8 @@ def _setup_makeresources_args(config):
     """
     return {'resourcedir': config.datadir + os.sep + 'rsrc',
             'combine':     config.combineresources,
+            'fingerprintresources': config.fingerprintresources,
+            'force':       config.force,
             'staticsite':  config.staticsite,
             'cssfiles':    config.cssfiles,
             'jsfiles':     config.jsfiles,
@@ -1297,6 +1319,10 @@ def _shutdown_buildserver():
 def _parallelizejobs(iterable, inst, classname, command, config, argv):
     jobqueue = multiprocessing.Queue()
     resultqueue = multiprocessing.Queue()
+    # load the commonly used graphs before starting the worker
+    # processes, so that (where processes are forked) the workers
+    # inherit them instead of loading them again
+    inst.commondata
     procs = _start_multiprocessing(jobqueue, resultqueue, inst.config.processes, None)
     try:
         basefiles = __queue_jobs_nomanager(jobqueue, iterable, inst, classname, command)
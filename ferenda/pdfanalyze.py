@@ -14,6 +14,12 @@ from math import floor, ceil
 
 # 3rd party
 from cached_property import cached_property
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    # means numpy isn't installed -- which is OK, the counters will
+    # be calculated in pure python
+    numpy = None
 
 # mine
 from .pdfreader import Page
@@ -73,6 +79,16 @@ class PDFAnalyzer(object):
 
     """
 
+    vectorized = True
+    """Whether to calculate the margin and style counters using NumPy
+    (if installed). The vectorized counters are identical to the ones
+    calculated by the pure python methods, but are much faster for
+    large documents. Vectorization is automatically disabled for
+    subclasses that override any of the ``count_*_textbox`` or
+    ``setup_*_counters`` methods.
+
+    """
+
     def __init__(self, pdf):
         # FIXME: in time, we'd like to make it possible to specify
         # multiple pdf files (either because a single logical document
@@ -201,6 +217,8 @@ class PDFAnalyzer(object):
         The set of counters is determined by setup_horizontal_counters.
         """
 
+        if self.use_vectorized():
+            return self.vectorized_horizontal_counters(startpage, pagecount)
         counters = self.setup_horizontal_counters()
         for pagenumber, textbox in self.textboxes(startpage, pagecount):
             self.count_horizontal_textbox(pagenumber, textbox, counters)
@@ -228,6 +246,8 @@ class PDFAnalyzer(object):
             counters['rightmargin'][textbox.right] += 1
 
     def count_vertical_margins(self, startpage, pagecount):
+        if self.use_vectorized():
+            return self.vectorized_vertical_counters(startpage, pagecount)
         counters = self.setup_vertical_counters()
         for pagenumber, textbox in self.textboxes(startpage, pagecount):
             self.count_vertical_textbox(pagenumber, textbox, counters)
@@ -247,6 +267,8 @@ class PDFAnalyzer(object):
         counters['bottommargin'][textbox.bottom] += len(text)
 
     def count_styles(self, startpage, pagecount):
+        if self.use_vectorized():
+            return self.vectorized_style_counter(startpage, pagecount)
         c = Counter()
         for pagenumber, textbox in self.textboxes(startpage, pagecount):
             self.count_styles_textbox(pagenumber, textbox, c)
@@ -257,6 +279,134 @@ class PDFAnalyzer(object):
         fonttuple = (textbox.font.family, textbox.font.size)
         counter[fonttuple] += len(text)
 
+    # the per-textbox hooks that the vectorized counters replace. If
+    # any of these are overridden, we must use the pure python path.
+    _vectorized_hooks = ('textboxes',
+                         'setup_horizontal_counters',
+                         'count_horizontal_textbox',
+                         'setup_vertical_counters',
+                         'count_vertical_textbox',
+                         'count_styles_textbox')
+
+    def use_vectorized(self):
+        """Return True iff the margin and style counters should be
+        calculated with NumPy."""
+        if not (self.vectorized and numpy is not None):
+            return False
+        for hook in self._vectorized_hooks:
+            if getattr(type(self), hook) != getattr(PDFAnalyzer, hook):
+                return False
+        return self._boxdata is not None
+
+    @cached_property
+    def _boxdata(self):
+        # Collect the geometry, text length and font of every textbox in
+        # the document into arrays. This is the only pass over the
+        # textboxes -- all counters for all page ranges are then
+        # calculated from these arrays.
+        pagenumbers, pagewidths, pageheights, offsets = [], [], [], [0]
+        boxpages, lefts, rights, tops, bottoms, textlens, fontids = (
+            [], [], [], [], [], [], [])
+        fonts = {}
+        for page in self.pdf:
+            pagenumbers.append(page.number)
+            pagewidths.append(page.width)
+            pageheights.append(page.height)
+            for textbox in page:
+                boxpages.append(page.number)
+                lefts.append(textbox.left)
+                rights.append(textbox.right)
+                tops.append(textbox.top)
+                bottoms.append(textbox.bottom)
+                textlens.append(len(str(textbox).strip()))
+                fonttuple = (textbox.font.family, textbox.font.size)
+                fontids.append(fonts.setdefault(fonttuple, len(fonts)))
+            offsets.append(len(lefts))
+        data = {'pagenumber': pagenumbers,
+                'pagewidth': pagewidths,
+                'pageheight': pageheights,
+                'offsets': offsets,
+                'boxpage': boxpages,
+                'left': lefts,
+                'right': rights,
+                'top': tops,
+                'bottom': bottoms,
+                'textlen': textlens,
+                'fontid': fontids}
+        for key, values in data.items():
+            # np.array([]) yields a float array, so be explicit
+            data[key] = numpy.array(values, dtype=None if values else int)
+            if data[key].dtype.kind not in "iu":
+                # non-integral geometry would be converted to floats,
+                # which would change the keys of the counters (and
+                # the JSON metrics). Use the pure python path instead.
+                return None
+        data['fonts'] = sorted(fonts, key=fonts.get)
+        return data
+
+    def _pagerange(self, startpage, pagecount):
+        # returns the page and textbox slices corresponding to
+        # self.pdf[startpage:startpage + pagecount]
+        pages = range(len(self.pdf))[startpage:startpage + pagecount]
+        if not len(pages):
+            return slice(0, 0), slice(0, 0)
+        offsets = self._boxdata['offsets']
+        return (slice(pages[0], pages[-1] + 1),
+                slice(offsets[pages[0]], offsets[pages[-1] + 1]))
+
+    def _counter(self, keys, weights=None):
+        # Creates a Counter with the same keys, values and (since
+        # most_common() breaks ties by insertion order) key order as
+        # the pure python counting would produce.
+        c = Counter()
+        if not len(keys):
+            return c
+        uniq, first, inverse = numpy.unique(keys, return_index=True,
+                                            return_inverse=True)
+        counts = numpy.bincount(inverse.ravel(), weights=weights,
+                                minlength=len(uniq)).astype(numpy.int64)
+        order = numpy.argsort(first, kind="mergesort")
+        for key, count in zip(uniq[order].tolist(), counts[order].tolist()):
+            c[key] = count
+        return c
+
+    def vectorized_horizontal_counters(self, startpage, pagecount):
+        """Vectorized version of :py:meth:`count_horizontal_margins`."""
+        d = self._boxdata
+        pages, boxes = self._pagerange(startpage, pagecount)
+        left, right = d['left'][boxes], d['right'][boxes]
+        if self.twopage:
+            even = d['boxpage'][boxes] % 2 == 0
+            odd = ~even
+        else:
+            odd = slice(None)
+        counters = {'leftmargin': self._counter(left[odd]),
+                    'rightmargin': self._counter(right[odd]),
+                    'pagewidth': self._counter(d['pagewidth'][pages])}
+        if self.twopage:
+            counters['leftmargin_even'] = self._counter(left[even])
+            counters['rightmargin_even'] = self._counter(right[even])
+        return counters
+
+    def vectorized_vertical_counters(self, startpage, pagecount):
+        """Vectorized version of :py:meth:`count_vertical_margins`."""
+        d = self._boxdata
+        pages, boxes = self._pagerange(startpage, pagecount)
+        textlen = d['textlen'][boxes]
+        return {'topmargin': self._counter(d['top'][boxes], textlen),
+                'bottommargin': self._counter(d['bottom'][boxes], textlen),
+                'pageheight': self._counter(d['pageheight'][pages])}
+
+    def vectorized_style_counter(self, startpage, pagecount):
+        """Vectorized version of :py:meth:`count_styles`."""
+        d = self._boxdata
+        pages, boxes = self._pagerange(startpage, pagecount)
+        c = Counter()
+        for fontid, count in self._counter(d['fontid'][boxes],
+                                           d['textlen'][boxes]).items():
+            c[d['fonts'][fontid]] = count
+        return c
+
     def analyze_vertical_margins(self, vcounters):
         # now find probable header and footer zones. default algorithm:
         # max 0.2 % of text content can be in the header/footer zone. (on
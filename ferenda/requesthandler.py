@@ -6,6 +6,7 @@
 from wsgiref.util import request_uri
 import re
 import os
+import tempfile
 from io import BytesIO
 from functools import partial
 from urllib.parse import urlparse, unquote, parse_qsl
@@ -31,6 +32,7 @@ class RequestHandler(object):
                     'ttl': 'turtle',
                     'nt': 'nt',
                     'json': 'json-ld'}
+    _revsuffixes = dict([(v, k) for k, v in _rdfsuffixes.items()])
     _mimemap = {'text/html': 'generated_path',
                 'application/xhtml+xml': 'parsed_path',
                 'application/rdf+xml': 'distilled_path'}
@@ -99,6 +101,29 @@ class RequestHandler(object):
     def supports_uri(self, uri):
         return self.supports({'PATH_INFO': urlparse(uri).path})
 
+    def routes(self):
+        """Returns the URL space(s) that this handler claims, as a list
+        of routes. A route is either a string, which claims all paths
+        that start with it, or a compiled regex, which claims all paths
+        that it matches (from the start of the path).
+
+        :py:class:`~ferenda.WSGIApp` compiles the routes of all repos
+        into a single route table at startup, and only calls
+        :py:meth:`handle` for repos whose routes match. A subclass that
+        overrides :py:meth:`supports` should override this method so
+        that the two agree -- if it doesn't,
+        :py:meth:`supports` is called for every request instead.
+
+        """
+        return [self._alias_route()]
+
+    def _alias_route(self, firstsegment="[^/]*"):
+        # the regex equivalent of the default supports() check: the
+        # second path segment, sans any suffix or parameters, must be
+        # equal to the repo alias
+        return re.compile("/%s/%s(?:[.?][^/.?]*)?(?:/|$)" %
+                          (firstsegment, re.escape(self.repo.alias)))
+
     def path(self, uri):
         """Returns the physical path that the provided URI respolves
         to. Returns None if this requesthandler does not support the
@@ -336,25 +361,57 @@ class RequestHandler(object):
             if basefile.endswith("/data"):
                 extended = True
                 basefile = basefile[:-5]
-            if contenttype in self._rdfformats or suffix in self._rdfsuffixes:
-                g = Graph()
-                g.parse(self.repo.store.distilled_path(basefile))
-                if extended:
-                    annotation_graph = self.repo.annotation_file_to_graph(
-                        self.repo.store.annotation_path(basefile))
-                    g += annotation_graph
-                path = None
             if contenttype in self._rdfformats:
-                data = g.serialize(format=self._rdfformats[contenttype])
+                format = self._rdfformats[contenttype]
             elif suffix in self._rdfsuffixes:
-                data = g.serialize(format=rdfsuffixes[suffix])
+                format = self._rdfsuffixes[suffix]
             else:
-                data = None
-        path = None
-        if pathfunc:
-            path = pathfunc(basefile)
-            data = None
-        return path, data
+                return None, None
+            try:
+                return self.serialized_path(basefile, format, extended), None
+            except (IOError, OSError):
+                # eg. a read-only datadir -- serialize the statements
+                # for this request only
+                g = self._serialized_graph(basefile, extended)
+                return None, g.serialize(format=format)
+        return pathfunc(basefile), None
+
+    def serialized_path(self, basefile, format, extended=False):
+        """Returns the path to a file containing the distilled RDF
+        statements for *basefile* (and, if *extended*, the statements
+        from its annotation file) serialized in *format*. The file is
+        created the first time it's needed, and re-created whenever the
+        distilled (or annotation) file changes.
+
+        """
+        sources = [self.repo.store.distilled_path(basefile)]
+        suffix = "." + self._revsuffixes[format]
+        if extended:
+            sources.append(self.repo.store.annotation_path(basefile))
+            suffix = "-data" + suffix
+        path = self.repo.store.path(basefile, "serialized", suffix)
+        if not util.outfile_is_newer(sources, path):
+            g = self._serialized_graph(basefile, extended)
+            util.ensure_dir(path)
+            # concurrent requests for the same resource must not
+            # write to the same temporary file
+            fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    g.serialize(fp, format=format)
+                util.robust_rename(tmppath, path)
+            except Exception:
+                util.robust_remove(tmppath)
+                raise
+        return path
+
+    def _serialized_graph(self, basefile, extended):
+        g = Graph()
+        g.parse(self.repo.store.distilled_path(basefile))
+        if extended:
+            g += self.repo.annotation_file_to_graph(
+                self.repo.store.annotation_path(basefile))
+        return g
 
     def lookup_dataset(self, environ, params, contenttype, suffix):
         # FIXME: This should also make use of pathfunc
@@ -377,17 +434,36 @@ class RequestHandler(object):
         elif contenttype == "text/plain" or suffix == "nt":
             path = self.repo.store.resourcepath("distilled/dump.nt")
         elif contenttype in self._rdfformats or suffix in self._rdfsuffixes:
-            g = Graph()
-            g.parse(self.repo.store.resourcepath("distilled/dump.nt"),
-                    format="nt")
             if contenttype in self._rdfformats:
                 format = self._rdfformats[contenttype]
             else:
                 format = self._rdfsuffixes[suffix]
-            data = g.serialize(format=format)
+            # relate_all_teardown normally serializes the dump in all
+            # formats, so that we only need to stream it
+            dumppath = self.repo.store.resourcepath("distilled/dump.nt")
+            path = self.repo.store.resourcepath(
+                "distilled/dump." + self._revsuffixes[format])
+            if not util.outfile_is_newer([dumppath], path):
+                path = None
+                g = Graph()
+                g.parse(dumppath, format="nt")
+                data = g.serialize(format=format)
         return path, data
 
 
+    def etag(self, path):
+        """Returns a strong HTTP entity tag for the file at *path*, which
+        this handler is about to serve. The default implementation
+        uses the size and modification time of the file."""
+        return util.file_etag(path)
+
+    def cache_control(self, contenttype):
+        """Returns the value of the ``Cache-Control`` header to send for
+        a file of the given *contenttype*, or None. See
+        :ref:`configuration` for the format of the ``cachecontrol``
+        option, which can be set for each repo."""
+        return util.cache_control(self.repo.config.cachecontrol, contenttype)
+
     def prep_request(self, environ, path, data, contenttype):
         if path and os.path.exists(path):
             fp = open(path, 'rb')
@@ -4,10 +4,17 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 from io import BytesIO
+import hashlib
 import inspect
 import json
 import logging
 import os
+import threading
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # pragma: no cover
+    # py2 without the futures backport -- run everything serially
+    ThreadPoolExecutor = None
 
 from lxml import etree
 from lxml.builder import ElementMaker
@@ -23,6 +30,14 @@ from ferenda import util, errors
 class Resources(object):
 
     """Creates and manages various assets/resources needed for web serving.
+
+    The result of each step is recorded (as a md5 digest of its inputs)
+    in ``manifest.json`` in the resource directory, so that
+    :py:meth:`make` can skip outputs whose inputs haven't changed since
+    the last run (unless the ``force`` option is set). If the
+    ``fingerprintresources`` option is set, the digest is also made part
+    of the name of each css and js file, so that these can be served
+    with far-future cache headers.
     """
 
     def __init__(self, repos, resourcedir, **kwargs):
@@ -49,6 +64,8 @@ class Resources(object):
                 if p not in loadpath:
                     loadpath.append(p)
         self.resourceloader = ResourceLoader(*loadpath)
+        self._manifest = None
+        self._manifestlock = threading.Lock()
 
     def make(self,
              css=True,
@@ -59,16 +76,26 @@ class Resources(object):
         res = {}
         if api is None:
             api = not self.config.staticsite
-        if css:
-            res['css'] = self.make_css()
-        if js:
-            res['js'] = self.make_js()
-        if img:
-            res['img'] = self.make_img()
+        # the css, js, img and api steps are independent of each other
+        # (and mostly wait for file IO or, for SFS, external
+        # processes), so they're run concurrently. resources.xml
+        # needs the result of the css and js steps.
+        jobs = [(part, func) for (part, func, enabled) in
+                (('css', self.make_css, css),
+                 ('js', self.make_js, js),
+                 ('img', self.make_img, img),
+                 ('json', self.make_api_files, api)) if enabled]
+        if ThreadPoolExecutor and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                futures = [(part, executor.submit(func)) for (part, func) in jobs]
+                for part, future in futures:
+                    res[part] = future.result()
+        else:
+            for part, func in jobs:
+                res[part] = func()
         if xml:
             res['xml'] = self.make_resources_xml(res.get('css', []), res.get('js', []))
-        if api:
-            res['json'] = self.make_api_files()
+        self.save_manifest()
 
         # finally, normalize paths according to os.path.sep
         # conventions
@@ -89,7 +116,8 @@ class Resources(object):
         if self.config.combineresources:
             combinefile = os.sep.join([self.resourcedir, 'css', 'combined.css'])
         return self._make_files(
-            'cssfiles', self.resourcedir + os.sep + 'css', combinefile, cssmin.cssmin)
+            'cssfiles', self.resourcedir + os.sep + 'css', combinefile, cssmin.cssmin,
+            fingerprint=self.config.fingerprintresources)
 
     def make_js(self):
         # slimit provides better perf, but isn't py3 compatible
@@ -101,9 +129,12 @@ class Resources(object):
         if self.config.combineresources:
             combinefile = os.sep.join([self.resourcedir, 'js', 'combined.js'])
         return self._make_files(
-            'jsfiles', self.resourcedir + os.sep + 'js', combinefile, jsmin.jsmin)
+            'jsfiles', self.resourcedir + os.sep + 'js', combinefile, jsmin.jsmin,
+            fingerprint=self.config.fingerprintresources)
 
     def make_img(self):
+        # images are referenced by name from css files and XSLT
+        # templates, so they're never fingerprinted
         return self._make_files('imgfiles', self.resourcedir + os.sep + 'img')
 
     def make_resources_xml(self, cssfiles, jsfiles):
@@ -126,13 +157,15 @@ class Resources(object):
             )
 
         outfile = self.resourcedir + os.sep + "resources.xml"
-        util.writefile(
-            outfile,
-            etree.tostring(
-                root,
-                encoding="utf-8",
-                pretty_print=True).decode("utf-8"))
-        self.log.info("Wrote %s" % outfile)
+        data = etree.tostring(root, encoding="utf-8", pretty_print=True)
+        # all generated files depend on resources.xml, so don't touch
+        # it unless it actually changes
+        if (not self.config.force and os.path.exists(outfile) and
+                util.readfile(outfile, "rb") == data):
+            self.log.debug("%s is unchanged" % outfile)
+        else:
+            util.writefile(outfile, data.decode("utf-8"))
+            self.log.info("Wrote %s" % outfile)
         return [self._filepath_to_urlpath(outfile, 1)]
 
     # FIXME: When creating <script> elements, must take care not to
@@ -181,7 +214,8 @@ class Resources(object):
             elements.append(li)
         return elements
 
-    def _make_files(self, option, filedir, combinefile=None, combinefunc=None):
+    def _make_files(self, option, filedir, combinefile=None, combinefunc=None,
+                    fingerprint=False):
         urls = []
         buf = BytesIO()
         processed = set()
@@ -191,7 +225,8 @@ class Resources(object):
                                           # creating the Resources
                                           # object
             for f in getattr(self.config, option):
-                urls.append(self._process_file(f, buf, filedir, "ferenda.ini"))
+                urls.append(self._process_file(f, buf, filedir, "ferenda.ini",
+                                               fingerprint))
                 processed.add(f)
         for repo in self.repos:
             # FIXME: create a more generic way of optionally
@@ -203,21 +238,33 @@ class Resources(object):
             for f in getattr(repo.config, option):
                 if f in processed:
                     continue
-                urls.append(self._process_file(f, buf, filedir, repo.alias))
+                urls.append(self._process_file(f, buf, filedir, repo.alias,
+                                               fingerprint))
                 processed.add(f)
         urls = list(filter(None, urls))
         if combinefile:
-            txt = buf.getvalue().decode('utf-8')
-            util.writefile(combinefile, combinefunc(txt))
+            # the combined file only needs to be re-minified if the
+            # concatenation of its inputs has changed
+            data = buf.getvalue()
+            digest = hashlib.md5(data).hexdigest()
+            if fingerprint:
+                combinefile = self._fingerprinted(combinefile, digest)
+            if self.is_uptodate(combinefile, digest):
+                self.log.debug("%s is up to date" % combinefile)
+            else:
+                util.writefile(combinefile, combinefunc(data.decode('utf-8')))
+                self.record(combinefile, digest)
+                self.log.info("Wrote %s" % combinefile)
             return [self._filepath_to_urlpath(combinefile, 2)]
         else:
             return urls
 
-    def _process_file(self, filename, buf, destdir, origin=""):
+    def _process_file(self, filename, buf, destdir, origin="", fingerprint=False):
         """
         Helper function to concatenate or copy CSS/JS (optionally
         processing them with e.g. Scss) or other files to correct place
-        under the web root directory.
+        under the web root directory. Files that are unchanged since
+        the last time they were copied aren't copied again.
 
         :param filename: The name (relative to the ferenda package) of the file
         :param buf: A buffer into which the contents of the file is written
@@ -225,6 +272,8 @@ class Resources(object):
         :param destdir: The directory into which the file will be copied
                         (unless combineresources == True)
         :param origin: The source of the configuration that specifies this file
+        :param fingerprint: Whether to include the digest of the file in the
+                            name of the copy
         :returns: The URL path of the resulting file, relative to the web root
                   (or None if combineresources == True)
         :rtype: str
@@ -236,36 +285,93 @@ class Resources(object):
             self.log.debug("Using external url %s" % filename)
             return filename
         try: 
-            fp = self.resourceloader.openfp(filename, binary=True)
+            srcfile = self.resourceloader.filename(filename)
         except errors.ResourceNotFound:
             self.log.warning("file %(filename)s (specified in %(origin)s)"
                              " doesn't exist" % locals())
             return None
 
-        (base, ext) = os.path.splitext(filename)
-
         if self.config.combineresources:
             self.log.debug("combining %s into buffer" % filename)
-            d = fp.read()
-            buf.write(d)
-            fp.close()
+            with open(srcfile, "rb") as fp:
+                buf.write(fp.read())
             return None
         else:
-            # FIXME: don't copy (at least not log) if the outfile
-            # already exists.
-            # self.log.debug("writing %s out to %s" % (filename, destdir))
             outfile = destdir + os.sep + os.path.basename(filename)
             if (os.path.islink(outfile) and
                 os.path.relpath(os.path.join(os.path.dirname(outfile),
-                                             os.readlink(outfile))) == util.name_from_fp(fp)):
-                self.log.warning("%s is a symlink to source file %s, won't overwrite" % (outfile, util.name_from_fp(fp)))
+                                             os.readlink(outfile))) == srcfile):
+                self.log.warning("%s is a symlink to source file %s, won't overwrite" % (outfile, srcfile))
+                return self._filepath_to_urlpath(outfile, 2)
+            digest = util.file_md5(srcfile)
+            if fingerprint:
+                outfile = self._fingerprinted(outfile, digest)
+            if self.is_uptodate(outfile, digest):
+                self.log.debug("%s is up to date" % outfile)
             else:
+                self.log.debug("copying %s to %s" % (srcfile, outfile))
                 util.ensure_dir(outfile)
-                with open(outfile, "wb") as fp2:
+                with open(srcfile, "rb") as fp, open(outfile, "wb") as fp2:
                     fp2.write(fp.read())
-                fp.close()
+                self.record(outfile, digest)
             return self._filepath_to_urlpath(outfile, 2)
 
+    def _fingerprinted(self, filename, digest):
+        # css/main.css -> css/main.0cc175b9.css
+        (base, ext) = os.path.splitext(filename)
+        return "%s.%s%s" % (base, digest[:8], ext)
+
+    def manifest_path(self):
+        """Returns the path of the file that records the input digests of
+        all created files."""
+        return self.resourcedir + os.sep + "manifest.json"
+
+    def _manifestkey(self, filename):
+        return os.path.relpath(filename, self.resourcedir).replace(os.sep, "/")
+
+    def is_uptodate(self, filename, digest):
+        """Returns True iff *filename* exists and was created from inputs
+        with the same *digest* as given, according to the manifest.
+
+        :param filename: The path to a created file
+        :param digest: A digest of all the inputs used to create the file
+        :rtype: bool
+        """
+        if self.config.force or not os.path.exists(filename):
+            return False
+        with self._manifestlock:
+            if self._manifest is None:
+                self._manifest = self._load_manifest()
+            return self._manifest.get(self._manifestkey(filename)) == digest
+
+    def record(self, filename, digest):
+        """Records that *filename* was created from inputs with the given
+        *digest*. The manifest is written by :py:meth:`save_manifest`.
+        """
+        with self._manifestlock:
+            if self._manifest is None:
+                self._manifest = self._load_manifest()
+            self._manifest[self._manifestkey(filename)] = digest
+
+    def _load_manifest(self):
+        path = self.manifest_path()
+        if os.path.exists(path):
+            try:
+                with open(path) as fp:
+                    return json.load(fp)
+            except ValueError as e:
+                self.log.warning("Couldn't read %s: %s" % (path, e))
+        return {}
+
+    def save_manifest(self):
+        """Writes any digests recorded by :py:meth:`record` to the manifest."""
+        with self._manifestlock:
+            if self._manifest is None:
+                return
+            util.writefile(self.manifest_path(),
+                           json.dumps(self._manifest, indent=4,
+                                      separators=(', ', ': '), sort_keys=True))
+
     def make_api_files(self):
         # this should create the following files under resourcedir
         # api/context.json (aliased to /json-ld/context.json if legacyapi)
@@ -284,33 +390,46 @@ class Resources(object):
             contextpath = "/rsrc/api/context.json"
             termspath = "/rsrc/api/terms.json"
             commonpath = "/rsrc/api/common.json"
-        util.ensure_dir(context)
-        with open(context, "w") as fp:
-            contextdict = self._get_json_context()
-            s = json.dumps({"@context": contextdict}, separators=(', ', ': '),
-                           indent=4, sort_keys=True)
-            fp.write(s)
-        files.append(self._filepath_to_urlpath(context, 2))
-
         common = os.sep.join([self.resourcedir, "api", "common.json"])
         terms = os.sep.join([self.resourcedir, "api", "terms.json"])
-
-        for (filename, func, urlpath) in ((common, self._get_common_graph, commonpath),
-                                          (terms,  self._get_term_graph,   termspath)):
-            g = func(self.config.url + urlpath[1:])
-            d = json.loads(g.serialize(format="json-ld", context=contextdict,
-                                       indent=4).decode("utf-8"))
-            # d might not contain a @context (if contextdict == {}, ie
-            # no repos are given)
-            if '@context' in d:
-                d['@context'] = contextpath
-            if self.config.legacyapi:
-                d = self._convert_legacy_jsonld(d, self.config.url + urlpath[1:])
-            with open(filename, "w") as fp:
-                s = json.dumps(d, indent=4, separators=(', ', ': '), sort_keys=True)
+        contextdict = self._get_json_context()
+
+        # the API files are created from the context, the vocabularies
+        # and extra data files of all repos, and some config options
+        # -- if none of these have changed, neither have the files.
+        sources = self._term_graph_sources() + self._common_graph_sources()
+        digest = hashlib.md5(json.dumps(
+            {'context': contextdict,
+             'url': self.config.url,
+             'legacyapi': self.config.legacyapi,
+             'sources': [(f, util.file_md5(f)) for f in sources]},
+            sort_keys=True).encode("utf-8")).hexdigest()
+        if all(self.is_uptodate(f, digest) for f in (context, common, terms)):
+            self.log.debug("API files are up to date")
+        else:
+            util.ensure_dir(context)
+            with open(context, "w") as fp:
+                s = json.dumps({"@context": contextdict}, separators=(', ', ': '),
+                               indent=4, sort_keys=True)
                 fp.write(s)
-                
-            files.append(self._filepath_to_urlpath(filename, 2))
+            self.record(context, digest)
+
+            for (filename, func, urlpath) in ((common, self._get_common_graph, commonpath),
+                                              (terms,  self._get_term_graph,   termspath)):
+                g = func(self.config.url + urlpath[1:])
+                d = json.loads(g.serialize(format="json-ld", context=contextdict,
+                                           indent=4).decode("utf-8"))
+                # d might not contain a @context (if contextdict == {}, ie
+                # no repos are given)
+                if '@context' in d:
+                    d['@context'] = contextpath
+                if self.config.legacyapi:
+                    d = self._convert_legacy_jsonld(d, self.config.url + urlpath[1:])
+                with open(filename, "w") as fp:
+                    s = json.dumps(d, indent=4, separators=(', ', ': '), sort_keys=True)
+                    fp.write(s)
+                self.record(filename, digest)
+        files.extend([self._filepath_to_urlpath(f, 2) for f in (context, common, terms)])
 
         if self.config.legacyapi:
             # copy ui explorer app to <url>/rsrc/ui/ -- this does not get
@@ -444,21 +563,13 @@ class Resources(object):
         root = URIRef(graphuri)
         g = Graph()
         g.add((root, RDF.type, FOAF.Document))
-        bigg = Graph()
-        paths = set()
         for repo in self.repos:
             for p, ns in repo.ns.items():
                 if p in ("rdf", "rdfs", "owl"):
                     continue
                 g.bind(p, ns)
-                resourcename = "vocab/%s.ttl" % p
-                if repo.resourceloader.exists(resourcename):
-                    ontopath = repo.resourceloader.filename(resourcename)
-                    if ontopath not in paths:
-                        self.log.debug("Loading vocabulary %s" % ontopath)
-                        with open(ontopath) as onto:
-                            bigg.parse(onto, format="turtle")
-                        paths.add(ontopath)
+        bigg = util.load_graph(self._term_graph_sources(),
+                               cachedir=self._graphcachedir())
 
         g.bind("foaf", "http://xmlns.com/foaf/0.1/")
         for (s, p, o) in bigg:
@@ -471,6 +582,40 @@ class Resources(object):
                 g.add((s, p, o))  # control duplicates somehow
         return g
 
+    def _term_graph_sources(self):
+        # the vocabularies (as turtle files) for all namespaces used
+        # by all repos
+        paths = []
+        for repo in self.repos:
+            for p, ns in repo.ns.items():
+                if p in ("rdf", "rdfs", "owl"):
+                    continue
+                resourcename = "vocab/%s.ttl" % p
+                if repo.resourceloader.exists(resourcename):
+                    ontopath = repo.resourceloader.filename(resourcename)
+                    if ontopath not in paths:
+                        paths.append(ontopath)
+        return paths
+
+    def _common_graph_sources(self):
+        # the extra data files (as turtle files) for all repos and
+        # their superclasses
+        paths = []
+        for repo in self.repos:
+            for cls in inspect.getmro(repo.__class__):
+                if hasattr(cls, "alias"):
+                    resourcename = "extra/%s.ttl" % cls.alias
+                    if repo.resourceloader.exists(resourcename):
+                        commonpath = repo.resourceloader.filename(resourcename)
+                        if commonpath not in paths:
+                            paths.append(commonpath)
+        return paths
+
+    def _graphcachedir(self):
+        # all repos normally share the same datadir
+        if self.repos:
+            return self.repos[0].graphcachedir
+
     def _get_common_graph(self, graphuri):
         # create a graph with foaf:names for all entities (publishers,
         # publication series etc) that our data mentions.
@@ -479,19 +624,8 @@ class Resources(object):
         g.bind("skos", SKOS)
         g.bind("foaf", FOAF)
         g.add((root, RDF.type, FOAF.Document))
-        paths = set()
-        bigg = Graph()
-        for repo in self.repos:
-            for cls in inspect.getmro(repo.__class__):
-                if hasattr(cls, "alias"):
-                    resourcename = "extra/%s.ttl" % cls.alias
-                    if repo.resourceloader.exists(resourcename):
-                        commonpath = repo.resourceloader.filename(resourcename)
-                        if commonpath not in paths:
-                            self.log.debug("loading data %s" % commonpath)
-                            with open(commonpath) as common:
-                                bigg.parse(common, format="turtle")
-                            paths.add(commonpath)
+        bigg = util.load_graph(self._common_graph_sources(),
+                               cachedir=self._graphcachedir())
         for (s, p, o) in bigg:
             if p in (FOAF.name, SKOS.prefLabel,
                      SKOS.altLabel, BIBO.identifier):
@@ -1172,11 +1172,13 @@ class DV(SwedishLegalSource):
 
     # create nice RDF from the sanitized metadata
     def polish_metadata(self, head):
-        parser = SwedishCitationParser(LegalRef(LegalRef.RATTSFALL),
+        parser = SwedishCitationParser(LegalRef(LegalRef.RATTSFALL,
+                                                cachedir=self.legalrefcachedir),
                                        self.minter,
                                        self.commondata)
 
-        lparser = SwedishCitationParser(LegalRef(LegalRef.LAGRUM),
+        lparser = SwedishCitationParser(LegalRef(LegalRef.LAGRUM,
+                                                 cachedir=self.legalrefcachedir),
                                         self.minter,
                                         self.commondata)
 
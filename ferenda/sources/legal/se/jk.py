@@ -101,7 +101,7 @@ class JK(SwedishLegalSource):
         return attribs
 
     def extract_head(self, fp, basefile):
-        return BeautifulSoup(fp.read(), "lxml")
+        return self.parse_source(fp)
 
     def infer_identifier(self, basefile):
         return "JK %s" % basefile
@@ -123,10 +123,11 @@ class JK(SwedishLegalSource):
         return a
     
     def extract_body(self, fp, basefile):
-        # NB: extract_head already did this (so the fp will have been
-        # read to the end -- need to seek(0)
+        # NB: during parse, this reuses the soup that extract_head
+        # created. Otherwise, the fp will have been read to the end
+        # by extract_head -- need to seek(0)
         fp.seek(0)
-        soup = BeautifulSoup(fp.read(), "lxml")
+        soup = self.parse_source(fp)
         main = soup.find("div", "content")
         main.find("div", "actions").extract()
         main.find("div", "date").extract()
@@ -3,13 +3,16 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from builtins import *
 
+import hashlib
 import logging
 import os
+import pickle
 import sys
 import re
 from datetime import date 
 
 # thirdparty
+import simpleparse
 from simpleparse.parser import Parser
 from simpleparse.stt.TextTools.TextTools import tag
 from rdflib import Graph, Namespace, Literal, BNode, RDFS, RDF, URIRef
@@ -17,13 +20,18 @@ from rdflib.namespace import DCTERMS, SKOS
 COIN = Namespace("http://purl.org/court/def/2009/coin#")
 
 # my own libraries
-from ferenda import ResourceLoader
+from ferenda import ResourceLoader, util
 from ferenda.elements import Link, LinkSubject
 from ferenda.thirdparty.coin import URIMinter
 from . import RPUBL, RINFOEX
 
 log = logging.getLogger('lr')
 
+# Compiled tagger tables, keyed by LegalRef.tagger_key(). These are
+# shared by all LegalRef objects in the process (and inherited by
+# forked worker processes).
+_taggers = {}
+
 # Lite om hur det hela funkar: Att hitta referenser i löptext är en
 # tvåstegsprocess.
 #
@@ -84,7 +92,33 @@ class LegalRef:
         r'\|(lagens?|balkens?|förordningens?|formens?|ordningens?|kungörelsens?|stadgans?)')
     re_xmlcharref = re.compile("&#\d+;")
 
-    def __init__(self, *args):
+    # For each reference type, a regex that must match somewhere in the
+    # (escaped) input for any of the root productions of that type's
+    # grammar to match. Apart from the exceptions below, every reference
+    # contains a digit. LAGRUM also matches named laws (which are marked with
+    # '|' by re_escape_named) and references like "andra stycket"
+    # (where "st" always follows whitespace).
+    triggers = {LAGRUM: r"[0-9|]|\sst",
+                KORTLAGRUM: "[0-9]",
+                ENKLALAGRUM: "[0-9|]",
+                FORARBETEN: "[0-9]",
+                RATTSFALL: "[0-9]",
+                EULAGSTIFTNING: "[0-9]",
+                EURATTSFALL: "[0-9]",
+                MYNDIGHETSBESLUT: "[0-9]"}
+
+    cachedir = None
+    """If set, compiled tagger tables are pickled to this directory, so
+    that other processes can load them instead of compiling the
+    grammar again. Set it for a single object with the ``cachedir``
+    keyword argument to the constructor."""
+
+    def __init__(self, *args, **kwargs):
+        if 'cachedir' in kwargs:
+            self.cachedir = kwargs.pop('cachedir')
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: %s" %
+                            ", ".join(sorted(kwargs)))
         if not os.path.sep in __file__:
             scriptdir = os.getcwd()
         else:
@@ -162,16 +196,18 @@ class LegalRef:
         # if KORTLAGRUM, delay the construction of the parser until we
         # can construct the LawAbbreviation production (see parse())
         if self.KORTLAGRUM not in self.args:
-            # we store this parser object so that it's __del__ method
-            # isn't called prematurely when using
-            # _simpleparseFallback. FIXME: Do we still need to do tha,
-            # now that _simpleparseFallback is removed?
-            self.spparser = Parser(self.decl, "root")
-            self.tagger = self.spparser.buildTagger("root")
-            # print("self.tagger relative size: %s" % len(str(self.tagger)))
+            self.tagger = self.build_tagger()
         self.verbose = False
         self.depth = 0
 
+        # Strings that don't match the trigger are not tagged at
+        # all. Set to None to always run the tagger.
+        patterns = [self.triggers.get(arg) for arg in self.args]
+        if patterns and None not in patterns:
+            self.trigger = re.compile("|".join(sorted(set(patterns))))
+        else:
+            self.trigger = None
+
         self.reset()
         
 
@@ -206,6 +242,52 @@ class LegalRef:
         return [x.group(1) for x in re.finditer(r'(\w+(Ref|RefID))\s*::=',
                                                 content)]
 
+    def tagger_key(self):
+        """Returns a key that uniquely identifies the tagger table for the
+        current grammar (the requested reference types and the full
+        EBNF declaration, including any law abbreviations)."""
+        data = "%s\n%s\n%r\n%s" % (sys.version_info[0],
+                                     simpleparse.__version__,
+                                     sorted(self.args), self.decl)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def build_tagger(self):
+        """Returns a compiled tagger table for the current grammar, using
+        the in-process cache or the on-disk cache in :py:attr:`cachedir`
+        if possible."""
+        key = self.tagger_key()
+        if key not in _taggers:
+            tagger = self._load_tagger(key)
+            if tagger is None:
+                tagger = Parser(self.decl, "root").buildTagger("root")
+                self._store_tagger(key, tagger)
+            _taggers[key] = tagger
+        return _taggers[key]
+
+    def _tagger_path(self, key):
+        return os.sep.join([self.cachedir, key + ".pickle"])
+
+    def _load_tagger(self, key):
+        if not self.cachedir or not os.path.exists(self._tagger_path(key)):
+            return None
+        try:
+            with open(self._tagger_path(key), "rb") as fp:
+                return pickle.load(fp)
+        except Exception as e:
+            log.warning("Couldn't load cached tagger %s: %s: %s" %
+                        (self._tagger_path(key), type(e).__name__, e))
+            return None
+
+    def _store_tagger(self, key, tagger):
+        if not self.cachedir:
+            return
+        path = self._tagger_path(key)
+        try:
+            util.writefile_atomic(path, pickle.dumps(tagger,
+                                                     pickle.HIGHEST_PROTOCOL))
+        except (IOError, OSError) as e:
+            log.warning("Couldn't store cached tagger %s: %s" % (path, e))
+
     def get_relations(self, predicate, graph):
         d = {}
         for obj, subj in graph.subject_objects(predicate):
@@ -265,9 +347,7 @@ class LegalRef:
                 lawdecl = "LawAbbreviation ::= ('%s')\n" % "'/'".join(
                     self.lawlist)
                 self.decl += lawdecl
-                self.spparser = Parser(self.decl, "root")
-                self.tagger = self.spparser.buildTagger("root")
-                # print("self.tagger relative size (w/ LawAbbreviation): %s" % len(str(self.tagger)))
+                self.tagger = self.build_tagger()
         if self.RATTSFALL in self.args and not self.namedseries:
             self.namedseries.update(self.get_relations(SKOS.altLabel,
                                                        self.metadata_graph))
@@ -301,14 +381,22 @@ class LegalRef:
         if self.verbose:
             print("calling tag with '%s'" % (indata))
 
-        # Parsea texten med TextTools.tag - inte det enklaste sättet
-        # att göra det, men om man gör enligt
-        # Simpleparse-dokumentationen byggs taggertabellen om för
-        # varje anrop till parse()
-        taglist = tag(indata, self.tagger, 0, len(indata))
-        result = []
-        root = NodeTree(taglist, indata)
-        for part in root.nodes:
+        if self.trigger is not None and not self.trigger.search(indata):
+            # no reference can possibly be found, so we can skip
+            # the tagging step (but the result is still normalized
+            # below, just as a tagged text without references would)
+            taglist = [len(indata)]
+            result = [indata]
+            parts = []
+        else:
+            # Parsea texten med TextTools.tag - inte det enklaste sättet
+            # att göra det, men om man gör enligt
+            # Simpleparse-dokumentationen byggs taggertabellen om för
+            # varje anrop till parse()
+            taglist = tag(indata, self.tagger, 0, len(indata))
+            result = []
+            parts = NodeTree(taglist, indata).nodes
+        for part in parts:
             if part.tag != 'plain' and self.verbose:
                 sys.stdout.write(self.prettyprint(part))
             if part.tag in self.roots:
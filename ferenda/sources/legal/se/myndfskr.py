@@ -532,7 +532,8 @@ class MyndFskrBase(FixedLayoutSource):
             resource = self.attributes_to_resource(attributes)
             return self.minter.space.coin_uri(resource)
 
-        parser = SwedishCitationParser(LegalRef(LegalRef.LAGRUM),
+        parser = SwedishCitationParser(LegalRef(LegalRef.LAGRUM,
+                                                cachedir=self.legalrefcachedir),
                                        self.minter,
                                        self.commondata)
 
@@ -568,7 +568,8 @@ class Offtryck(SwedishLegalSource):
         functions = [(self.find_primary_law, sharedstate),
                      (self.find_commentary, sharedstate)]
         if not hasattr(self, 'sfsparser'):
-            self.sfsparser = LegalRef(LegalRef.LAGRUM)
+            self.sfsparser = LegalRef(LegalRef.LAGRUM,
+                                     cachedir=self.legalrefcachedir)
         self.sfsparser.currentlynamedlaws.clear()
         if self.document_type == self.PROPOSITION:
             functions.append((self.find_kommittebetankande, sharedstate))
@@ -288,7 +288,7 @@ class Regeringen(Offtryck):
         if self.get_parse_options(basefile) == "skip":
             raise DocumentSkippedError("%s is blacklisted" % basefile,
                                        dummyfile=self.store.parsed_path(basefile))
-        soup = BeautifulSoup(fp.read(), "lxml")
+        soup = self.parse_source(fp)
         self._rawbody = soup.body
         return self._rawbody.find(id="content")
 
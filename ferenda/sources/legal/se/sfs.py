@@ -149,14 +149,16 @@ class SFS(Trips):
     @cached_property
     def lagrum_parser(self):
         return SwedishCitationParser(LegalRef(LegalRef.LAGRUM,
-                                              LegalRef.EULAGSTIFTNING),
+                                              LegalRef.EULAGSTIFTNING,
+                                              cachedir=self.legalrefcachedir),
                                      self.minter,
                                      self.commondata,
                                      allow_relative=True)
 
     @cached_property
     def forarbete_parser(self):
-        return SwedishCitationParser(LegalRef(LegalRef.FORARBETEN),
+        return SwedishCitationParser(LegalRef(LegalRef.FORARBETEN,
+                                              cachedir=self.legalrefcachedir),
                                      self.minter,
                                      self.commondata)
 
@@ -516,11 +518,10 @@ class SFS(Trips):
         # FIXME: This should be done in CoIN entirely
         if konsolidering is True:
             uri = uri.rsplit("/", 1)[0]
-        computed_basefile = self.basefile_from_uri(uri)
-
-        basefile = basefile.replace("_", " ") # For reasons
-        assert basefile == computed_basefile, "%s -> %s -> %s" % (basefile, uri, computed_basefile)
-        # end temporary code
+        if self.config.checkcanonicaluri:
+            computed_basefile = self.basefile_from_uri(uri)
+            basefile = basefile.replace("_", " ") # For reasons
+            assert basefile == computed_basefile, "%s -> %s -> %s" % (basefile, uri, computed_basefile)
         return uri
 
     def basefile_from_uri(self, uri):
@@ -13,9 +13,9 @@ from wsgiref.util import request_uri
 import logging
 import operator
 import os
+import pickle
 import sys
 import re
-import codecs
 
 from layeredconfig import LayeredConfig, Defaults
 from rdflib import URIRef, RDF, Namespace, Literal, Graph, BNode
@@ -25,14 +25,16 @@ BIBO = Namespace("http://purl.org/ontology/bibo/")
 OLO = Namespace("http://purl.org/ontology/olo/core#")
 from six import text_type as str
 import bs4
+import lxml.html
 from cached_property import cached_property
 
 from ferenda import (DocumentRepository, DocumentStore, FSMParser,
                      CitationParser, Describer, Facet, RequestHandler)
-from ferenda import util, fulltextindex
+from ferenda import util, fulltextindex, errors
+import ferenda
 from ferenda.sources.legal.se.legalref import Link, LegalRef, RefParseError
 from ferenda.elements.html import A, H1, H2, H3, P, Strong, Pre
-from ferenda.elements import serialize, Section, Body, CompoundElement, UnicodeElement, Preformatted
+from ferenda.elements import serialize, deserialize, Section, Body, CompoundElement, UnicodeElement, Preformatted
 from ferenda.pdfreader import Page, BaseTextDecoder, Textelement
 from ferenda.pdfreader import PDFReader
 from ferenda.pdfanalyze import PDFAnalyzer
@@ -61,6 +63,9 @@ class SwedishLegalStore(DocumentStore):
         return self.path(basefile, "intermediate", ".xml", version=version,
                          attachment=attachment)
 
+    def checkpoint_path(self, basefile, version=None):
+        return self.path(basefile, "checkpoint", ".bin", version=version)
+
 
 # used instead of False when we need to provide more information (yet
 # still evaluate to False in a bool context)
@@ -85,6 +90,10 @@ class SwedishLegalHandler(RequestHandler):
             res =  SupportsResult(reason="'%s' didn't start with '/%s/'" % (environ['PATH_INFO'], 
                                                                            self.repo.urispace_segment))
         return res
+
+    def routes(self):
+        return [self._alias_route("dataset"),
+                "/" + self.repo.urispace_segment + "/"]
         
 
 class SwedishLegalSource(DocumentRepository):
@@ -153,6 +162,13 @@ class SwedishLegalSource(DocumentRepository):
         if not isinstance(self, SwedishLegalSource):
             assert self.alias != "swedishlegalsource", "Subclasses must override self.alias!"
 
+    @property
+    def legalrefcachedir(self):
+        """The directory where the LegalRef objects of this docrepo
+        share compiled grammars with other objects and processes (see
+        :py:attr:`~ferenda.sources.legal.se.legalref.LegalRef.cachedir`)."""
+        return os.sep.join([self.config.datadir, "cache", "legalref"])
+
     @cached_property
     def minter(self):
         # print("%s (%s) loading minter" % (self.alias, id(self)))
@@ -160,11 +176,8 @@ class SwedishLegalSource(DocumentRepository):
         spacefile = filename("uri/swedishlegalsource.space.ttl")
         slugsfile = filename("uri/swedishlegalsource.slugs.ttl")
         self.log.debug("Loading URISpace from %s" % spacefile)
-        with codecs.open(spacefile, encoding="utf-8") as space:
-            with codecs.open(slugsfile, encoding="utf-8") as slugs:
-                cfg = Graph().parse(space,
-                                    format="turtle").parse(slugs,
-                                                           format="turtle")
+        cfg = util.load_graph([spacefile, slugsfile],
+                              cachedir=self.graphcachedir)
         COIN = Namespace("http://purl.org/court/def/2009/coin#")
         # select correct URI for the URISpace definition by
         # finding a single coin:URISpace object
@@ -175,9 +188,14 @@ class SwedishLegalSource(DocumentRepository):
     def refparser(self):
         cd = self.commondata
         if self.alias != "sfs" and self.resourceloader.exists("extra/sfs.ttl"):
-            with self.resourceloader.open("extra/sfs.ttl") as fp:
-                cd.parse(data=fp.read(), format="turtle")
-        return SwedishCitationParser(LegalRef(*self.parse_types),
+            sfsgraph = util.load_graph([self.resourceloader.filename("extra/sfs.ttl")],
+                                       cachedir=self.graphcachedir)
+            cd += sfsgraph
+            # adding a graph only adds its triples, not its prefixes
+            for prefix, ns in sfsgraph.namespaces():
+                cd.bind(prefix, ns)
+        return SwedishCitationParser(LegalRef(*self.parse_types,
+                                              cachedir=self.legalrefcachedir),
                                      self.minter,
                                      cd,
                                      allow_relative=self.parse_allow_relative)
@@ -195,9 +213,24 @@ class SwedishLegalSource(DocumentRepository):
         opts = super(SwedishLegalSource, cls).get_default_options()
         opts['pdfimages'] = False
         opts['parserefs'] = True
+        # if True, check that every URI created by canonical_uri
+        # round-trips through basefile_from_uri (slow, for debugging)
+        opts['checkcanonicaluri'] = False
         opts['cssfiles'] = ['css/swedishlegalsource.css']
+        # save the body tree before reference parsing, and optionally
+        # start from that instead of the downloaded files (see
+        # parse_body)
+        opts['parsecheckpoint'] = True
+        opts['fromstage'] = ""
         return opts
 
+    def parseneeded(self, basefile):
+        # when rerunning the later stages of parsing, documents must
+        # be reparsed even if the parsed files are up to date
+        if self.config.fromstage:
+            return True
+        return super(SwedishLegalSource, self).parseneeded(basefile)
+
     def download_is_different(self, existing, new):
         # almost all resources handled by all repos deriving from this
         # are immutable, ie they should never change. If some repo
@@ -320,13 +353,9 @@ class SwedishLegalSource(DocumentRepository):
         attrib = self.metadata_from_basefile(basefile)
         resource = self.attributes_to_resource(attrib)
         uri = self.minter.space.coin_uri(resource)
-        # FIXME: temporary code we use while we get basefile_from_uri to work
-        computed_basefile = self.basefile_from_uri(uri)
-        if basefile != computed_basefile:
+        if self.config.checkcanonicaluri:
             computed_basefile = self.basefile_from_uri(uri)
-            
-        assert basefile == computed_basefile, "%s -> %s -> %s" % (basefile, uri, computed_basefile)
-        # end temporary code
+            assert basefile == computed_basefile, "%s -> %s -> %s" % (basefile, uri, computed_basefile)
         return uri
 
     def metadata_from_basefile(self, basefile):
@@ -418,6 +447,7 @@ class SwedishLegalSource(DocumentRepository):
             patch_if_needed(file) -> file
         parse_metadata(file, basefile) -> rdflib.Resource
             extract_head(file, basefile) -> object
+                [parse_source(file) -> bs4.BeautifulSoup]
             extract_metadata(object, basefile) -> dict
                 [metadata_from_basefile(basefile) -> dict]
             sanitize_metadata(dict, basefile) -> dict
@@ -428,6 +458,7 @@ class SwedishLegalSource(DocumentRepository):
                 infer_identifier(basefile) -> str
         parse_body(file, basefile) -> elements.Body
             extract_body(file, basefile) -> object
+                [parse_source(file) -> bs4.BeautifulSoup]
             sanitize_body(object) -> object
             get_parser(basefile) -> callable
             tokenize(object) -> iterable
@@ -446,15 +477,19 @@ class SwedishLegalSource(DocumentRepository):
         UnorderedSection.counter = 0
         PreambleSection.counter = 0
         self.refparser._legalrefparser.namedlaws = {}
-        fp = self.parse_open(doc.basefile)
-        resource = self.parse_metadata(fp, doc.basefile)
-        doc.meta = resource.graph
-        doc.uri = str(resource.identifier)
-        if resource.value(DCTERMS.title):
-            doc.lang = resource.value(DCTERMS.title).language
-        doc.body = self.parse_body(fp, doc.basefile)
-        if not fp.closed:
-            fp.close()
+        self._sourcecache = {}
+        try:
+            fp = self.parse_open(doc.basefile)
+            resource = self.parse_metadata(fp, doc.basefile)
+            doc.meta = resource.graph
+            doc.uri = str(resource.identifier)
+            if resource.value(DCTERMS.title):
+                doc.lang = resource.value(DCTERMS.title).language
+            doc.body = self.parse_body(fp, doc.basefile)
+            if not fp.closed:
+                fp.close()
+        finally:
+            self._sourcecache = None
         self.postprocess_doc(doc)
         self.parse_entry_update(doc)
         # print(doc.meta.serialize(format="turtle").decode("utf-8"))
@@ -539,9 +574,42 @@ class SwedishLegalSource(DocumentRepository):
         """Given a open file containing raw document content (or intermediate
         content), return the parts of that document that contains
         document metadata, in some raw form that extract_metadata can
-        digest."""
-        soup = bs4.BeautifulSoup(fp.read(), "lxml")
-        return soup.head
+        digest.
+
+        The default implementation returns the head of the document
+        as parsed by :py:meth:`parse_source`."""
+        return self.parse_source(fp).head
+
+    def parse_source(self, fp, parser="lxml"):
+        """Given a open file containing raw HTML/XML document content,
+        return a :py:class:`bs4.BeautifulSoup` object created from it
+        using *parser*.
+
+        During :py:meth:`parse`, the result is cached, so that
+        :py:meth:`extract_head` and :py:meth:`extract_body` (which are
+        given the same open file) can both call this method while the
+        file is only read and parsed once. The cache is released when
+        parse is done.
+
+        If *parser* is ``"lxml.html"``, a :py:mod:`lxml.html` document
+        tree is returned instead, which is considerably faster to
+        create. Subclasses that don't need BeautifulSoup-specific
+        behaviour can use this.
+
+        """
+        key = (id(fp), parser)
+        if self._sourcecache is not None and key in self._sourcecache:
+            return self._sourcecache[key][1]
+        data = fp.read()
+        if parser == "lxml.html":
+            res = lxml.html.document_fromstring(data)
+        else:
+            res = bs4.BeautifulSoup(data, parser)
+        if self._sourcecache is not None:
+            # keep a reference to fp, so that its id isn't reused
+            # during this parse
+            self._sourcecache[key] = (fp, res)
+        return res
 
     def extract_metadata(self, rawhead, basefile):
         """Given the document metadata returned by extract_head, extract all
@@ -653,22 +721,110 @@ class SwedishLegalSource(DocumentRepository):
 
 
     def parse_body(self, fp, basefile):
-        rawbody = self.extract_body(fp, basefile)
-        sanitized = self.sanitize_body(rawbody)
-        parser = self.get_parser(basefile, sanitized)
-        tokenstream = self.tokenize(sanitized)
-        body = parser(tokenstream)
-        for func, initialstate in self.visitor_functions(basefile):
-            # could be functions for assigning URIs to particular
-            # nodes, extracting keywords from text etc. Note: finding
-            # references in text with LegalRef is done afterwards
-            self.visit_node(body, func, initialstate)
-        self._serialize_unparsed(body, basefile)
+        """Given a open file containing raw document content (or
+        intermediate content), return a :py:class:`ferenda.elements.Body`
+        object with the structured content of the document, with
+        references to other documents marked up.
+
+        The structural body tree (before references are parsed) is
+        saved as a checkpoint (unless the ``parsecheckpoint`` option
+        is False). If the ``fromstage`` option is set to ``refs``, a
+        valid checkpoint is used instead of extracting and parsing the
+        body from *fp*, so that only reference parsing is redone. See
+        :py:meth:`load_checkpoint`.
+
+        """
+        body = None
+        if self.config.fromstage:
+            if self.config.fromstage != "refs":
+                raise errors.ConfigurationError(
+                    "Unknown parse stage %r (only 'refs' is supported)" %
+                    self.config.fromstage)
+            body = self.load_checkpoint(basefile)
+        if body is None:
+            rawbody = self.extract_body(fp, basefile)
+            sanitized = self.sanitize_body(rawbody)
+            parser = self.get_parser(basefile, sanitized)
+            tokenstream = self.tokenize(sanitized)
+            body = parser(tokenstream)
+            for func, initialstate in self.visitor_functions(basefile):
+                # could be functions for assigning URIs to particular
+                # nodes, extracting keywords from text etc. Note: finding
+                # references in text with LegalRef is done afterwards
+                self.visit_node(body, func, initialstate)
+            self._serialize_unparsed(body, basefile)
+            self.save_checkpoint(body, basefile)
         if self.config.parserefs and self.parse_types:
             # self.refparser.reset()
             body = self.refparser.parse_recursive(body)
         return body
 
+    def checkpoint_stages(self):
+        """Returns the versions of the parse stages that the checkpoint
+        of a body tree depends on. A checkpoint is only used if it was
+        created with the same stage versions."""
+        return {'class': "%s.%s" % (self.__class__.__module__,
+                                    self.__class__.__name__),
+                'ferenda': ferenda.__version__,
+                'structure': self.parse_structure_version}
+
+    def save_checkpoint(self, body, basefile):
+        """Saves the structural body tree for *basefile*, along with the
+        current stage versions, so that it can be loaded by
+        :py:meth:`load_checkpoint`."""
+        if not self.config.parsecheckpoint:
+            return
+        try:
+            data = pickle.dumps({'stages': self.checkpoint_stages(),
+                                 'body': serialize(body, format="binary")},
+                                pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            # the checkpoint is only a cache, so failing to create it
+            # mustn't stop the parse
+            self.log.warning("%s: Can't save parse checkpoint: %s: %s" %
+                             (basefile, type(e).__name__, e))
+            return
+        with self.store._open(self.store.checkpoint_path(basefile), "wb") as fp:
+            fp.write(data)
+
+    def load_checkpoint(self, basefile):
+        """Returns the structural body tree for *basefile* saved by
+        :py:meth:`save_checkpoint`, or None if there is no checkpoint,
+        or if it's stale (ie. created with other stage versions, or
+        older than the downloaded, intermediate or patch files)."""
+        path = self.store.checkpoint_path(basefile)
+        intermediate_path = self.store.intermediate_path(basefile)
+        if self.config.compress == "bz2":
+            intermediate_path += ".bz2"
+        patchstore = self.documentstore_class(self.config.patchdir +
+                                              os.sep + self.alias)
+        infiles = [self.store.downloaded_path(basefile),
+                   intermediate_path,
+                   patchstore.path(basefile, "patches", ".patch")]
+        if not os.path.exists(path):
+            self.log.debug("%s: No parse checkpoint, parsing from start" % basefile)
+            return None
+        if not util.outfile_is_newer(infiles, path):
+            self.log.debug("%s: Parse checkpoint is older than source, "
+                           "parsing from start" % basefile)
+            return None
+        try:
+            with open(path, "rb") as fp:
+                checkpoint = pickle.load(fp)
+            if checkpoint['stages'] != self.checkpoint_stages():
+                self.log.debug("%s: Parse checkpoint was created with stages %r, "
+                               "parsing from start" % (basefile, checkpoint['stages']))
+                return None
+            return deserialize(checkpoint['body'], format="binary")
+        except Exception as e:
+            # like save_checkpoint, this mustn't stop the parse. A
+            # checkpoint may be truncated, or name element classes
+            # that have since been moved or changed
+            # (ImportError/AttributeError/TypeError).
+            self.log.warning("%s: Can't load parse checkpoint, parsing from start: %s: %s" %
+                             (basefile, type(e).__name__, e))
+            return None
+
     def _serialize_unparsed(self, body, basefile):
         # FIXME: special hack depending on undocument config
         # variable. This is needed for parse-bench.py and its
@@ -686,8 +842,10 @@ class SwedishLegalSource(DocumentRepository):
         content that :py:method:`tokenize` can work with.
         
         The default implementation assumes that the open file contains
-        HTML/XML, creates a BeautifulSoup instance from it, and
-        returns the body of that instance.
+        HTML/XML, creates a BeautifulSoup instance from it (or reuses
+        the one created by :py:meth:`extract_head`, see
+        :py:meth:`parse_source`), and returns the body of that
+        instance.
         
         Docrepos using different file formats, or having documents
         that are split up in multiple files, should override this to
@@ -697,13 +855,7 @@ class SwedishLegalSource(DocumentRepository):
         document content is in a PDF file).
 
         """
-        # FIXME: This re-parses the same data as extract_head
-        # does. This will be common. Maybe fix a superclass level
-        # caching system? (ie read from self._rawbody, which
-        # extract_head has previously set).
-        parser = 'lxml'
-        soup = bs4.BeautifulSoup(fp.read(), parser)
-        return soup.body
+        return self.parse_source(fp).body
 
     def sanitize_body(self, rawbody):
         """Given an object representing the document content, return the same
@@ -960,6 +1112,14 @@ class SwedishLegalSource(DocumentRepository):
 
     _relate_fulltext_value_cache = {}
     _default_creator = "Regeringen"
+    # set to a dict for the duration of parse(), see parse_source
+    _sourcecache = None
+    # Version of the structural parse stages (extract_body,
+    # sanitize_body, get_parser, tokenize and visitor_functions).
+    # Subclasses should bump this whenever a change to any of these
+    # changes the resulting body tree, so that checkpoints created by
+    # earlier versions aren't used by "parse --fromstage=refs".
+    parse_structure_version = 1
 
     def _relate_fulltext_value_rootlabel(self, desc):
         if desc.getvalues(DCTERMS.title):
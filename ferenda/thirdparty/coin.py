@@ -27,6 +27,9 @@ class URIMinter:
 
 class URISpace:
 
+    # max number of minted URIs to remember (see coin_uri)
+    cachesize = 10000
+
     def __init__(self, resource):
         self.base = str(resource.value(COIN.base))
         self.fragmentSeparator = str(resource.value(COIN.fragmentSeparator))
@@ -39,19 +42,86 @@ class URISpace:
         self.templates.sort(key=lambda x: (x.priority, x.forType, len(x.bindings)),
                             reverse=True) 
         self.slugTransform = SlugTransformer(resource.value(COIN.slugTransform))
+        # index templates by the rdf:type they require (None for
+        # templates without a forType), so that only templates that
+        # possibly can match a resource are tried.
+        self.typeindex = {}
+        for idx, template in enumerate(self.templates):
+            forType = template.forType and template.forType.identifier
+            self.typeindex.setdefault(forType, []).append(idx)
+        # the predicates that affect what a resource's URI is, apart
+        # from the ones directly used by bindings
+        self.toBase = set([t.relToBase.identifier for t in self.templates
+                           if t.relToBase])
+        self.fromBase = set([t.relFromBase.identifier for t in self.templates
+                             if t.relFromBase])
+        self.slugFrom = set([b.slugFrom.identifier for t in self.templates
+                             for b in t.bindings if b.slugFrom])
+        self.cache = {}
+
+    def candidates(self, resource):
+        """Returns the templates that might match resource, in priority
+        order. A template can only match if resource has all the
+        properties that its bindings (and relToBase) use, and is of
+        the template's forType, if any."""
+        graph, node = resource.graph, resource.identifier
+        idxs = list(self.typeindex.get(None, ()))
+        for rdftype in set(graph.objects(node, RDF.type)):
+            idxs.extend(self.typeindex.get(rdftype, ()))
+        idxs.sort()
+        predicates = set(graph.predicates(node))
+        for idx in idxs:
+            template = self.templates[idx]
+            if template.required <= predicates:
+                yield template
 
     def coin_uris(self, resource):
-        for template in self.templates:
+        for template in self.candidates(resource):
             uri = template.coin_uri(resource)
             if uri:
                 yield uri
 
     def coin_uri(self, resource):
         assert isinstance(resource, Resource), "coin_uri got a %s object, not a rdflib.resource.Resource" % type(resource)
-        try:
-            return next(self.coin_uris(resource))
-        except StopIteration: 
+        # Resources with the same description (the same properties,
+        # nested resources, slugs etc) always get the same URI, so
+        # remember the result for each description.
+        key = self.signature(resource.graph, resource.identifier, set())
+        if key in self.cache:
+            uri = self.cache[key]
+        else:
+            uri = next(self.coin_uris(resource), None)
+            if len(self.cache) >= self.cachesize:
+                self.cache.clear()
+            self.cache[key] = uri
+        if uri is None:
             raise ValueError("Couldn't mint uri from %s" % resource)
+        return uri
+
+    def signature(self, graph, node, seen):
+        """Returns a hashable description of everything about node that
+        minting its URI depends upon. BNodes are described by their
+        properties only, so that equivalent resources in different
+        graphs get the same signature."""
+        if node in seen:
+            # a cycle, which can't contribute to a URI
+            return None
+        seen = seen | set([node])
+        ident = None if isinstance(node, BNode) else node
+        props = []
+        for p, o in graph.predicate_objects(node):
+            if p in self.toBase:
+                props.append((p, self.signature(graph, o, seen)))
+            elif isinstance(o, Literal):
+                props.append((p, o))
+            else:
+                slugs = frozenset([(sp, graph.value(o, sp))
+                                   for sp in self.slugFrom])
+                props.append((p, None if isinstance(o, BNode) else o, slugs))
+        for p in self.fromBase:
+            for s in graph.subjects(p, node):
+                props.append((p, "^", self.signature(graph, s, seen)))
+        return (ident, frozenset(props))
 
     def transform_value(self, value):
         return self.slugTransform(value)
@@ -113,6 +183,10 @@ class Template:
         self.relFromBase = resource.value(COIN.relFromBase)
         self.bindings = [Binding(self, binding)
                 for binding in resource.objects(COIN.binding)]
+        # the properties a resource must have for this template to match
+        self.required = set([binding.p for binding in self.bindings])
+        if self.relToBase:
+            self.required.add(self.relToBase.identifier)
         # IMPROVE: if not template and variable bindings correspond: TemplateException
         assert self.uriTemplate or self.fragmentTemplate, "No template for template"
 
@@ -64,6 +64,11 @@ class Transformer(object):
         self.documentroot = documentroot
         self.config = config
 
+    def close(self):
+        """Removes any temporary files used by the transformer engine.
+        The object can't be used to transform anything afterwards."""
+        self.t.close()
+
     # valid parameters
     # - annotationfile: intermediate/basefile.grit.xml
     def transform(self, indata, depth, parameters=None, uritransform=None):
@@ -180,6 +185,9 @@ class TransformerEngine(object):
     def __init__(self, template, templatedir):
         pass
 
+    def close(self):
+        pass
+
 
 class XSLTTransform(TransformerEngine):
 
@@ -189,6 +197,8 @@ class XSLTTransform(TransformerEngine):
         self.format = True  # FIXME: make configurable
         self.resourceloader = resourceloader
         self.templdir = self._setup_templates(template, templatedir)
+        # a forked process must not remove the templdir of its parent
+        self.pid = os.getpid()
         # worktemplate = self.templdir + os.sep + template
         worktemplate = self.templdir + os.sep + os.path.basename(template)
         assert os.path.exists(worktemplate)
@@ -200,7 +210,10 @@ class XSLTTransform(TransformerEngine):
             raise errors.TransformError(str(e.error_log))
 
     def __del__(self):
-        if os.path.exists(self.templdir):
+        self.close()
+
+    def close(self):
+        if os.getpid() == self.pid and os.path.exists(self.templdir):
             # this had better be a tempdir!
             shutil.rmtree(self.templdir)
 
@@ -9,6 +9,7 @@ from urllib.parse import quote
 import logging
 import os
 import re
+import sqlite3
 import tempfile
 import xml.etree.cElementTree as ET
 
@@ -146,7 +147,12 @@ SQLite and Sleepycat/BerkeleyDB backends are supported).
                        returns whatever ``requests.get().content``
                        returns -- or the special value ``"python"``
                        which returns a python list of dicts
-                       representing rows and columns.
+                       representing rows and columns, or
+                       ``"iterator"`` which returns an iterator of
+                       such dicts. For remote stores, the rows are
+                       then parsed from the response as they're
+                       consumed, so that large results needn't fit
+                       in memory.
         :type  format: str
 
         """
@@ -182,6 +188,51 @@ SQLite and Sleepycat/BerkeleyDB backends are supported).
         repository as such)."""
         raise NotImplementedError  # pragma: no cover
 
+    def replace_serialized(self, data, format, context=None):
+        """Replaces all statements in *context* (or the entire repository,
+        if *context* is None) with the serialized RDF statements in
+        the string *data*."""
+        self.clear(context)
+        self.add_serialized(data, format, context)
+
+    def replace_serialized_file(self, filename, format, context=None):
+        """Replaces all statements in *context* (or the entire repository,
+        if *context* is None) with the serialized RDF statements
+        contained in the file *filename*."""
+        with open(filename, "rb") as fp:
+            self.replace_serialized(fp.read(), format, context)
+
+    replace_batchsize = 500
+    """The maximum number of subjects removed by each query in
+    :py:meth:`~ferenda.TripleStore.replace_subjects`."""
+
+    def replace_subjects(self, subjects, data, format, context=None):
+        """Removes all statements in *context* (or the entire repository,
+        if *context* is None) about any of the given subjects, and
+        then adds the serialized RDF statements in the string *data*.
+
+        :param subjects: The subjects (URIs) whose statements should be removed
+        :type  subjects: iterable
+        :param data: Serialized RDF statements
+        :type  data: bytes
+        :param format: The format of *data*
+        :type  format: str
+        """
+        subjects = sorted(str(s) for s in subjects)
+        # Remove statements in batches, so that the queries won't
+        # get too long
+        for idx in range(0, len(subjects), self.replace_batchsize):
+            values = " ".join("<%s>" % s for s in
+                              subjects[idx:idx + self.replace_batchsize])
+            if context:
+                query = ("DELETE { GRAPH <%(context)s> { ?s ?p ?o } } "
+                         "WHERE { GRAPH <%(context)s> { ?s ?p ?o . VALUES ?s { %(values)s } } }")
+            else:
+                query = ("DELETE { ?s ?p ?o } "
+                         "WHERE { ?s ?p ?o . VALUES ?s { %(values)s } }")
+            self.update(query % {'context': context, 'values': values})
+        self.add_serialized(data, format, context)
+
     def close(self):
         """Close all connections to the triplestore. Needed if using
         RDFLib-based triple store, a no-op if using HTTP based stores."""
@@ -227,6 +278,25 @@ class RDFLibStore(TripleStore):
         g = self._getcontextgraph(context)
         return len(g)
 
+    def replace_serialized(self, data, format, context=None):
+        # remove and add statements in a single transaction
+        if self.inmemory:
+            raise errors.TriplestoreError("In-memory stores are read-only")
+        self._remove_context(context)
+        self._getcontextgraph(context).parse(data=data, format=format)
+        self.graph.commit()
+
+    def replace_subjects(self, subjects, data, format, context=None):
+        if self.inmemory:
+            raise errors.TriplestoreError("In-memory stores are read-only")
+        g = self._getcontextgraph(context)
+        for subject in subjects:
+            # a wildcard remove lets the underlying store remove all
+            # statements about the subject in one operation
+            g.remove((URIRef(subject), None, None))
+        g.parse(data=data, format=format)
+        self.graph.commit()
+
     def select(self, query, format="sparql"):
         # FIXME: workaround for the fact that rdflib select uses FROM
         # <%s> differently than Sesame/Fuseki. We remove the 'FROM
@@ -245,16 +315,19 @@ class RDFLibStore(TripleStore):
             return res.serialize(format="xml")
         elif format == "json":
             return res.serialize(format="json")
+        elif format == "iterator":
+            return self._bindings_to_iter(res.bindings)
         else:
             # or just
             # return self._sparql_results_to_list(res.serialize(format="xml"))
-            l = []
-            for r in res.bindings:
-                d = {}
-                for (key, val) in r.items():
-                    d[str(key)] = str(val)
-                l.append(d)
-            return l
+            return list(self._bindings_to_iter(res.bindings))
+
+    def _bindings_to_iter(self, bindings):
+        for r in bindings:
+            d = {}
+            for (key, val) in r.items():
+                d[str(key)] = str(val)
+            yield d
 
     def construct(self, query):
         """
@@ -270,10 +343,18 @@ class RDFLibStore(TripleStore):
         return res.graph
 
     def clear(self, context=None):
-        for (s, p, o) in self._getcontextgraph(context):
-            self.graph.remove((s, p, o))
+        self._remove_context(context)
         self.graph.commit()
 
+    def _remove_context(self, context):
+        # Let the underlying store remove all statements in the
+        # context (or in all contexts) in one operation, instead of
+        # removing them one by one.
+        if context:
+            self.graph.remove_context(self._getcontextgraph(context))
+        else:
+            self.graph.remove((None, None, None))
+
     def close(self):
         if not self.closed:
             try:
@@ -315,8 +396,37 @@ class SleepycatStore(RDFLibStore):
 class SQLiteStore(RDFLibStore):
 
     def triple_count(self, context=None):
-        g = self._getcontextgraph(context)
-        return len(list(g))  # bug? otherwise returns # of unique subjects
+        if self.inmemory:
+            return super(SQLiteStore, self).triple_count(context)
+        # The store's own __len__ combines the counts of its partition
+        # tables with a UNION, which removes any counts that happen to
+        # be equal. Count the statements in each table directly,
+        # instead of iterating over all of them. This depends on
+        # internals of the store, so iterate if that fails.
+        try:
+            return self._count_statements(context)
+        except (AttributeError, sqlite3.Error) as e:
+            logging.getLogger(__name__).warning(
+                "Couldn't count statements in SQLite tables, "
+                "iterating instead: %s: %s" % (type(e).__name__, e))
+            return len(list(self._getcontextgraph(context)))
+
+    def _count_statements(self, context):
+        store = self.graph.store
+        cursor = store._db.cursor()
+        count = 0
+        for table, columns in (("type_statements", "member, klass"),
+                               ("asserted_statements", "subject, predicate, object"),
+                               ("literal_statements", "subject, predicate, object, objLanguage, objDatatype")):
+            query = "SELECT COUNT(*) FROM (SELECT DISTINCT %s FROM %s_%s" % (
+                columns, store._internedId, table)
+            if context:
+                cursor.execute(query + " WHERE context = ?)", (context,))
+            else:
+                cursor.execute(query + ")")
+            count += cursor.fetchone()[0]
+        cursor.close()
+        return count
 
     def _storeid(self):
         return "SQLite"
@@ -443,15 +553,19 @@ class RemoteStore(TripleStore):
         url += "?query=" + quote(query).replace("/", "%2F")
 
         headers = {}
-        if format == "python":
+        if format in ("python", "iterator"):
             headers['Accept'] = self._contenttype["sparql"]
         else:
             headers['Accept'] = self._contenttype[format]
         try:
-            results = requests.get(url, headers=headers, data=query)
+            results = requests.get(url, headers=headers, data=query,
+                                   stream=(format == "iterator"))
             results.raise_for_status()
             if format == "python":
                 return self._sparql_results_to_list(results.content)
+            elif format == "iterator":
+                results.raw.decode_content = True
+                return self._sparql_results_to_iter(results.raw)
             # when using format="json", we should return a json
             # string, not the decoded data structure (c.f. how the
             # RDFLib based backends do it).
@@ -494,17 +608,23 @@ class RemoteStore(TripleStore):
             raise errors.SparqlError(e)
 
     def _sparql_results_to_list(self, results):
-        res = []
-        tree = ET.fromstring(results)
-        for row in tree.findall(".//{http://www.w3.org/2005/sparql-results#}result"):
+        return list(self._sparql_results_to_iter(BytesIO(results)))
+
+    def _sparql_results_to_iter(self, fp):
+        # parse the result incrementally, and throw away each result
+        # element as soon as it's been converted
+        resulttag = "{http://www.w3.org/2005/sparql-results#}result"
+        for event, row in ET.iterparse(fp):
+            if row.tag != resulttag:
+                continue
             d = {}
             for element in row:
                 # print element.tag # should be "binding"
                 key = element.attrib['name']
                 value = str(element[0].text)
                 d[key] = value
-            res.append(d)
-        return res
+            row.clear()
+            yield d
 
     def _statements_url(self, context):
         if context:
@@ -9,22 +9,30 @@ install_aliases()
 import codecs
 import datetime
 import filecmp
+import hashlib
+import json
 import locale
 import logging
 import os
+import pickle
 import posixpath
 import re
 import shutil
 import string
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import weakref
 from collections import Counter
 from contextlib import contextmanager
 from email.utils import parsedate_tz
 from ast import literal_eval
 from urllib.parse import urlsplit, urlunsplit
 
+import rdflib
+
 from . import errors
 
 # We should reorganize this, maybe in util.File, util.String, and so on...
@@ -427,6 +435,215 @@ def outfile_is_newer(infiles, outfile):
     # print "%s is newer than %r" % (outfile, infiles)
     return True
 
+
+def file_etag(filename):
+    """Returns a HTTP entity tag for *filename*, based on its size and
+    modification time (so that the file doesn't have to be read)."""
+    st = os.stat(filename)
+    return '"%x-%x"' % (st.st_size, int(st.st_mtime * 1000000))
+
+
+def file_md5(filename):
+    """Returns the md5 digest (as a hex string) of the contents of
+    *filename*, reading it in chunks."""
+    c = hashlib.md5()
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(65536), b""):
+            c.update(chunk)
+    return c.hexdigest()
+
+
+# process-wide cache of pickled graphs, see load_graph
+_graphs = {}
+
+
+def load_graph(filenames, format="turtle", cachedir=None):
+    """Returns a new :py:class:`~rdflib.graph.Graph` containing the
+    statements in all of *filenames*.
+
+    Parsed graphs are kept, pickled, in a process-wide cache keyed on
+    the contents of the files, so that loading the same files again
+    (in this process, or in any process forked from it) only requires
+    unpickling them. If *cachedir* is given, the pickles are stored
+    there as well, so that other processes can use them. Each call
+    returns a separate graph, which the caller is free to modify.
+    """
+    h = hashlib.sha1(("%s\n%s\n%s\n" % (sys.version_info[0],
+                                         rdflib.__version__,
+                                         format)).encode("utf-8"))
+    for filename in filenames:
+        with open(filename, "rb") as fp:
+            h.update(fp.read())
+        h.update(b"\0")
+    key = h.hexdigest()
+    if key in _graphs:
+        return pickle.loads(_graphs[key])
+    path = os.sep.join([cachedir, key + ".pickle"]) if cachedir else None
+    if path and os.path.exists(path):
+        try:
+            with open(path, "rb") as fp:
+                data = fp.read()
+            g = pickle.loads(data)
+            _graphs[key] = data
+            return g
+        except Exception as e:
+            logging.getLogger(__name__).warning(
+                "Couldn't load cached graph %s: %s: %s" %
+                (path, type(e).__name__, e))
+    g = rdflib.Graph()
+    for filename in filenames:
+        with open(filename, "rb") as fp:
+            g.parse(data=fp.read(), format=format)
+    _graphs[key] = pickle.dumps(g, pickle.HIGHEST_PROTOCOL)
+    if path:
+        try:
+            writefile_atomic(path, _graphs[key])
+        except (IOError, OSError) as e:
+            logging.getLogger(__name__).warning(
+                "Couldn't store cached graph %s: %s" % (path, e))
+    return g
+
+class _PerThreadHolder(object):
+    # owns one thread's object, and closes it when the thread (and
+    # with it, its threading.local storage) goes away
+    def __init__(self, obj, close):
+        self.obj = obj
+        self._close = close
+        self._pid = os.getpid()
+
+    def close(self):
+        obj, self.obj = self.obj, None
+        # an object opened before a fork belongs to the parent process
+        if obj is not None and self._close and self._pid == os.getpid():
+            try:
+                self._close(obj)
+            except Exception as e:
+                logging.getLogger(__name__).warning(
+                    "Couldn't close %r: %s: %s" % (obj, type(e).__name__, e))
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            # eg. at interpreter shutdown
+            pass
+
+
+class PerThread(object):
+    """Keeps one object per thread, created by calling *factory* the
+    first time :py:meth:`get` is called in that thread. When the thread
+    finishes, its object is dropped and, if *close* is given, passed to
+    it. If *refresh* is given, it's called with the object on every
+    later :py:meth:`get`, and returns the (possibly new) object to use.
+
+    Objects created in another process (ie. before a fork) are never
+    used, nor closed.
+
+    >>> opened = PerThread(lambda: [], close=lambda l: l.append("closed"))
+    >>> l = opened.get()
+    >>> l is opened.get()
+    True
+    >>> opened.close_all()
+    >>> l
+    ['closed']
+    """
+
+    def __init__(self, factory, close=None, refresh=None):
+        self._factory = factory
+        self._close = close
+        self._refresh = refresh
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._local = threading.local()
+        self._holders = weakref.WeakSet()
+        self._pid = os.getpid()
+
+    def get(self):
+        if self._pid != os.getpid():
+            self._reset()
+        holder = getattr(self._local, 'holder', None)
+        if holder is None or holder.obj is None:
+            holder = _PerThreadHolder(self._factory(), self._close)
+            self._local.holder = holder
+            with self._lock:
+                self._holders.add(holder)
+        elif self._refresh:
+            holder.obj = self._refresh(holder.obj)
+        return holder.obj
+
+    def close_all(self):
+        """Closes the objects of all threads. Threads that call
+        :py:meth:`get` afterwards get a new object."""
+        with self._lock:
+            holders = list(self._holders)
+            if self._pid != os.getpid():
+                holders = []
+            self._reset()
+        for holder in holders:
+            holder.close()
+
+
+class JSONLines(object):
+    """A read-only sequence of the objects in *filename*, a file
+    containing one JSON document per line. The file is read anew each
+    time the sequence is iterated, so the objects never all need to be
+    in memory at once.
+
+    >>> writefile("rows.jsonl", '{"uri": "http://example.org/1"}\\n{"uri": "http://example.org/2"}\\n')
+    >>> rows = JSONLines("rows.jsonl")
+    >>> len(rows)
+    2
+    >>> [row['uri'] for row in rows] == ['http://example.org/1', 'http://example.org/2']
+    True
+    >>> os.unlink("rows.jsonl")
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._len = None
+
+    def __iter__(self):
+        with open(self.filename, "rb") as fp:
+            for line in fp:
+                if line.strip():
+                    yield json.loads(line.decode("utf-8"))
+
+    def __len__(self):
+        if self._len is None:
+            with open(self.filename, "rb") as fp:
+                self._len = sum(1 for line in fp if line.strip())
+        return self._len
+
+    def __repr__(self):
+        return "<JSONLines %s>" % self.filename
+
+
+def cache_control(rules, contenttype):
+    """Selects a ``Cache-Control`` header value for *contenttype* from a
+    list of rules of the form ``"<media range>: <header value>"``. The
+    first rule whose media range matches is used.
+
+    >>> rules = ["application/pdf: max-age=86400", "image/*: max-age=3600",
+    ...          "*: no-cache"]
+    >>> cache_control(rules, "image/png")
+    'max-age=3600'
+    >>> cache_control(rules, "text/html")
+    'no-cache'
+    >>> cache_control([], "text/html") is None
+    True
+
+    """
+    for rule in rules:
+        mediarange, value = rule.split(":", 1)
+        mediarange = mediarange.strip()
+        if (mediarange in ("*", "*/*", contenttype) or
+            (mediarange.endswith("/*") and contenttype and
+             contenttype.startswith(mediarange[:-1]))):
+            return value.strip()
+
 # util.file
 
 
@@ -527,6 +744,24 @@ def writefile(filename, contents, encoding="utf-8"):
         fp.write(contents)
 
 
+def writefile_atomic(filename, contents):
+    """Create *filename* and write *contents* (a bytestring) to it, by
+    way of a temporary file in the same directory that is then renamed,
+    so that concurrent readers never see a partially written file."""
+    ensure_dir(filename)
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(filename) or ".")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(contents)
+        if hasattr(os, "replace"):
+            os.replace(tmppath, filename)
+        else:
+            robust_rename(tmppath, filename)
+    except BaseException:
+        robust_remove(tmppath)
+        raise
+
+
 # util.string
 def extract_text(html, start, end, decode_entities=True, strip_tags=True):
     """Given *html*, a string of HTML content, and two substrings (*start* and *end*) present in this string, return all text between the substrings, optionally decoding any HTML entities and removing HTML tags.
@@ -7,34 +7,159 @@ standard_library.install_aliases()
 
 from collections import defaultdict, OrderedDict, Counter
 from datetime import date, datetime
+from email.utils import parsedate_tz, mktime_tz
 from io import BytesIO
 from operator import itemgetter
-from wsgiref.util import FileWrapper
+from wsgiref.handlers import format_date_time
+from wsgiref.util import FileWrapper, request_uri
 from urllib.parse import parse_qsl, urlencode
-import inspect
 import json
 import logging
 import mimetypes
 import os
-import pkg_resources
 import re
 import sys
+import threading
 
 from rdflib import URIRef, Namespace, Literal, Graph
 from lxml import etree
 from layeredconfig import LayeredConfig, Defaults, INIFile
 
 from ferenda import (DocumentRepository, FulltextIndex, Transformer,
-                     Facet, ResourceLoader)
+                     ResourceLoader)
 from ferenda import fulltextindex, util, elements
 from ferenda.elements import html
 
 
+class RouteTable(object):
+
+    """Maps request paths to the repos that might handle them.
+
+    The table is compiled once from the
+    :py:meth:`~ferenda.RequestHandler.routes` of each repo: string
+    routes go into a prefix trie, and regex routes are combined into a
+    single regex with one named group per route. Each alternative of
+    the combined regex is a lookahead, so a single match reports every
+    repo whose regex matches, not just the first one.
+
+    Repos whose requesthandler overrides ``supports()`` without also
+    overriding ``routes()`` can't be compiled, and are always returned
+    as candidates.
+
+    :param repos: The repos to route requests to
+    :type  repos: list
+    :param log: Logger used to report conflicting routes
+    """
+
+    def __init__(self, repos, log=None):
+        self.trie = {}
+        self.fallback = []
+        self.conflicts = []
+        self._groupowner = {}
+        prefixes = []
+        patterns = []
+        for idx, repo in enumerate(repos):
+            handler = repo.requesthandler
+            if not self._routable(handler):
+                self.fallback.append(idx)
+                continue
+            for route in handler.routes():
+                if isinstance(route, str):
+                    self._insert(route, idx)
+                    prefixes.append((route, idx))
+                else:
+                    name = "r%s_%s" % (idx, len(patterns))
+                    self._groupowner[name] = idx
+                    patterns.append((route, idx, name))
+        if patterns:
+            self.regex = re.compile("".join(
+                ["(?:(?=(?P<%s>%s))|)" % (name, route.pattern)
+                 for (route, idx, name) in patterns]))
+        else:
+            self.regex = None
+        self._find_conflicts(repos, prefixes, patterns)
+        if log:
+            for (a, b, route) in self.conflicts:
+                log.warning("Route conflict: %s and %s both claim %s "
+                            "(%s will be tried first)" % (a, b, route, a))
+
+    def lookup(self, path):
+        """Returns the indexes (in the original order) of all repos that
+        claim the given path.
+
+        :param path: The request path (``PATH_INFO``)
+        :type  path: str
+        :returns: Indexes into the list of repos
+        :rtype: list
+        """
+        found = set(self.fallback)
+        node = self.trie
+        for char in path:
+            if None in node:
+                found.update(node[None])
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            if None in node:
+                found.update(node[None])
+        if self.regex:
+            m = self.regex.match(path)
+            found.update([self._groupowner[name] for (name, value)
+                          in m.groupdict().items() if value is not None])
+        return sorted(found)
+
+    def _insert(self, prefix, idx):
+        node = self.trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(idx)
+
+    def _routable(self, handler):
+        # If supports() is defined further down the class hierarchy
+        # than routes(), the routes are not to be trusted
+        def definedby(name):
+            for cls in type(handler).__mro__:
+                if name in cls.__dict__:
+                    return cls
+        supports, routes = definedby("supports"), definedby("routes")
+        return routes is not None and (supports is None or
+                                       issubclass(routes, supports))
+
+    def _find_conflicts(self, repos, prefixes, patterns):
+        # exact overlap detection between arbitrary regexes isn't
+        # possible, so this finds prefixes that overlap each other,
+        # regexes that match another repo's prefix, and identical
+        # regexes.
+        conflicts = set()
+        for (prefix, idx) in prefixes:
+            for (other, otheridx) in prefixes:
+                if otheridx > idx and (prefix.startswith(other) or
+                                       other.startswith(prefix)):
+                    conflicts.add((idx, otheridx, min(prefix, other, key=len)))
+            for (route, otheridx, name) in patterns:
+                if otheridx != idx and route.match(prefix):
+                    conflicts.add((min(idx, otheridx), max(idx, otheridx), prefix))
+        for (route, idx, name) in patterns:
+            for (other, otheridx, othername) in patterns:
+                if otheridx > idx and route.pattern == other.pattern:
+                    conflicts.add((idx, otheridx, route.pattern))
+        self.conflicts = [(repos[a].alias, repos[b].alias, route)
+                          for (a, b, route) in sorted(conflicts)]
+
+
 class WSGIApp(object):
 
     """Implements a WSGI app.
     """
 
+    searchcachesize = 100
+    """The max number of rendered search result pages to keep in the
+    search page cache. Cached pages are only used as long as the
+    fulltext index hasn't changed (see
+    :py:meth:`~ferenda.FulltextIndex.generation`). Set to 0 to disable
+    caching."""
+
     def __init__(self, repos, inifile=None, **kwargs):
         self.repos = repos
         self.log = logging.getLogger("wsgi")
@@ -60,6 +185,18 @@ class WSGIApp(object):
                                     INIFile(inifile),
                                     Defaults(kwargs),
                                     cascade=True)
+        self._index = None
+        self._indexpid = None
+        self._indexlock = threading.Lock()
+        self._facetstats = {}
+        self._resource_graph = None
+        self._searchcache = OrderedDict()
+        self._searchgeneration = None
+        self._searchcachelock = threading.Lock()
+        self._transformers = util.PerThread(self._make_search_transformer,
+                                            close=lambda t: t.close())
+        self._searchrepo = None
+        self.routes = RouteTable(self.repos, self.log)
 
     ################################################################
     # Main entry point
@@ -111,6 +248,43 @@ Environ: %s
     def search(self, environ, start_response):
         """WSGI method, called by the wsgi app for requests that matches
            ``searchendpoint``."""
+        generation = None
+        if self.searchcachesize:
+            generation = self.fulltextindex().generation()
+        if generation is None:
+            data = self._search_render(environ)
+            return self._return_response(data, start_response)
+        key = self._search_key(environ)
+        with self._searchcachelock:
+            if generation != self._searchgeneration:
+                # the index has changed, all cached pages are stale
+                self._searchcache.clear()
+                self._searchgeneration = generation
+            data = self._searchcache.pop(key, None)
+        if data is None:
+            data = self._search_render(environ)
+        with self._searchcachelock:
+            if generation == self._searchgeneration:
+                if (key not in self._searchcache and
+                        len(self._searchcache) >= self.searchcachesize):
+                    self._searchcache.popitem(last=False)
+                self._searchcache[key] = data  # most recently used last
+        return self._return_response(data, start_response)
+
+    def _search_key(self, environ):
+        # returns a normalized, hashable version of everything that
+        # the rendered search page depends on
+        queryparams = []
+        for k, v in sorted(parse_qsl(environ['QUERY_STRING'])):
+            if k == 'q':
+                v = " ".join(v.split())
+            queryparams.append((k, v))
+        return (request_uri(environ, include_query=False),
+                tuple(queryparams),
+                environ.get('HTTP_ACCEPT'))
+
+    def _search_render(self, environ):
+        # runs the query and renders the result page
         queryparams = self._search_parse_query(environ['QUERY_STRING'])
         res, pager = self._search_run_query(queryparams)
         
@@ -136,8 +310,7 @@ Environ: %s
             html.P(["Results %(firstresult)s-%(lastresult)s "
                     "of %(totalresults)s" % pager]), pagerelem],
                                  **{'class':'pager'}))
-        data = self._search_transform_doc(doc)
-        return self._return_response(data, start_response)
+        return self._search_transform_doc(doc)
 
     def _return_response(self, data, start_response, status="200 OK",
                          contenttype="text/html; charset=utf-8"):
@@ -175,19 +348,25 @@ Environ: %s
         # status, always 200, or mimetype, always text/html). None
         # means no.
         fp = None
+        path = None  # set if we're serving a file that can be cached
+        negotiated = False  # set if a repo picked the file based on Accept
         reasons = OrderedDict()
         if not((environ['PATH_INFO'].startswith("/rsrc") or
                 environ['PATH_INFO'] == "/robots.txt")
                and os.path.exists(fullpath)):
-            for repo in self.repos:
-                supports = repo.requesthandler.supports(environ)
-                if supports:
-                    fp, length, status, mimetype = repo.requesthandler.handle(environ)
-                elif hasattr(supports, 'reason'):
-                    reasons[repo.alias] = supports.reason
-                else:
-                    reasons[repo.alias] = '(unknown reason)'
+            for idx in self.routes.lookup(environ['PATH_INFO']):
+                repo = self.repos[idx]
+                if idx in self.routes.fallback:
+                    supports = repo.requesthandler.supports(environ)
+                    if not supports:
+                        continue
+                fp, length, status, mimetype = repo.requesthandler.handle(environ)
                 if fp:
+                    negotiated = True
+                    if status == 200 and isinstance(getattr(fp, 'name', None), str):
+                        path = fp.name
+                        etag = repo.requesthandler.etag(path)
+                        cachecontrol = repo.requesthandler.cache_control(mimetype)
                     status = {200: "200 OK",
                               406: "406 Not Acceptable"}[status]
                     iterdata = FileWrapper(fp)
@@ -213,7 +392,21 @@ Environ: %s
                 length = os.path.getsize(fullpath)
                 fp = open(fullpath, "rb")
                 iterdata = FileWrapper(fp)
+                path = fullpath
+                etag = util.file_etag(path)
+                cachecontrol = util.cache_control(self.config.cachecontrol,
+                                                  mimetype)
             else:
+                # only now is it worth asking every repo why it didn't
+                # handle the path
+                for repo in self.repos:
+                    supports = repo.requesthandler.supports(environ)
+                    if supports:
+                        reasons[repo.alias] = '(handler found no file)'
+                    elif hasattr(supports, 'reason'):
+                        reasons[repo.alias] = supports.reason
+                    else:
+                        reasons[repo.alias] = '(unknown reason)'
                 reasonmsg = "\n".join(["%s: %s" % (k, reasons[k]) for k in reasons])
                 msg = """<h1>404</h1>
 
@@ -234,74 +427,175 @@ Examined %s repos.
                 length = len(msg.encode('utf-8'))
                 fp = BytesIO(msg.encode('utf-8'))
                 iterdata = FileWrapper(fp)
+        if path:
+            return self._file_response(environ, start_response, fp, path,
+                                       mimetype, etag, cachecontrol,
+                                       negotiated)
         length = str(length)
-        start_response(self._str(status), [
-            (self._str("Content-Type"), self._str(mimetype)),
-            (self._str("Content-Length"), self._str(length))
-        ])
+        headers = [("Content-Type", mimetype),
+                   ("Content-Length", length)]
+        if negotiated:
+            headers.append(("Vary", "Accept"))
+        start_response(self._str(status),
+                       [(self._str(k), self._str(v)) for (k, v) in headers])
         return iterdata
         # FIXME: How can we make sure fp.close() is called, regardless of
         # whether it's a real fileobject or a BytesIO object?
 
+    def _file_response(self, environ, start_response, fp, path, mimetype,
+                       etag, cachecontrol, negotiated=False):
+        # Responds with the contents of an open file, or a part of it
+        # (for Range requests), or nothing at all (for conditional
+        # requests where the file hasn't changed)
+        size = os.path.getsize(path)
+        mtime = int(os.path.getmtime(path))
+        headers = [("ETag", etag),
+                   ("Last-Modified", format_date_time(mtime)),
+                   ("Accept-Ranges", "bytes")]
+        if cachecontrol:
+            headers.append(("Cache-Control", cachecontrol))
+        if negotiated:
+            # the file was selected by content negotiation, so caches
+            # must not serve it to clients that accept something else
+            headers.append(("Vary", "Accept"))
+        byterange = None
+        if self._not_modified(environ, etag, mtime):
+            status = "304 Not Modified"
+            length = 0
+        else:
+            byterange = self._byterange(environ, etag, mtime, size)
+            headers.append(("Content-Type", mimetype))
+            if byterange is False:
+                status = "416 Range Not Satisfiable"
+                length = 0
+                headers.append(("Content-Range", "bytes */%s" % size))
+            elif byterange:
+                status = "206 Partial Content"
+                length = byterange[1] - byterange[0] + 1
+                headers.append(("Content-Range", "bytes %s-%s/%s" %
+                                (byterange[0], byterange[1], size)))
+            else:
+                status = "200 OK"
+                length = size
+            headers.append(("Content-Length", str(length)))
+        start_response(self._str(status),
+                       [(self._str(k), self._str(v)) for (k, v) in headers])
+        if status == "200 OK":
+            return FileWrapper(fp)
+        elif byterange:
+            return self._iter_range(fp, byterange[0], length)
+        else:
+            fp.close()
+            return iter([])
+
+    def _not_modified(self, environ, etag, mtime):
+        if environ.get('REQUEST_METHOD', 'GET') not in ('GET', 'HEAD'):
+            return False
+        # If-None-Match takes precedence over If-Modified-Since
+        if environ.get('HTTP_IF_NONE_MATCH'):
+            tags = [t.strip() for t in environ['HTTP_IF_NONE_MATCH'].split(",")]
+            return "*" in tags or etag in tags or "W/" + etag in tags
+        if environ.get('HTTP_IF_MODIFIED_SINCE'):
+            since = parsedate_tz(environ['HTTP_IF_MODIFIED_SINCE'])
+            return bool(since) and mtime <= mktime_tz(since)
+        return False
+
+    def _byterange(self, environ, etag, mtime, size):
+        # Returns (first, last) byte positions for a satisfiable
+        # single range request, False for an unsatisfiable one, and
+        # None if the entire file should be sent.
+        rangeheader = environ.get('HTTP_RANGE', '')
+        if not rangeheader.startswith("bytes="):
+            return None
+        ifrange = environ.get('HTTP_IF_RANGE')
+        if ifrange and ifrange != etag:
+            since = parsedate_tz(ifrange)
+            if not since or mktime_tz(since) != mtime:
+                return None  # the file has changed
+        spec = rangeheader[6:].strip()
+        if "," in spec:
+            return None  # multiple ranges aren't supported
+        first, sep, last = spec.partition("-")
+        try:
+            if first:
+                first = int(first)
+                last = int(last) if last else size - 1
+                if first >= size:
+                    return False
+                if last < first:
+                    return None  # invalid, so it's ignored
+            else:
+                suffixlength = int(last)
+                if suffixlength == 0:
+                    return False
+                first = max(0, size - suffixlength)
+                last = size - 1
+        except ValueError:
+            return None
+        return first, min(last, size - 1)
+
+    def _iter_range(self, fp, start, length, blocksize=8192):
+        try:
+            fp.seek(start)
+            while length > 0:
+                data = fp.read(min(blocksize, length))
+                if not data:
+                    break
+                length -= len(data)
+                yield data
+        finally:
+            fp.close()
+
     ################################################################
     # API Helper methods
+    def fulltextindex(self):
+        """Returns the fulltext index used for queries. The index is
+        opened once per process (a process forked by a pre-fork server
+        opens its own) and shared between all threads in that
+        process."""
+        with self._indexlock:
+            if self._index is None or self._indexpid != os.getpid():
+                self._index = FulltextIndex.connect(self.config.indextype,
+                                                    self.config.indexlocation,
+                                                    self.repos)
+                self._indexpid = os.getpid()
+            return self._index
+
     def stats(self, resultset=()):
         slices = OrderedDict()
 
-        datadict = defaultdict(list)
-
-        # 1: Create a giant RDF graph consisting of all triples of all
-        #    repos' commondata. To avoid parsing the same RDF files
-        #    over and over, this section duplicates the logic of
-        #    DocumentRepository.commondata to make sure each RDF
-        #    file is loaded only once.
-        ttlfiles = set()
-        resource_graph = Graph()
-        namespaces = {}
-        for repo in self.repos:
-            for prefix, ns in repo.make_graph().namespaces():
-                assert ns not in namespaces or namespaces[ns] == prefix, "Conflicting prefixes for ns %s" % ns
-                namespaces[ns] = prefix
-                resource_graph.bind(prefix, ns)
-                for cls in inspect.getmro(repo.__class__):
-                    if hasattr(cls, "alias"):
-                        commonpath = "res/extra/%s.ttl" % cls.alias
-                        if os.path.exists(commonpath):
-                            ttlfiles.add(commonpath)
-                        elif pkg_resources.resource_exists('ferenda', commonpath):
-                            ttlfiles.add(pkg_resources.resource_filename('ferenda', commonpath))
-
-        self.log.debug("stats: Loading resources %s into a common resource graph" %
-                       list(ttlfiles))
-        for filename in ttlfiles:
-            resource_graph.parse(data=util.readfile(filename), format="turtle")
-        pkg_resources.cleanup_resources()
-
-
-        # 2: if used in the resultset mode, only calculate stats for those
-        # resources/documents that are in the resultset.
+        # 1: if used in the resultset mode, only calculate stats for
+        # those resources/documents that are in the resultset.
         resultsetmembers = set()
         if resultset:
             for r in resultset:
                 resultsetmembers.add(r['iri'])
 
-        # 3: using each repo's faceted_data and its defined facet
-        # selectors, create a set of observations for that repo
-        # 
-        # FIXME: If in resultset mode, we might ask a repo for its
-        # faceted data and then use exactly none of it since it
-        # doesn't match anything in resultsetmembers. We COULD analyze
-        # common resultset iri prefixes and then only call
-        # faceted_data for some (or one) repo.
+        # 2: using each repo's precomputed facet statistics, count
+        # the observations for each facet. In resultset mode, this is
+        # done by intersecting the resultset with the postings for
+        # each observation. If a repo has no precomputed statistics
+        # for a facet (its toc hasn't been created since the facet
+        # was defined), run the facet selectors over its
+        # faceted_data.
         for repo in self.repos:
-            data = repo.faceted_data()
-            if resultsetmembers:
-                data = [r for r in data if r['uri'] in resultsetmembers]
-
+            qname_graph = repo.make_graph()
+            facetstats = self.facet_statistics(repo) or {}
+            calculated = None
             for facet in repo.facets():
                 if not facet.dimension_type:
                     continue
-                dimension, obs = self.stats_slice(data, facet, resource_graph)
+                binding = qname_graph.qname(facet.rdftype).replace(":", "_")
+                key = (str(facet.rdftype), binding)
+                if key in facetstats:
+                    postings = facetstats[key]
+                else:
+                    if calculated is None:
+                        calculated = self.calculate_facet_statistics(
+                            repo, resultsetmembers)
+                    postings = calculated.get(key, {})
+                dimension, obs = self.stats_slice(postings, facet, binding,
+                                                  resultsetmembers)
                 if dimension in slices:
                     # since observations is a Counter not a regular
                     # dict, if slices[dimensions] and observations
@@ -311,7 +605,7 @@ Examined %s repos.
                 else:
                     slices[dimension] = obs
 
-        # 4. Transform our easily-updated data structures to the list
+        # 3. Transform our easily-updated data structures to the list
         # of dicts of lists that we're supposed to return.
         res = {"type": "DataSet",
                "slices": []
@@ -325,8 +619,65 @@ Examined %s repos.
                                   "observations": observations})
         return res
 
-    def stats_slice(self, data, facet, resource_graph):
-        binding = resource_graph.qname(facet.rdftype).replace(":", "_")
+    def facet_statistics(self, repo):
+        """Returns the precomputed facet statistics for a repo (see
+        :py:meth:`~ferenda.DocumentRepository.facet_statistics`) as a
+        dict that maps *(rdftype, binding)* for each facet to its
+        postings, a dict from each observation to a set of URIs, or
+        None if they haven't been computed. The statistics are loaded once, and then only
+        reloaded when they have been recomputed."""
+        cachepath = repo.store.resourcepath("toc/facet_statistics.json")
+        try:
+            mtime = os.path.getmtime(cachepath)
+            if (repo.alias in self._facetstats and
+                    self._facetstats[repo.alias][0] == mtime):
+                return self._facetstats[repo.alias][1]
+            with open(cachepath) as fp:
+                facetstats = json.load(fp)
+        except (IOError, OSError, ValueError) as e:
+            if os.path.exists(cachepath):
+                self.log.warning("Can't load facet statistics from %s: %s" %
+                                 (cachepath, e))
+            return None
+        stats = self._postings(facetstats)
+        self._facetstats[repo.alias] = (mtime, stats)
+        return stats
+
+    def calculate_facet_statistics(self, repo, resultset=None):
+        """Calculates facet statistics, in the same form as
+        :py:meth:`~ferenda.WSGIApp.facet_statistics`, by running the
+        facet selectors of a repo over all rows of its
+        :py:meth:`~ferenda.DocumentRepository.faceted_data` (or only
+        those that are in *resultset*, a set of URIs)."""
+        data = repo.faceted_data()
+        if resultset:
+            data = [r for r in data if r['uri'] in resultset]
+        return self._postings(repo.facet_postings(data, self.resource_graph))
+
+    def _postings(self, facetstats):
+        stats = {}
+        for s in facetstats:
+            postings = {}
+            for observation, uris in s['postings']:
+                if isinstance(observation, list):
+                    observation = tuple(observation)
+                postings[observation] = frozenset(uris)
+            stats[(s['rdftype'], s['binding'])] = postings
+        return stats
+
+    @property
+    def resource_graph(self):
+        """The graph passed to facet selectors, see
+        :py:meth:`~ferenda.DocumentRepository.facet_resource_graph`."""
+        if self._resource_graph is None:
+            if self.repos:
+                self._resource_graph = self.repos[0].facet_resource_graph(
+                    self.repos[1:])
+            else:
+                self._resource_graph = Graph()
+        return self._resource_graph
+
+    def stats_slice(self, postings, facet, binding, resultset=None):
         if facet.dimension_label:
             dimension_label = facet.dimension_label
         elif self.config.legacyapi:
@@ -353,52 +704,22 @@ Examined %s repos.
         else:
             transformer = lambda x: x
 
-        observations = Counter()
-        # one file per uri+observation seen -- avoid
-        # double-counting
-        observed = {}
-        for row in data:
-            observation = None
+        # each document is only counted once per observation, even
+        # if several untransformed observations map to the same
+        # transformed one.
+        observed = defaultdict(set)
+        for observation, uris in postings.items():
             try:
-                # maybe if facet.dimension_type == "ref", selector
-                # should always be Facet.defaultselector?  NOTE:
-                # we look at facet.dimension_type, not
-                # dimension_type, as the latter may be altered if
-                # legacyapi == True
-                if facet.dimension_type == "ref":
-                    observation = transformer(Facet.defaultselector(
-                        row, binding))
-                else:
-                    observation = transformer(
-                        facet.selector(
-                            row,
-                            binding,
-                            resource_graph))
-
-            except Exception as e:
-                # most of the time, we should swallow this
-                # exception since it's a selector that relies on
-                # information that is just not present in the rows
-                # from some repos. I think.
-                if hasattr(facet.selector, 'im_self'):
-                    # try to find the location of the selector
-                    # function for easier debugging
-                    fname = "%s.%s.%s" % (facet.selector.__module__,
-                                          facet.selector.im_self.__name__,
-                                          facet.selector.__name__)
-                else:
-                    # probably a lambda function
-                    fname = facet.selector.__name__
-                # FIXME: do we need the repo name here to provide useful
-                # messages?
-                # self.log.warning("facet %s (%s) fails for row %s : %s %s" % (binding, fname, row['uri'], e.__class__.__name__, str(e)))
-
-                pass
-            if observation is not None:
-                k = (dimension_type, observation)
-                if (row['uri'], observation) not in observed:
-                    observed[(row['uri'], observation)] = True
-                    observations[k] += 1
+                observation = transformer(observation)
+            except Exception:
+                continue
+            if resultset:
+                uris = uris & resultset
+            if uris:
+                observed[observation].update(uris)
+        observations = Counter()
+        for observation, uris in observed.items():
+            observations[(dimension_type, observation)] = len(uris)
         return dimension_label, observations
 
     def query(self, environ):
@@ -411,9 +732,7 @@ Examined %s repos.
                 else:
                     res += '<em class="match">%s</em>' % str(e)
             return res
-        idx = FulltextIndex.connect(self.config.indextype,
-                                    self.config.indexlocation,
-                                    self.repos)
+        idx = self.fulltextindex()
         schema = idx.schema()
         q, param, pagenum, pagelen, stats = self.parse_parameters(
             environ['QUERY_STRING'], schema)
@@ -577,9 +896,7 @@ Examined %s repos.
         return queryparams
     
     def _search_run_query(self, queryparams):
-        idx = FulltextIndex.connect(self.config.indextype,
-                                    self.config.indexlocation,
-                                    self.repos)
+        idx = self.fulltextindex()
         query = queryparams.get('q')
         if isinstance(query, bytes):  # happens on py26
             query = query.decode("utf-8")  # pragma: no cover
@@ -630,16 +947,28 @@ Examined %s repos.
 
         return html.UL(pages, **{'class': 'pagination'})
                        
-    def _search_transform_doc(self, doc):
-        # Transform that XHTML into HTML5
+    def _search_transformer(self):
+        # Compiling the stylesheet is expensive, so each thread (in
+        # each process) keeps its own transformer, since a compiled
+        # XSLT can't be used by several threads at the same time. It's
+        # closed (removing its template dir) when the thread finishes.
+        return self._transformers.get()
+
+    def _make_search_transformer(self):
         conffile = os.sep.join([self.config.documentroot, 'rsrc',
                                 'resources.xml'])
-        transformer = Transformer('XSLT', "xsl/search.xsl", "xsl",
-                                  resourceloader=self.resourceloader,
-                                  config=conffile)
+        return Transformer('XSLT', "xsl/search.xsl", "xsl",
+                           resourceloader=self.resourceloader,
+                           config=conffile)
+
+    def _search_transform_doc(self, doc):
+        # Transform that XHTML into HTML5
+        transformer = self._search_transformer()
         # '/mysearch/' = depth 1
         depth = len(self.config.searchendpoint.split("/")) - 2
-        repo = DocumentRepository(url=self.config.url)
+        if self._searchrepo is None:
+            self._searchrepo = DocumentRepository(url=self.config.url)
+        repo = self._searchrepo
         # we must take develurl into account
         urltransform = None
         if 'develurl' in self.config:
@@ -29,8 +29,12 @@ class DV(OrigDV, SameAs):
         cd = super(DV, self).commondata
         path = "extra/sfs.ttl"
         if self.resourceloader.exists(path):
-            with self.resourceloader.open(path) as fp:
-                cd.parse(data=fp.read(), format="turtle")
+            sfsgraph = util.load_graph([self.resourceloader.filename(path)],
+                                       cachedir=self.graphcachedir)
+            cd += sfsgraph
+            # adding a graph only adds its triples, not its prefixes
+            for prefix, ns in sfsgraph.namespaces():
+                cd.bind(prefix, ns)
         return cd
         
     def add_keyword_to_metadata(self, domdesc, keyword):
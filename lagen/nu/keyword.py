@@ -22,6 +22,9 @@ class LNKeywordHandler(RequestHandler):
             return super(LNKeywordHandler, self).supports(environ)
         return environ['PATH_INFO'].startswith("/begrepp/")
 
+    def routes(self):
+        return [self._alias_route("dataset"), "/begrepp/"]
+
 
 class LNKeyword(keyword.Keyword):
     """Manages descriptions of legal concepts (Lagen.nu-version of Keyword)
@@ -55,13 +55,17 @@ class LNMediaWiki(wiki.MediaWiki):
                      LegalRef.FORARBETEN, LegalRef.RATTSFALL)
         # self.commondata need to include extra/sfs.ttl
         # somehow. This is probably not the best way.
-        with self.resourceloader.open("extra/sfs.ttl") as fp:
-            self.commondata.parse(data=fp.read(), format="turtle")
         # actually, to mint URIs for rattsfall we need the
         # skos:altLabel for the rpubl:Rattsfallspublikation -- so we
         # need everything
-        with self.resourceloader.open("extra/swedishlegalsource.ttl") as fp:
-            self.commondata.parse(data=fp.read(), format="turtle")
+        filename = self.resourceloader.filename
+        extra = util.load_graph([filename("extra/sfs.ttl"),
+                                 filename("extra/swedishlegalsource.ttl")],
+                                cachedir=self.graphcachedir)
+        self.commondata += extra
+        # adding a graph only adds its triples, not its prefixes
+        for prefix, ns in extra.namespaces():
+            self.commondata.bind(prefix, ns)
         return SwedishCitationParser(p,
                                      self.minter,
                                      self.commondata,
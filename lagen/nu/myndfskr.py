@@ -39,6 +39,14 @@ class MyndFskrHandler(RequestHandler):
         fs = chain.from_iterable([self.repo.get_instance(cls).forfattningssamlingar() for cls in self.repo.subrepos])
         return segment in fs
 
+    def routes(self):
+        fs = chain.from_iterable([self.repo.get_instance(cls).forfattningssamlingar() for cls in self.repo.subrepos])
+        routes = [self._alias_route("dataset")]
+        fs = [re.escape(f) for f in fs]
+        if fs:
+            routes.append(re.compile("/(?:%s)(?:/|$)" % "|".join(fs)))
+        return routes
+
 
 class MyndFskr(CompositeRepository, SwedishLegalSource):
     alias = "myndfs"
@@ -29,6 +29,9 @@ class SFSHandler(RequestHandler):
             return super(SFSHandler, self).supports(environ)
         return re.match("/\d{4}\:", environ['PATH_INFO'])
 
+    def routes(self):
+        return [self._alias_route("dataset"), re.compile("/\d{4}\:")]
+
 class SFS(OrigSFS, SameAs):
     requesthandler_class = SFSHandler
     def basefile_from_uri(self, uri):
@@ -11,16 +11,14 @@ from ferenda.elements import html
 from ferenda.fulltextindex import Between
 
 class WSGIApp(OrigWSGIApp):
-    """Subclass that overrides the search() method with specific features for
-lagen.nu."""
+    """Subclass that overrides the rendering of search results with
+specific features for lagen.nu."""
 
     def __init__(self, repos, inifile=None, **kwargs):
         super(WSGIApp, self).__init__(repos, inifile, **kwargs)
 
 
-    def search(self, environ, start_response):
-        """WSGI method, called by the wsgi app for requests that matches
-           ``searchendpoint``."""
+    def _search_render(self, environ):
         queryparams = self._search_parse_query(environ['QUERY_STRING'])
         # massage queryparams['issued'] if present, then restore it
         y = None
@@ -63,8 +61,7 @@ lagen.nu."""
             html.P(["Träff %(firstresult)s-%(lastresult)s "
                     "av %(totalresults)s" % pager]), pagerelem],
                                  **{'class':'pager'}))
-        data = self._search_transform_doc(doc)
-        return self._return_response(data, start_response)
+        return self._search_transform_doc(doc)
 
     def _search_render_innerhit(self, innerhit):
         r = innerhit
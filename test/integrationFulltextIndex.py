@@ -4,11 +4,12 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import sys, os
-from ferenda.compat import unittest
+from ferenda.compat import unittest, patch
 
 from datetime import datetime
 from tempfile import mkdtemp
 import shutil
+import threading
 
 import whoosh.index
 import whoosh.fields
@@ -17,7 +18,7 @@ from rdflib.namespace import RDF, DC, DCTERMS
 from ferenda import FulltextIndex, DocumentRepository, Facet
 from ferenda.fulltextindex import (Identifier, Datetime, Text, Label,
                                    Keyword, Boolean, URI, Resource,
-                                   Less, More, Between)
+                                   Less, More, Between, FulltextSpool)
 
 #----------------------------------------------------------------
 #
@@ -425,8 +426,109 @@ class WhooshBasicIndex(BasicIndex, WhooshBase):
         # need mock docrepo
         self.index = FulltextIndex.connect("WHOOSH", self.location, [DocumentRepository()])
 
+    def test_batch(self):
+        self.index.batchsize = 2
+        self.index.start_batch()
+        self.index.update(**basic_dataset[0])
+        self.index.commit()
+        # nothing is committed until we have two pending updates
+        self.assertEqual(self.index.doccount(), 0)
+        self.index.update(**basic_dataset[1])
+        self.index.commit()
+        self.assertEqual(self.index.doccount(), 2)
+        self.index.update(**basic_dataset[2])
+        self.index.commit()
+        self.assertEqual(self.index.doccount(), 2)
+        self.index.update(**basic_dataset[3])
+        self.index.update(**basic_dataset[4])
+        self.index.end_batch()
+        self.assertEqual(self.index.doccount(), 4)
+        # every batch created a new segment, which optimize merges
+        self.assertLess(1, len(self.index.index._segments()))
+        self.index.optimize()
+        self.assertEqual(1, len(self.index.index._segments()))
+        self.assertEqual(self.index.doccount(), 4)
+
+    def test_spool(self):
+        spooldir = mkdtemp()
+        try:
+            spool = FulltextSpool(spooldir)
+            for doc in basic_dataset:
+                spool.update(**dict(doc))
+            self.assertEqual([], os.listdir(spooldir))
+            spool.commit()
+            self.assertEqual(1, len(os.listdir(spooldir)))
+            self.assertEqual(self.index.doccount(), 0)
+            self.index.batchsize = 2
+            self.assertEqual(5, FulltextSpool(spooldir).replay(self.index))
+            self.assertEqual([], os.listdir(spooldir))
+            self.assertEqual(self.index.doccount(), 4)
+            res, pager = self.index.query("updated")
+            self.assertEqual(1, len(res))
+        finally:
+            shutil.rmtree(spooldir)
+
        
-class WhooshBasicQuery(BasicQuery, WhooshBase): pass
+class WhooshBasicQuery(BasicQuery, WhooshBase):
+
+    def test_querycache(self):
+        self.load(basic_dataset)
+        res, pager = self.index.query("document")
+        self.assertEqual(2, len(res))
+        # callers may modify results without affecting the cache
+        res[0]['dcterms_identifier'] = 'Modified'
+        with patch.object(self.index, '_query') as mock_query:
+            cached, cachedpager = self.index.query("  document ")
+            self.assertFalse(mock_query.called)
+        self.assertEqual('Doc #2', cached[0]['dcterms_identifier'])
+        self.assertEqual(pager, cachedpager)
+        # a different page isn't served from the cache
+        res, pager = self.index.query("document", pagenum=2, pagelen=1)
+        self.assertEqual(1, len(res))
+        # committing changes invalidates the cache
+        self.index.update(**{'uri': 'http://example.org/doc/3',
+                             'repo': 'base',
+                             'basefile': '3',
+                             'dcterms_title': 'Third document',
+                             'dcterms_identifier': 'Doc #3',
+                             'text': 'Yet another document'})
+        self.index.commit()
+        res, pager = self.index.query("document")
+        self.assertEqual(3, len(res))
+
+    def test_searcher(self):
+        self.load(basic_dataset[:2])
+        searcher = self.index.searcher()
+        # the searcher is reused as long as the index is unchanged
+        self.assertIs(searcher, self.index.searcher())
+        self.load(basic_dataset[2:])
+        newsearcher = self.index.searcher()
+        self.assertIsNot(searcher, newsearcher)
+        self.assertEqual(4, newsearcher.doc_count())
+        # a forked process doesn't use the searchers of its parent
+        with patch('ferenda.fulltextindex.os.getpid', return_value=-1):
+            self.assertIsNot(newsearcher, self.index.searcher())
+
+    def test_searcher_thread(self):
+        self.load(basic_dataset)
+        searchers = []
+        t = threading.Thread(target=lambda: searchers.append(self.index.searcher()))
+        t.start()
+        t.join()
+        del t
+        # the searcher of a finished thread is closed, and isn't
+        # handed out to other threads
+        self.assertTrue(searchers[0].ixreader.is_closed)
+        self.assertIsNot(searchers[0], self.index.searcher())
+
+    def test_querycache_disabled(self):
+        self.load(basic_dataset)
+        self.index.querycachesize = 0
+        self.index.query("document")
+        with patch.object(self.index, '_query',
+                          return_value=([], {})) as mock_query:
+            self.index.query("document")
+            self.assertTrue(mock_query.called)
 
 class ESBasicIndex(BasicIndex, ESBase): pass
 
@@ -7,12 +7,16 @@ import ast
 import sys
 import os
 import codecs
+import pickle
 import re
+import shutil
+import tempfile
 
 from rdflib import Namespace, Graph, RDF, URIRef
 
-from ferenda.compat import unittest
+from ferenda.compat import unittest, patch
 from ferenda import ResourceLoader
+from ferenda.sources.legal.se import legalref
 from ferenda.sources.legal.se.legalref import LegalRef
 from ferenda.elements import serialize
 from ferenda.testutil import file_parametrize
@@ -128,6 +132,74 @@ class Avg(TestLegalRef):
         # p.verbose = True
         return self._test_parser(datafile, p)
 
+class TaggerCache(unittest.TestCase):
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        legalref._taggers.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_shared(self):
+        p1 = LegalRef(LegalRef.RATTSFALL, cachedir=self.cachedir)
+        p2 = LegalRef(LegalRef.RATTSFALL, cachedir=self.cachedir)
+        p3 = LegalRef(LegalRef.FORARBETEN, cachedir=self.cachedir)
+        self.assertIs(p1.tagger, p2.tagger)
+        self.assertIsNot(p1.tagger, p3.tagger)
+        self.assertEqual(2, len(os.listdir(self.cachedir)))
+        # objects without a cachedir don't use the disk cache
+        self.assertIsNone(LegalRef.cachedir)
+        legalref._taggers.clear()
+        p4 = LegalRef(LegalRef.EULAGSTIFTNING)
+        self.assertEqual(2, len(os.listdir(self.cachedir)))
+
+    def test_persisted(self):
+        p1 = LegalRef(LegalRef.RATTSFALL, cachedir=self.cachedir)
+        # simulate a new process
+        legalref._taggers.clear()
+        with patch("ferenda.sources.legal.se.legalref.Parser") as mock_parser:
+            p2 = LegalRef(LegalRef.RATTSFALL, cachedir=self.cachedir)
+            self.assertFalse(mock_parser.called)
+        # the tagger tables are self-referential and can't be compared
+        # directly
+        self.assertEqual(pickle.dumps(p1.tagger), pickle.dumps(p2.tagger))
+
+    def test_corrupt(self):
+        p1 = LegalRef(LegalRef.RATTSFALL, cachedir=self.cachedir)
+        legalref._taggers.clear()
+        with open(p1._tagger_path(p1.tagger_key()), "wb") as fp:
+            fp.write(b"not a pickle")
+        p2 = LegalRef(LegalRef.RATTSFALL, cachedir=self.cachedir)
+        self.assertEqual(pickle.dumps(p1.tagger), pickle.dumps(p2.tagger))
+
+class Trigger(TestLegalRef):
+    def _parse(self, parser, text):
+        return serialize(parser.parse(text, self.minter, self.metadata,
+                                      {'law': '9999:999'}))
+
+    def test_skip(self):
+        p = LegalRef(LegalRef.RATTSFALL, LegalRef.FORARBETEN)
+        text = "Inga hänvisningar i den här meningen."
+        with patch("ferenda.sources.legal.se.legalref.tag") as mock_tag:
+            self.assertEqual(["Inga hänvisningar i den här meningen."],
+                             p.parse(text, self.minter, self.metadata))
+            self.assertFalse(mock_tag.called)
+
+    def test_identical(self):
+        texts = ("Se NJA 1994 s. 1 och prop. 1997/98:44 s. 12.",
+                 "Inga hänvisningar & inga siffror, bara <tecken>.",
+                 "Enligt andra stycket gäller detta inte.",
+                 "Enligt brottsbalken gäller detta inte.")
+        for args in ((LegalRef.RATTSFALL, LegalRef.FORARBETEN),
+                     (LegalRef.LAGRUM,)):
+            p = LegalRef(*args)
+            self.assertIsNotNone(p.trigger)
+            got = [self._parse(p, text) for text in texts]
+            p = LegalRef(*args)
+            p.trigger = None
+            want = [self._parse(p, text) for text in texts]
+            self.assertEqual(want, got)
+
 # Some tests are not simply working right now. Since having testdata
 # and wanted result in the same file makes it tricky to mark tests as
 # expectedFailure, we'll just list them here.
@@ -10,7 +10,7 @@ import codecs
 import lxml
 import rdflib
 
-from ferenda.compat import unittest
+from ferenda.compat import unittest, patch
 from ferenda.sources.legal.se.legaluri import (construct, parse,
                                                coinstruct_from_graph)
 from ferenda.testutil import file_parametrize, parametrize
@@ -80,6 +80,47 @@ def tests_from_atom(cls, atomfile, base):
 
 class DefaultCoinstruct(Coinstruct): pass
 
+class Candidates(Coinstruct):
+    def _resource(self, data):
+        graph = rdflib.Graph().parse(data=data, format="turtle")
+        return graph.resource(set(graph.subjects()).pop())
+
+    def test_candidates(self):
+        resource = self._resource("""
+@prefix rpubl: <http://rinfo.lagrummet.se/ns/2008/11/rinfo/publ#> .
+[] a rpubl:Proposition ;
+    rpubl:arsutgava "1997/98" ;
+    rpubl:lopnummer "44" .
+""")
+        candidates = list(self.minter.space.candidates(resource))
+        self.assertLess(len(candidates), len(self.minter.space.templates))
+        # the candidates are a subset of all templates, in the same order
+        self.assertEqual(candidates,
+                         [t for t in self.minter.space.templates
+                          if t in candidates])
+        for template in self.minter.space.templates:
+            if template not in candidates:
+                self.assertIsNone(template.coin_uri(resource))
+
+    def test_memoize(self):
+        data = """
+@prefix rpubl: <http://rinfo.lagrummet.se/ns/2008/11/rinfo/publ#> .
+[] a rpubl:Proposition ;
+    rpubl:arsutgava "1997/98" ;
+    rpubl:lopnummer "%s" .
+"""
+        space = self.minter.space
+        space.cache.clear()
+        uri = space.coin_uri(self._resource(data % "44"))
+        self.assertEqual(1, len(space.cache))
+        with patch.object(space, "coin_uris") as mock_coin_uris:
+            # an equivalent resource (with a different bnode) is found
+            # in the cache
+            self.assertEqual(uri, space.coin_uri(self._resource(data % "44")))
+            self.assertFalse(mock_coin_uris.called)
+        self.assertNotEqual(uri, space.coin_uri(self._resource(data % "45")))
+        self.assertEqual(2, len(space.cache))
+
 class CustomCoinstruct(Coinstruct):
     atomfile = "test/files/legaluri/lagen.nu.atom"
     spacefile = "lagen/nu/res/uri/swedishlegalsource.space.ttl"
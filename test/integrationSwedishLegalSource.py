@@ -5,10 +5,25 @@ from builtins import *
 
 import unittest
 import datetime
+import os
+import shutil
+import tempfile
+from io import BytesIO
 
+from ferenda.compat import Mock, patch
+from ferenda import util
+from ferenda.errors import ConfigurationError
+from ferenda.elements import Paragraph
 from ferenda.sources.legal.se import SwedishLegalSource
 
 
+class CheckpointSource(SwedishLegalSource):
+    alias = "checkpointsource"
+
+    def tokenize(self, body):
+        return [Paragraph([p.get_text()]) for p in body.find_all("p")]
+
+
 class TestSwedishLegalSource(unittest.TestCase):
     def test_parse_swedish_date(self):
         repo = SwedishLegalSource()
@@ -28,3 +43,82 @@ class TestSwedishLegalSource(unittest.TestCase):
         # handle spurious spaces
         self.assertEqual(repo.parse_iso_date("2010- 02 -03"),
                          datetime.date(2010, 2, 3))
+
+    def test_parse_source(self):
+        repo = SwedishLegalSource()
+        html = b"<html><head><title>T</title></head><body><p>B</p></body></html>"
+        # during parse(), extract_head and extract_body share a single
+        # parsed representation of the source
+        repo._sourcecache = {}
+        fp = BytesIO(html)
+        head = repo.extract_head(fp, "1")
+        body = repo.extract_body(fp, "1")
+        self.assertEqual("T", head.title.string)
+        self.assertEqual("B", body.p.string)
+        self.assertIs(head.parent, body.parent)
+        tree = repo.parse_source(BytesIO(html), "lxml.html")
+        self.assertEqual("B", tree.find("body/p").text)
+
+        # outside of parse(), nothing is cached
+        repo._sourcecache = None
+        fp = BytesIO(html)
+        head = repo.extract_head(fp, "1")
+        fp.seek(0)
+        self.assertIsNot(head.parent, repo.extract_body(fp, "1").parent)
+
+    def test_checkpoint(self):
+        datadir = tempfile.mkdtemp()
+        try:
+            repo = CheckpointSource(datadir=datadir, parserefs=False)
+            util.writefile(repo.store.downloaded_path("1"),
+                           "<html><body><p>One</p><p>Two</p></body></html>")
+            with repo.parse_open("1") as fp:
+                body = repo.parse_body(fp, "1")
+            self.assertEqual(["One", "Two"], [p[0] for p in body])
+            self.assertTrue(os.path.exists(repo.store.checkpoint_path("1")))
+
+            # with fromstage=refs, the body is loaded from the
+            # checkpoint and the structural stages aren't run
+            repo.config.fromstage = "refs"
+            repo.extract_body = Mock(side_effect=repo.extract_body)
+            self.assertTrue(repo.parseneeded("1"))
+            self.assertEqual(body, repo.parse_body(None, "1"))
+            self.assertFalse(repo.extract_body.called)
+
+            # a checkpoint made by another version of the structural
+            # stages is ignored
+            repo.parse_structure_version = 2
+            with repo.parse_open("1") as fp:
+                self.assertEqual(body, repo.parse_body(fp, "1"))
+            self.assertTrue(repo.extract_body.called)
+
+            repo.config.fromstage = "tokenize"
+            with self.assertRaises(ConfigurationError):
+                repo.parse_body(None, "1")
+
+            # a body that can't be serialized is parsed anyway, just
+            # without a checkpoint
+            repo.config.fromstage = None
+            os.unlink(repo.store.checkpoint_path("1"))
+            repo.log = Mock()
+            with patch("ferenda.sources.legal.se.swedishlegalsource.serialize",
+                       side_effect=TypeError("can't pickle")):
+                with repo.parse_open("1") as fp:
+                    self.assertEqual(body, repo.parse_body(fp, "1"))
+            self.assertFalse(os.path.exists(repo.store.checkpoint_path("1")))
+            self.assertTrue(repo.log.warning.called)
+
+            # a checkpoint naming element classes that can't be
+            # loaded anymore is ignored
+            with repo.parse_open("1") as fp:
+                repo.parse_body(fp, "1")
+            repo.config.fromstage = "refs"
+            repo.log = Mock()
+            for exc in (ImportError, AttributeError, TypeError):
+                with patch("ferenda.sources.legal.se.swedishlegalsource.deserialize",
+                           side_effect=exc("gone")):
+                    with repo.parse_open("1") as fp:
+                        self.assertEqual(body, repo.parse_body(fp, "1"))
+            self.assertEqual(3, repo.log.warning.call_count)
+        finally:
+            shutil.rmtree(datadir)
@@ -66,6 +66,27 @@ class TripleStoreTestCase(FerendaTestCase):
         self.store.clear(context="http://example.org/actors")
         self.assertEqual(0, self.store.triple_count())
         
+    def test_replace_subjects(self):
+        self.store.add_serialized(
+            util.readfile("test/files/datasets/dataset2.nt"),
+            format="nt", context="http://example.org/ctx1")
+        self.store.add_serialized(
+            util.readfile("test/files/datasets/dataset2.nt"),
+            format="nt", context="http://example.org/ctx2")
+        self.assertEqual(3, self.store.triple_count(
+            context="http://example.org/ctx1"))
+        subjects = set(Graph().parse(
+            data=util.readfile("test/files/datasets/dataset2.nt"),
+            format="nt").subjects())
+        data = b'<http://localhost/publ/dir/2012:36> <http://purl.org/dc/terms/identifier> "Dir. 2012:37" .'
+        self.store.replace_subjects(subjects, data, format="nt",
+                                    context="http://example.org/ctx1")
+        self.assertEqual(1, self.store.triple_count(
+            context="http://example.org/ctx1"))
+        # other contexts are unaffected
+        self.assertEqual(3, self.store.triple_count(
+            context="http://example.org/ctx2"))
+
     def test_add_serialized_file(self):
         self.assertEqual(0,self.store.triple_count())
 
@@ -379,6 +400,10 @@ class Inmemory(object):
         with self.assertRaises(errors.TriplestoreError):
             super(Inmemory,self).test_add_serialized_named_graph()
 
+    def test_replace_subjects(self):
+        with self.assertRaises(errors.TriplestoreError):
+            super(Inmemory,self).test_replace_subjects()
+
     def test_add_serialized_file(self):
         with self.assertRaises(errors.TriplestoreError):
             super(Inmemory,self).test_add_serialized_file()
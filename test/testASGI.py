@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+import sys
+import threading
+
+from ferenda.compat import unittest
+from ferenda import util
+if sys.version_info >= (3, 5):
+    import asyncio
+    from ferenda.asgiapp import ASGIApp
+
+# SUT's base class, and the fixture setup it uses
+import testWSGI
+
+
+# tests the asgi app in-process, by calling it with the messages an
+# ASGI server would send, and collecting the messages it sends back
+@unittest.skipIf(sys.version_info < (3, 5), "ASGI requires python 3.5+")
+class ASGI(testWSGI.WSGI):
+    def setUp(self):
+        super(ASGI, self).setUp()
+        self.asgiapp = ASGIApp(self.app)
+
+    def tearDown(self):
+        self.asgiapp.shutdown()
+        super(ASGI, self).tearDown()
+
+    def call_asgi(self, path, query_string=b"", headers=()):
+        scope = {'type': 'http',
+                 'http_version': '1.1',
+                 'method': 'GET',
+                 'scheme': 'http',
+                 'path': path,
+                 'query_string': query_string,
+                 'headers': [(b'host', b'localhost:8000')] + list(headers),
+                 'server': ('localhost', 8000)}
+        return self._run(scope, [{'type': 'http.request', 'body': b''}])
+
+    def _run(self, scope, messages):
+        loop = asyncio.new_event_loop()
+        sent = []
+
+        def done(result=None):
+            f = loop.create_future()
+            f.set_result(result)
+            return f
+
+        def receive():
+            return done(messages.pop(0))
+
+        def send(message):
+            sent.append(message)
+            return done()
+
+        try:
+            loop.run_until_complete(self.asgiapp(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def test_static(self):
+        sent = self.call_asgi("/")
+        self.assertEqual('http.response.start', sent[0]['type'])
+        self.assertEqual(200, sent[0]['status'])
+        headers = dict(sent[0]['headers'])
+        self.assertEqual(b'text/html', headers[b'content-type'])
+        self.assertEqual(b'<h1>index.html</h1>',
+                         b"".join([m['body'] for m in sent[1:]]))
+        self.assertFalse(sent[-1]['more_body'])
+
+    def test_headers(self):
+        etag = util.file_etag(self.datadir + "/index.html").encode()
+        sent = self.call_asgi("/", headers=[(b'if-none-match', etag)])
+        self.assertEqual(304, sent[0]['status'])
+        self.assertEqual(b'', b"".join([m['body'] for m in sent[1:]]))
+
+        sent = self.call_asgi("/res/base/123/a",
+                              headers=[(b'accept', b'text/turtle')])
+        self.assertEqual(200, sent[0]['status'])
+        self.assertEqual(b'text/turtle',
+                         dict(sent[0]['headers'])[b'content-type'])
+
+    def test_not_found(self):
+        sent = self.call_asgi("/nonexistent")
+        self.assertEqual(404, sent[0]['status'])
+
+    def test_environ(self):
+        scope = {'type': 'http',
+                 'http_version': '1.1',
+                 'method': 'GET',
+                 'path': '/mysearch/',
+                 'query_string': b'q=r%C3%A4ksm%C3%B6rg%C3%A5s',
+                 'headers': [(b'accept', b'text/html'),
+                             (b'accept', b'application/xhtml+xml'),
+                             (b'content-type', b'text/plain')],
+                 'client': ('127.0.0.1', 4711)}
+        environ = self.asgiapp.environ(scope, b'body')
+        self.assertEqual('/mysearch/', environ['PATH_INFO'])
+        self.assertEqual('q=r%C3%A4ksm%C3%B6rg%C3%A5s', environ['QUERY_STRING'])
+        self.assertEqual('text/html,application/xhtml+xml', environ['HTTP_ACCEPT'])
+        self.assertEqual('text/plain', environ['CONTENT_TYPE'])
+        self.assertEqual('127.0.0.1', environ['REMOTE_ADDR'])
+        self.assertEqual(b'body', environ['wsgi.input'].read())
+
+    def test_pool(self):
+        self.assertEqual("query", self.asgiapp.pool("/mysearch/"))
+        self.assertEqual("query", self.asgiapp.pool("/myapi/;stats"))
+        self.assertEqual("static", self.asgiapp.pool("/res/base/123/a"))
+        self.assertEqual("static", self.asgiapp.pool("/"))
+
+    def test_lifespan(self):
+        sent = self._run({'type': 'lifespan'},
+                         [{'type': 'lifespan.startup'},
+                          {'type': 'lifespan.shutdown'}])
+        self.assertEqual([{'type': 'lifespan.startup.complete'},
+                          {'type': 'lifespan.shutdown.complete'}], sent)
+        self.assertTrue(self.asgiapp.executors['query']._shutdown)
+
+    def test_lifespan_shutdown_thread(self):
+        # waiting for the thread pools to finish is done outside of
+        # the event loop thread
+        threads = []
+        self.asgiapp.shutdown = lambda: threads.append(threading.current_thread())
+        self._run({'type': 'lifespan'}, [{'type': 'lifespan.shutdown'}])
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.current_thread(), threads[0])
+        del self.asgiapp.shutdown
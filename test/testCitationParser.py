@@ -9,9 +9,9 @@ from copy import deepcopy
 # import pkg_resources
 # pkg_resources.resource_listdir('ferenda','res')
 
-from pyparsing import Word, nums
+from pyparsing import Word, Optional, nums
 
-from ferenda.compat import unittest
+from ferenda.compat import unittest, patch
 from ferenda.citationparser import CitationParser
 from ferenda.uriformatter import URIFormatter
 from ferenda.elements import (Body, Heading, Paragraph, Footnote,
@@ -90,7 +90,46 @@ class Main(unittest.TestCase):
         got = serialize(doccopy)
         self.assertEqual(want, got)
 
-        
+    def test_derive_trigger(self):
+        cp = CitationParser()
+        trigger = cp.derive_trigger(ferenda.citationpatterns.url)
+        self.assertTrue(trigger.search("see http://example.org/"))
+        self.assertFalse(trigger.search("no citations here"))
+
+        doc_citation = "Doc" + Word(nums) + "/" + Word(nums, exact=4)
+        trigger = cp.derive_trigger(doc_citation)
+        self.assertTrue(trigger.search("According to Doc 43/2012"))
+        self.assertFalse(trigger.search("According to the document"))
+
+        # a grammar without any required parts gets no trigger
+        self.assertIsNone(cp.derive_trigger(Optional("Doc") +
+                                            Optional(Word(nums))))
+
+    def test_trigger(self):
+        doc_citation = ("Doc" + Word(nums).setResultsName("ordinal")
+                        + "/" +
+                        Word(nums,exact=4).setResultsName("year")).setResultsName("DocRef")
+        cp = CitationParser()
+        cp.add_grammar(doc_citation, trigger=["Doc", "doc"])
+        self.assertEqual(["No citations"], cp.parse_string("No citations"))
+        with patch.object(doc_citation, 'scanString') as mock:
+            cp.parse_string("No citations")
+            self.assertFalse(mock.called)
+            cp.parse_string("Doc 43/2012")
+            self.assertTrue(mock.called)
+
+        # make sure the result is the same with and without trigger
+        text = "Doc 43/2012 and Doc 44/2012, but not doc 45"
+        cp = CitationParser(doc_citation)
+        cp._triggers = [None]
+        want = cp.parse_string(text)
+        cp = CitationParser(doc_citation)
+        self.assertIsNotNone(cp._triggers[0])
+        got = cp.parse_string(text)
+        self.assertEqual([x if isinstance(x, str) else x[0] for x in want],
+                         [x if isinstance(x, str) else x[0] for x in got])
+
+
 import doctest
 from ferenda import citationparser
 def load_tests(loader,tests,ignore):
@@ -21,7 +21,7 @@ import rdflib
 import requests.exceptions
 
 from ferenda.compat import Mock, patch, call, unittest
-from ferenda import DocumentEntry, Describer, Facet
+from ferenda import DocumentEntry, Describer, Facet, FulltextIndex
 from ferenda.fulltextindex import WhooshIndex
 from ferenda.errors import *
 
@@ -825,6 +825,28 @@ class Repo(RepoTester):
         self.assertTrue(mock_store.connect.called)
         self.assertTrue(mock_store.connect.return_value.get_serialized_file.called)
 
+    @patch('ferenda.documentrepository.TripleStore')
+    def test_relate_all_teardown_serialize(self, mock_store):
+        dumppath = self.datadir+"/base/distilled/dump.nt"
+        util.writefile(dumppath,
+                       '<http://localhost:8000/res/base/root> '
+                       '<http://purl.org/dc/terms/title> "Sacré bleu!" .\n')
+        config = LayeredConfig(Defaults({'datadir': self.datadir,
+                                         'url': 'http://localhost:8000/',
+                                         'force': False,
+                                         'storetype': 'a',
+                                         'storelocation': 'b',
+                                         'storerepository': 'c'}))
+        self.repoclass.relate_all_teardown(config)
+        want = rdflib.Graph().parse(dumppath, format="nt")
+        # the dump is serialized in every other format that the
+        # requesthandler supports
+        for suffix, format in (("ttl", "turtle"), ("rdf", "xml")):
+            got = rdflib.Graph().parse(self.datadir+"/base/distilled/dump."+suffix,
+                                format=format)
+            self.assertEqualGraphs(want, got)
+            self.assertFalse(os.path.exists(self.datadir+"/base/distilled/dump."+suffix+".tmp"))
+
     test_rdf_xml = b"""<?xml version="1.0" encoding="utf-8"?>
 <rdf:RDF
   xmlns:dcterms="http://purl.org/dc/terms/"
@@ -864,7 +886,7 @@ class Repo(RepoTester):
             self.repo.relate_triples("root")
             self.assertTrue(mock.called)  # ie a TripleStore class has been instantiated
             # add_serialized is a new MagicMock object
-            add_serialized = self.repo._triplestore.add_serialized
+            add_serialized = self.repo._get_triplestore().add_serialized
             self.assertTrue(add_serialized.called)
             got = add_serialized.call_args[0][0]
             format = add_serialized.call_args[1]['format']
@@ -873,6 +895,27 @@ class Repo(RepoTester):
                          got)
         self.assertEqual("xml", format)
 
+    def test_relate_triples_removesubjects(self):
+        data = self.test_rdf_xml.replace(b"</rdf:RDF>", b"""
+  <rdf:Description rdf:about="http://localhost:8000/res/base/root#S1">
+    <dcterms:isPartOf rdf:resource="http://localhost:8000/res/base/root"/>
+  </rdf:Description>
+  <rdf:Description rdf:about="http://localhost:8000/res/base/res-a">
+    <dcterms:title>Statement about another document</dcterms:title>
+  </rdf:Description>
+</rdf:RDF>""")
+        with self.repo.store.open_distilled('root', 'wb') as fp:
+            fp.write(data)
+        with patch('ferenda.documentrepository.TripleStore.connect'):
+            self.repo.relate_triples("root", removesubjects=True)
+            replace_subjects = self.repo._get_triplestore().replace_subjects
+            self.assertTrue(replace_subjects.called)
+        # only the document and its fragments are replaced
+        self.assertEqual(set(["http://localhost:8000/res/base/root",
+                              "http://localhost:8000/res/base/root#S1"]),
+                         replace_subjects.call_args[0][0])
+        self.assertEqual(data, replace_subjects.call_args[0][1])
+
     def test_relate_dependencies(self):
         # 1. create two docrepos A (self.repo?) and B
         class OtherRepo(DocumentRepository):
@@ -1068,6 +1111,58 @@ class RelateFulltext(RepoTester):
 
             
             
+    @patch('ferenda.documentrepository.TripleStore')
+    def test_spool(self, mock_store):
+        d = DocumentRepository(datadir=self.datadir,
+                               indexlocation=self.datadir+os.sep+"index",
+                               all=False)
+        self.put_files_in_place(d, "test/files/base", ["123/a"],
+                                distill=False,
+                                convert=True)
+        config = LayeredConfig(Defaults({'datadir': self.datadir,
+                                         'url': 'http://localhost:8000/',
+                                         'force': False,
+                                         'fulltextindex': True,
+                                         'indextype': 'WHOOSH',
+                                         'indexlocation': self.datadir+os.sep+"index",
+                                         'storetype': 'a',
+                                         'storelocation': 'b',
+                                         'storerepository': 'c'}))
+        self.assertTrue(d.relate_all_setup(config, otherrepos=[d]))
+        spooldir = self.datadir + "/base/fulltext/_spool"
+        self.assertTrue(os.path.exists(spooldir))
+        # while relating all, resources are spooled, not indexed
+        d.config.all = True
+        with patch.object(WhooshIndex,'update') as mock_method:
+            d.relate_fulltext("123/a", [d])
+            self.assertFalse(mock_method.called)
+        self.assertEqual(1, len(os.listdir(spooldir)))
+        # relating a single document indexes it directly, even if
+        # the spool directory exists
+        d.config.all = False
+        with patch.object(WhooshIndex,'update') as mock_method:
+            d.relate_fulltext("123/a", [d])
+            self.assertTrue(mock_method.called)
+        del d._fulltextindexer
+        self.assertEqual(1, len(os.listdir(spooldir)))
+        # at the end, everything is indexed and the spool removed
+        util.writefile(self.datadir+"/base/distilled/dump.nt", "example")
+        self.assertTrue(d.relate_all_teardown(config))
+        self.assertFalse(os.path.exists(spooldir))
+        index = FulltextIndex.connect("WHOOSH", self.datadir+os.sep+"index", [d])
+        self.assertEqual(4, index.doccount())
+        index.close()
+
+        # a spool left by an unfinished run is indexed by the next
+        # setup, before any new resources are spooled
+        d.config.all = True
+        util.mkdir(spooldir)
+        d.relate_fulltext("123/a", [d])
+        with patch.object(WhooshIndex, 'update') as mock_method:
+            d.relate_all_setup(config, otherrepos=[d])
+            self.assertEqual(4, mock_method.call_count)
+        self.assertFalse(os.path.exists(spooldir))
+
     # this tests DocRepo2, which has test data for all commonly
     # indexed datatypes
     def test_types(self):
@@ -1592,6 +1687,18 @@ class Storage(RepoTester):
                          basefiles)
 
 
+    def test_download_is_different(self):
+        existing = self.repo.store.downloaded_path("123/a")
+        new = self.p("base/downloaded/123/a.html.tmp")
+        util.writefile(existing, "Old content")
+        util.writefile(new, "New content")
+        self.assertTrue(self.repo.download_is_different(existing, new))
+        # the temporary file isn't recorded in the digest table
+        with patch("ferenda.util.file_md5", return_value="x") as mock_md5:
+            self.repo.store.digest(new)
+            self.assertTrue(mock_md5.called)
+
+
 class Archive(RepoTester):
     url_location = None
 
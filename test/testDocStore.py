@@ -8,7 +8,7 @@ import shutil
 import tempfile
 import time
 
-from ferenda.compat import unittest
+from ferenda.compat import unittest, patch
 
 #SUT
 from ferenda import DocumentStore
@@ -46,7 +46,57 @@ class Store(unittest.TestCase):
         self.assertEqual(os.stat(wanted_filename).st_mtime,
                          mtime)
 
-    
+    def test_digest(self):
+        filename = self.store.downloaded_path("123/a")
+        with self.store.open_downloaded("123/a", "wb") as fp:
+            fp.write(b"This is the data")
+        want = util.file_md5(filename)
+        # the digest was recorded when writing, so the file shouldn't
+        # be read again
+        with patch("ferenda.util.file_md5") as mock_md5:
+            self.assertEqual(want, self.store.digest(filename))
+            self.assertFalse(mock_md5.called)
+
+        # writing identical content doesn't replace the file
+        mtime = os.stat(filename).st_mtime
+        time.sleep(.1)
+        with self.store.open_downloaded("123/a", "wb") as fp:
+            fp.write(b"This is the data")
+        self.assertEqual(os.stat(filename).st_mtime, mtime)
+
+        # changes made outside of the store are detected
+        time.sleep(.1)
+        util.writefile(filename, "This is other data")
+        self.assertEqual(util.file_md5(filename), self.store.digest(filename))
+        self.assertNotEqual(want, self.store.digest(filename))
+        self.assertIsNone(self.store.digest(self.store.parsed_path("123/a")))
+
+    def test_prune_digests(self):
+        for basefile in ("123/a", "123/b", "123/c"):
+            with self.store.open_downloaded(basefile, "wb") as fp:
+                fp.write(basefile.encode())
+        os.unlink(self.store.downloaded_path("123/a"))
+        os.unlink(self.store.downloaded_path("123/b"))
+        # looking up a removed file forgets its digest
+        self.assertIsNone(self.store.digest(self.store.downloaded_path("123/a")))
+        self.assertEqual(1, self.store.prune_digests())
+        self.assertEqual(0, self.store.prune_digests())
+        self.assertEqual(util.file_md5(self.store.downloaded_path("123/c")),
+                         self.store.digest(self.store.downloaded_path("123/c")))
+
+    def test_replace_if_different(self):
+        filename = self.store.parsed_path("123/a")
+        tmpfile = self.datadir + "/tmp.xhtml"
+        util.writefile(tmpfile, "<html/>")
+        self.assertTrue(self.store.replace_if_different(tmpfile, filename))
+        self.assertFalse(os.path.exists(tmpfile))
+        util.writefile(tmpfile, "<html/>")
+        self.assertFalse(self.store.replace_if_different(tmpfile, filename))
+        self.assertFalse(os.path.exists(tmpfile))
+        util.writefile(tmpfile, "<html><body/></html>")
+        self.assertTrue(self.store.replace_if_different(tmpfile, filename))
+        self.assertEqual("<html><body/></html>", util.readfile(filename))
+
     def test_path(self):
         self.assertEqual(self.store.path("123","foo", ".bar"),
                          self.p("foo/123.bar"))
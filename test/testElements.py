@@ -92,6 +92,56 @@ class Main(unittest.TestCase):
         newdoc = deserialize(jsondoc, format="json")
         self.assertEqual(doc, newdoc)
 
+    def test_binary_roundtrip(self):
+        graph = Graph().parse(data="""@prefix dcterms: <http://purl.org/dc/terms/> .
+
+<http://example.org/1> dcterms:title "Hello world"@en .
+""", format="turtle")
+        tree = Body([Section([Paragraph(["Hello"]),
+                              Paragraph(["World"])],
+                             ordinal="1",
+                             title="Main section"),
+                     Section([42,
+                              date(2013,11,27),
+                              datetime(2013,11,27,12,0,0),
+                              b'bytestring',
+                              {'foo': 'bar',
+                               'x': Paragraph(['y'])}],
+                             ordinal=2,
+                             title="Native types"),
+                     Section([graph], meta=graph)])
+        serialized = serialize(tree, format="binary")
+        self.assertIsInstance(serialized, bytes)
+        newtree = deserialize(serialized, format="binary")
+        self.assertEqual(tree, newtree)
+        self.assertEqual(serialize(tree, format="json"),
+                         serialize(newtree, format="json"))
+        self.assertEqual(set(graph), set(newtree[2].meta))
+
+        # data from an incompatible version is rejected
+        serialized = serialized.replace(b"FERENDA-ELEMENTS\x00\x01",
+                                        b"FERENDA-ELEMENTS\x00\x00")
+        with self.assertRaises(ValueError):
+            deserialize(serialized, format="binary")
+
+    def test_binary_roundtrip_pdf(self):
+        from ferenda import PDFDocumentRepository, PDFReader
+        d = PDFDocumentRepository()
+        doc = d.make_document("sample")
+        os.utime("test/files/pdfreader/intermediate/sample.xml", None)
+        reader = PDFReader(filename="test/files/pdfreader/sample.pdf",
+                           workdir="test/files/pdfreader/intermediate")
+        d.parse_from_pdfreader(reader, doc)
+        newdoc = deserialize(serialize(doc, format="binary"), format="binary")
+        self.assertEqual(doc, newdoc)
+        # the result should be exactly the same as for a JSON
+        # roundtrip (the order of triples in the RDF/XML serialization
+        # of a graph isn't stable, so the graph is compared separately)
+        jsondoc = deserialize(serialize(doc, format="json"), format="json")
+        self.assertEqual(serialize(jsondoc.body, format="json"),
+                         serialize(newdoc.body, format="json"))
+        self.assertEqual(set(jsondoc.meta), set(newdoc.meta))
+
     def test_serialize_pyparsing(self):
         # these objects can't be roundtripped
         from ferenda.citationpatterns import url
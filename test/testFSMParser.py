@@ -358,4 +358,30 @@ class Parse(unittest.TestCase):
             self.run_test_file("test/files/fsmparser/basic.txt", debug=True)
             self.assertTrue(printmock.called)
 
+    def test_no_debug(self):
+        # with debug off, chunks should never be formatted for debug
+        # messages
+        with patch("ferenda.fsmparser.FSMParser._chunk_display") as displaymock:
+            self.run_test_file("test/files/fsmparser/basic.txt")
+            self.assertFalse(displaymock.called)
+
+    def test_applicable(self):
+        p, b = self.run_test_file("test/files/fsmparser/states.txt")
+        # recognizers should be ordered as in set_recognizers, not
+        # as in the transition table
+        self.assertEqual(["is_li_decimal", "is_section", "is_state_a",
+                          "is_paragraph"],
+                         [x.__name__ for x in p._applicable["body"]])
+        self.assertEqual(["is_li_roman", "is_li_alpha"],
+                         [x.__name__ for x in p._applicable["ol-roman"]])
+
+    def test_memoize(self):
+        for basefile in ("basic", "changestate", "nestedlist", "states"):
+            filename = "test/files/fsmparser/%s.txt" % basefile
+            p, b = self.run_test_file(filename)
+            with patch("ferenda.fsmparser.FSMParser.memoize", True):
+                p, memoized_b = self.run_test_file(filename)
+            self.assertEqual(elements.serialize(b),
+                             elements.serialize(memoized_b))
+
 file_parametrize(Parse,"test/files/fsmparser",".txt")
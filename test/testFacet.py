@@ -53,17 +53,73 @@ WHERE {
                   {"uri": "http://example.org/books/The_Lord_of_the_Rings",
                    "dcterms_title": "The Lord of the Rings"},
         ]
-        with patch('ferenda.DocumentRepository.facet_select', return_value=canned) as mock:
+        # facet_select might return any iterable, including a
+        # generator (duplicates are removed)
+        with patch('ferenda.DocumentRepository.facet_select',
+                   return_value=iter(canned + canned[:1])) as mock:
             faceted_data = self.repo.faceted_data()
-        self.assertEqual(faceted_data, canned)
-        self.assertTrue(os.path.exists(self.datadir + "/base/toc/faceted_data.json"))
+        self.assertEqual(list(faceted_data), canned)
+        self.assertEqual(2, len(faceted_data))
+        # the rows can be iterated over more than once
+        self.assertEqual(list(faceted_data), canned)
+        self.assertTrue(os.path.exists(self.datadir + "/base/toc/faceted_data.jsonl"))
         # on second run, faceted_data should be read from the cache
         # (if outfile_is_newer is called, we're far enough down in
         # that branch to know that the cache file is used if
         # outfile_is_newer returns True)
         with patch('ferenda.util.outfile_is_newer', return_value=True):
-            faceted_data = self.repo.faceted_data()
-        self.assertEqual(faceted_data, canned)
+            with patch('ferenda.DocumentRepository.facet_select') as mock:
+                faceted_data = self.repo.faceted_data()
+                self.assertFalse(mock.called)
+        self.assertEqual(list(faceted_data), canned)
+
+    def test_facet_statistics(self):
+        canned = [{"uri": "http://example.org/books/A_Tale_of_Two_Cities",
+                   "rdf_type": "http://purl.org/ontology/bibo/Book",
+                   "dcterms_issued": "1859-04-30"},
+                  {"uri": "http://example.org/books/The_Lord_of_the_Rings",
+                   "rdf_type": "http://purl.org/ontology/bibo/Book",
+                   "dcterms_issued": "1954-07-29"},
+                  {"uri": "http://example.org/books/The_Two_Towers",
+                   "rdf_type": "http://purl.org/ontology/bibo/Book",
+                   "dcterms_issued": "1954-11-11"}]
+        with patch('ferenda.DocumentRepository.faceted_data', return_value=canned):
+            stats = self.repo.facet_statistics()
+        self.assertTrue(os.path.exists(self.datadir + "/base/toc/facet_statistics.json"))
+        # one entry for each facet with a dimension_type, in order
+        self.assertEqual(['rdf_type', 'dcterms_publisher', 'dcterms_issued'],
+                         [x['binding'] for x in stats])
+        self.assertEqual([["bibo:Book", [canned[0]['uri'],
+                                         canned[1]['uri'],
+                                         canned[2]['uri']]]],
+                         stats[0]['postings'])
+        # no row has a publisher
+        self.assertEqual([], stats[1]['postings'])
+        self.assertEqual([["1859", [canned[0]['uri']]],
+                          ["1954", [canned[1]['uri'], canned[2]['uri']]]],
+                         sorted(stats[2]['postings']))
+        # on second run, the statistics should be read from the cache
+        with patch('ferenda.DocumentRepository.faceted_data') as mock:
+            self.assertEqual(stats, self.repo.facet_statistics())
+            self.assertFalse(mock.called)
+
+    def test_facet_resource_graph(self):
+        # the graph contains the extra data of all repos, whichever
+        # repo it's created from
+        from ferenda import DocumentRepository, ResourceLoader, util
+
+        class OtherRepo(DocumentRepository):
+            alias = "other"
+        other = OtherRepo(datadir=self.datadir)
+        resdir = self.datadir + "/res"
+        util.writefile(resdir + "/extra/other.ttl",
+                       '<http://example.org/publisher/O> '
+                       '<http://xmlns.com/foaf/0.1/name> "Other publisher" .')
+        other.resourceloader = ResourceLoader(resdir)
+        g = self.repo.facet_resource_graph([other])
+        self.assertIn(rdflib.Literal("Other publisher"), list(g.objects()))
+        self.assertEqual(len(self.repo.commondata) + 1, len(g))
+        self.assertEqual(sorted(g), sorted(other.facet_resource_graph([self.repo])))
 
     def test_year(self):
         self.assertEqual('2014',
@@ -7,7 +7,15 @@ from builtins import *
 # every line of code is run once, not to instantiate all different
 # implementations/configurations and run them all
 
+from future import standard_library
+standard_library.install_aliases()
+
 import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
 
 import requests.exceptions
 
@@ -16,8 +24,11 @@ from ferenda.compat import patch, Mock, unittest
 
 # SUT
 from ferenda import FulltextIndex, DocumentRepository
+from ferenda.fulltextindex import FulltextSpool
 from ferenda import fulltextindex
-from integrationFulltextIndex import BasicIndex, BasicQuery, ESBase
+from ferenda.errors import IndexingError
+from integrationFulltextIndex import (BasicIndex, BasicQuery, ESBase,
+                                      basic_dataset)
 
 CREATE_CANNED = False
 
@@ -144,8 +155,11 @@ class MockESBasicQuery(BasicQuery, MockESBase):
 
         can = canned(# (200, "count-0.json"),
                      (200, "count-4.json"),
+                     (200, "stats.json"),
                      (200, "schema.json"),
+                     (200, "stats.json"),
                      (200, "schema.json"),
+                     (200, "stats.json"),
                      (200, "schema.json"), # FIXME: This is embarrasing...
                      create=CREATE_CANNED, method="get")
         mock_requests.get.side_effect = can
@@ -164,6 +178,177 @@ class MockESBasicQuery(BasicQuery, MockESBase):
 
         super(MockESBasicQuery, self).test_fragmented()
 
+class MockESHandler(BaseHTTPRequestHandler):
+    # implements just enough of the ElasticSearch REST API for
+    # ElasticSearchIndex to be able to do bulk indexing
+    def _respond(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+
+    def do_GET(self):
+        if self.path == "/ferenda/_mapping/":
+            self._respond({"ferenda": {"mappings": {}}})
+        elif self.path == "/ferenda/_settings":
+            self._respond({"ferenda": {"settings": {"index": dict(self.server.settings)}}})
+        else:
+            self._respond({}, 404)
+
+    def do_PUT(self):
+        if self.path == "/ferenda/_settings":
+            self.server.settings.update(json.loads(self._body())["index"])
+            self._respond({"acknowledged": True})
+        elif self.path == "/ferenda/_bulk":
+            lines = self._body().splitlines()
+            self.server.bulks.append(len(lines) // 2)
+            items = []
+            for metadata, source in zip(lines[::2], lines[1::2]):
+                action = json.loads(metadata)["index"]
+                status = {"_index": "ferenda",
+                          "_type": action["_type"],
+                          "_id": action["_id"]}
+                if action["_id"] in self.server.failing:
+                    status["status"] = 400
+                    status["error"] = {"type": "mapper_parsing_exception",
+                                       "reason": "failed to parse"}
+                else:
+                    status["status"] = 201
+                    self.server.docs[action["_type"], action["_id"]] = json.loads(source)
+                items.append({"index": status})
+            self._respond({"took": 1,
+                           "errors": any("error" in i["index"] for i in items),
+                           "items": items})
+        else:
+            self._respond({}, 404)
+
+    def do_POST(self):
+        if self.path == "/ferenda/_refresh":
+            self.server.refreshes += 1
+            self._respond({"_shards": {}})
+        else:
+            self._respond({}, 404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ESBulk(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), MockESHandler)
+        self.server.settings = {"refresh_interval": "30s"}
+        self.server.bulks = []
+        self.server.docs = {}
+        self.server.failing = set()
+        self.server.refreshes = 0
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.start()
+        self.location = "http://127.0.0.1:%s/ferenda/" % self.server.server_port
+        self.index = FulltextIndex.connect("ELASTICSEARCH", self.location,
+                                           [DocumentRepository()])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_unbatched(self):
+        self.index.update(**basic_dataset[0])
+        self.index.commit()
+        self.assertEqual([1], self.server.bulks)
+        self.assertEqual(1, self.server.refreshes)
+
+    def test_batch(self):
+        self.index.batchsize = 2
+        self.index.start_batch()
+        self.assertEqual("-1", self.server.settings["refresh_interval"])
+        for doc in basic_dataset:
+            self.index.update(**doc)
+            self.index.commit()
+        # two full batches sent, no refreshing
+        self.assertEqual([2, 2], self.server.bulks)
+        self.assertEqual(0, self.server.refreshes)
+        self.index.end_batch()
+        self.assertEqual([2, 2, 1], self.server.bulks)
+        self.assertEqual(1, self.server.refreshes)
+        self.assertEqual("30s", self.server.settings["refresh_interval"])
+        self.assertEqual(4, len(self.server.docs))
+        self.assertEqual("First section",
+                         self.server.docs["base_child", "1s1"]["dcterms_title"])
+
+    def test_batch_default_interval(self):
+        # if no refresh interval was set, the default is restored
+        self.server.settings = {}
+        self.index.start_batch()
+        self.assertEqual("-1", self.server.settings["refresh_interval"])
+        self.index.end_batch()
+        self.assertIsNone(self.server.settings["refresh_interval"])
+
+    def test_batch_error(self):
+        # refreshing is restored even if the last bulk request fails
+        self.index.start_batch()
+        self.index.update(**basic_dataset[0])
+        self.index.commit()
+        with patch.object(self.index, "_bulk",
+                          side_effect=IndexingError("500 Server Error")):
+            with self.assertRaises(IndexingError):
+                self.index.end_batch()
+        self.assertEqual("30s", self.server.settings["refresh_interval"])
+        self.assertIsNone(self.index._batch)
+
+    def test_replay_error(self):
+        spooldir = tempfile.mkdtemp()
+        try:
+            spool = FulltextSpool(spooldir)
+            spool.update(**basic_dataset[0])
+            spool.commit()
+            with patch.object(self.index, "update",
+                              side_effect=IndexingError("failed")):
+                with self.assertRaises(IndexingError):
+                    spool.replay(self.index)
+            self.assertEqual("30s", self.server.settings["refresh_interval"])
+            self.assertEqual(1, len(os.listdir(spooldir)))
+        finally:
+            shutil.rmtree(spooldir)
+
+    def test_batchbytes(self):
+        self.index.batchbytes = 200
+        self.index.start_batch()
+        for doc in basic_dataset:
+            self.index.update(**doc)
+            self.index.commit()
+        self.index.end_batch()
+        # every doc is larger than 100 bytes, so requests contain at
+        # most two docs
+        self.assertLess(2, len(self.server.bulks))
+        self.assertEqual(5, sum(self.server.bulks))
+
+    def test_failures(self):
+        self.server.failing = set(["1s2"])
+        self.index.start_batch()
+        with patch.object(self.index.log, "error") as mock_error:
+            for doc in basic_dataset:
+                self.index.update(**doc)
+                self.index.commit()
+            # in batch mode, failures are logged (per document) but
+            # don't stop indexing
+            self.index.end_batch()
+            self.assertEqual(1, mock_error.call_count)
+            self.assertIn("base_child/1s2", mock_error.call_args[0][0])
+        self.assertEqual(3, len(self.server.docs))
+
+        # outside of batch mode, failures raise an error
+        self.index.update(**basic_dataset[2])
+        with self.assertRaises(IndexingError):
+            self.index.commit()
+
+
 class TestIndexedType(unittest.TestCase):
 
     def test_eq(self):
@@ -13,7 +13,7 @@ import rdflib
 from rdflib import RDF
 from rdflib.namespace import DCTERMS
 
-from ferenda.compat import Mock, MagicMock
+from ferenda.compat import Mock, MagicMock, patch
 from ferenda import util
 from ferenda.testutil import RepoTester
 
@@ -266,6 +266,59 @@ class News(RepoTester):
                                           archivesize=6)
 
 
+    def test_write_atom_incremental(self):
+        self.repo.faceted_data = Mock(return_value=self.faceted_data)
+        entries = sorted(list(self.repo.news_facet_entries()),
+                         key=itemgetter('updated'), reverse=True)
+        d = self.datadir
+        NS = "{http://www.w3.org/2005/Atom}"
+        # start with docs 0-18: main-archive-1 (0-5), main-archive-2
+        # (6-11), main (12-18)
+        self.repo.news_write_atom(entries[6:], 'New and updated documents',
+                                  'main', archivesize=6)
+        archive1 = '%s/base/feed/main-archive-1.atom' % d
+        self.assertTrue(os.path.exists(archive1))
+        self.assertFalse(os.path.exists('%s/base/feed/main-archive-3.atom' % d))
+        os.utime(archive1, (0, 0))
+
+        # adding docs 19-24 creates a new archive and changes the
+        # links of the second, but leaves the first one untouched
+        paths = self.repo.news_write_atom(entries, 'New and updated documents',
+                                          'main', archivesize=6)
+        self.assertEqual(4, len(paths))
+        self.assertEqual(0, os.path.getmtime(archive1))
+        tree = etree.parse('%s/base/feed/main-archive-2.atom' % d)
+        self.assertEqual(tree.find(NS+"link[@rel='next-archive']").get("href"),
+                         "main-archive-3.atom")
+        tree = etree.parse('%s/base/feed/main.atom' % d)
+        self.assertEqual(7, len(tree.findall(NS+"entry")))
+        self.assertEqual(tree.find(NS+"link[@rel='prev-archive']").get("href"),
+                         "main-archive-3.atom")
+
+        # updating doc #2 patches it into the first archive, even
+        # though it's no longer among the oldest entries
+        entries[-3]['title'] = 'Doc #2 (revised)'
+        self.repo.news_write_atom(entries, 'New and updated documents',
+                                  'main', archivesize=6)
+        self.assertNotEqual(0, os.path.getmtime(archive1))
+        tree = etree.parse(archive1)
+        self.assertEqual(6, len(tree.findall(NS+"entry")))
+        self.assertIn('Doc #2 (revised)',
+                      [e.text for e in tree.findall(NS+"entry/"+NS+"title")])
+
+        # a truncated manifest means that all archives are written
+        # again, and a new manifest is created
+        manifestfile = '%s/base/news/main.manifest.json' % d
+        self.assertFalse(os.path.exists(manifestfile + ".tmp"))
+        manifest = util.readfile(manifestfile)
+        util.writefile(manifestfile, manifest[:20])
+        with patch.object(self.repo.log, "warning") as mock_warning:
+            self.repo.news_write_atom(entries, 'New and updated documents',
+                                      'main', archivesize=6)
+            self.assertTrue(mock_warning.called)
+        self.assertEqual(json.loads(manifest),
+                         json.loads(util.readfile(manifestfile)))
+
     def test_write_atom_inline(self):
         self.repo.faceted_data = Mock(return_value=self.faceted_data)
         for basefile in range(25):
@@ -146,3 +146,32 @@ class Analyze(unittest.TestCase):
         self.assertTrue(pypdfmock.PdfFileReader.called)
         self.assertTrue(pypdfmock.PdfFileWriter.called)
         util.robust_remove(pdfpath)
+
+    def test_vectorized(self):
+        if not self.analyzer.use_vectorized():
+            self.skipTest("numpy not installed")
+        slow = PDFAnalyzer(self.pdf)
+        slow.vectorized = False
+        self.assertFalse(slow.use_vectorized())
+        for startpage, pagecount in ((0, 3), (1, 2), (1, 1), (2, 5)):
+            for method in ('count_horizontal_margins',
+                           'count_vertical_margins'):
+                fast_counters = getattr(self.analyzer, method)(startpage, pagecount)
+                slow_counters = getattr(slow, method)(startpage, pagecount)
+                self.assertEqual(list(slow_counters), list(fast_counters))
+                for key in slow_counters:
+                    # compare the order of items as well, since
+                    # most_common() depends on it
+                    self.assertEqual(list(slow_counters[key].items()),
+                                     list(fast_counters[key].items()))
+            self.assertEqual(list(slow.count_styles(startpage, pagecount).items()),
+                             list(self.analyzer.count_styles(startpage, pagecount).items()))
+        self.assertEqual(slow.metrics(), self.analyzer.metrics())
+
+    def test_vectorized_overridden_hook(self):
+        class CustomAnalyzer(PDFAnalyzer):
+            def count_styles_textbox(self, pagenumber, textbox, counter):
+                counter[(textbox.font.family, textbox.font.size)] += 1
+        analyzer = CustomAnalyzer(self.pdf)
+        self.assertFalse(analyzer.use_vectorized())
+        self.assertEqual(analyzer.count_styles(1, 1)[('Comic Sans MS', 14)], 36)
@@ -247,8 +247,55 @@ class=testManager.staticmockclass2
                         imgfiles=[]).make(api=False)
         self.assertEqual(want,got)
 
+    def test_incremental(self):
+        # test10: unchanged files aren't copied or created again
+        def make():
+            return Resources([staticmockclass()], self.tempdir+os.sep+'rsrc',
+                             cssfiles=[], jsfiles=[], imgfiles=[]).make(api=False)
+        got = make()
+        manifest = json.loads(util.readfile(self.tempdir+"/rsrc/manifest.json"))
+        self.assertEqual(util.file_md5(self.tempdir+"/test.css"),
+                         manifest["css/test.css"])
+        files = [self.tempdir+os.sep+f for f in got['css'] + got['js'] +
+                 got['img'] + got['xml']]
+        for f in files:
+            os.utime(f, (0, 0))
+        self.assertEqual(got, make())
+        for f in files:
+            self.assertEqual(0, os.path.getmtime(f), f)
+
+        # a changed file is copied, other files are left alone
+        util.writefile(self.tempdir+"/test.css", "/* changed test.css code */")
+        make()
+        self.assertEqual("/* changed test.css code */",
+                         util.readfile(self.tempdir+"/rsrc/css/test.css"))
+        self.assertEqual(0, os.path.getmtime(self.tempdir+"/rsrc/js/test.js"))
+
+        # force creates everything again
+        Resources([staticmockclass()], self.tempdir+os.sep+'rsrc',
+                  cssfiles=[], jsfiles=[], imgfiles=[], force=True).make(api=False)
+        for f in files:
+            self.assertNotEqual(0, os.path.getmtime(f), f)
+
+    def test_fingerprint(self):
+        # test11: css and js files get the digest of their contents in
+        # their names, images don't
+        s = os.sep
+        digest = util.file_md5(self.tempdir+"/test.css")[:8]
+        got = Resources([staticmockclass()], self.tempdir+os.sep+'rsrc',
+                        cssfiles=[], jsfiles=[], imgfiles=[],
+                        fingerprintresources=True).make(api=False)
+        self.assertEqual([s.join(['rsrc', 'css', 'test.%s.css' % digest])],
+                         got['css'])
+        self.assertRegex(got['js'][0], r'test\.[0-9a-f]{8}\.js$')
+        self.assertEqual([s.join(['rsrc', 'img', 'test.png'])], got['img'])
+        tree = ET.parse(self.tempdir+os.sep+got['xml'][0])
+        self.assertEqual('rsrc/css/test.%s.css' % digest,
+                         tree.find("stylesheets/link").get("href"))
+        self.assertTrue(os.path.exists(self.tempdir+os.sep+got['css'][0]))
+
     # def test_scss_transform(self):
-        # test10: scss files should be transformed to css
+        # test12: scss files should be transformed to css
         # disabled until pyScss is usable on py3 again
         # test = staticmockclass()
         # test.config.cssfiles[0] = test.config.cssfiles[0].replace("test.css", "transformed.scss")
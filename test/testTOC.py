@@ -120,6 +120,18 @@ class TOC(RepoTester):
         self.assertTrue(self.repo.toc_select_for_pages.called)
         self.assertTrue(self.repo.toc_generate_pages.called)
 
+        # rows read from the faceted_data cache are decoded once, and
+        # then passed as a list to the helper methods
+        rowsfile = self.datadir + "/rows.jsonl"
+        util.writefile(rowsfile, '{"uri": "http://example.org/1"}\n')
+        self.repo.faceted_data.return_value = util.JSONLines(rowsfile)
+        with patch('json.load'):
+            self.repo.toc()
+        self.assertEqual([{"uri": "http://example.org/1"}],
+                         self.repo.toc_pagesets.call_args[0][0])
+        self.assertIs(self.repo.toc_pagesets.call_args[0][0],
+                      self.repo.toc_select_for_pages.call_args[0][0])
+
     def test_toc_pagesets(self):
         got = self.repo.toc_pagesets(self.results1, self.facets)
         want = self.pagesets
@@ -230,6 +242,53 @@ class TOC(RepoTester):
         for path in paths:
             self.assertTrue(os.path.exists(path))
 
+    def test_generate_pages_incremental(self):
+        paths = self.repo.toc_generate_pages(self.documentlists,self.pagesets)
+        mtimes = dict([(p, os.path.getmtime(p)) for p in paths])
+        for p in paths:
+            os.utime(p, (mtimes[p] - 10, mtimes[p] - 10))
+        util.ensure_dir(self.p("rsrc/resources.xml"))
+        util.writefile(self.p("rsrc/resources.xml"), "<configuration/>")
+        os.utime(self.p("rsrc/resources.xml"), (mtimes[p] - 20, mtimes[p] - 20))
+
+        # change the documentlist for a single page
+        documentlists = copy.deepcopy(self.documentlists)
+        documentlists[('dcterms_issued', '1791')].append(
+            [Link("Another book", uri="http://example.org/books/Another_book")])
+        changed = self.p("base/toc/dcterms_issued/1791.html")
+        self.assertEqual(paths, self.repo.toc_generate_pages(documentlists, self.pagesets))
+        for p in paths:
+            if p == changed:
+                self.assertGreater(os.path.getmtime(p), mtimes[p] - 10)
+            else:
+                self.assertEqual(mtimes[p] - 10, os.path.getmtime(p))
+        self.assertIn("Another book", util.readfile(changed))
+
+        # changing the navigation changes all pages
+        pagesets = copy.deepcopy(self.pagesets)
+        pagesets[1].pages.pop()
+        for p in paths:
+            os.utime(p, (mtimes[p] - 10, mtimes[p] - 10))
+        self.repo.toc_generate_pages(documentlists, pagesets)
+        for p in paths:
+            self.assertGreater(os.path.getmtime(p), mtimes[p] - 10)
+
+        # and so does changing the templates (here, pages that are
+        # older than the templates shipped with ferenda)
+        os.utime(self.p("rsrc/resources.xml"), (0, 0))
+        for p in paths:
+            os.utime(p, (0, 0))
+        self.repo.toc_generate_pages(documentlists, pagesets)
+        for p in paths:
+            self.assertGreater(os.path.getmtime(p), 0)
+
+    def test_generate_pages_parallel(self):
+        self.repo.config.processes = 2
+        paths = self.repo.toc_generate_pages(self.documentlists,self.pagesets)
+        self.assertEqual(len(paths), 10)
+        for path in paths:
+            self.assertTrue(os.path.exists(path))
+
     def test_generate_first_page(self):
         path = self.repo.toc_generate_first_page(self.documentlists,self.pagesets)
         self.assertEqual(path, self.p("base/toc/index.html"))
@@ -11,6 +11,7 @@ from builtins import *
 # idempotent), that is sort of unavoidable.
 
 import json
+from io import BytesIO
 import re
 import os
 import sqlite3
@@ -27,6 +28,10 @@ from ferenda.testutil import FerendaTestCase
 
 # SUT
 from ferenda import TripleStore
+try:
+    from ferenda.thirdparty import SQLite
+except ImportError:
+    SQLite = None
 
 
 # FIXME: we could have a switch in canned() that, if set, actually
@@ -43,6 +48,7 @@ def canned(*responses):
         if responsefile:
             responsefile = "test/files/triplestore/" + responsefile
             resp.content = util.readfile(responsefile, "rb")
+            resp.raw = BytesIO(resp.content)
             resp.text = util.readfile(responsefile)
             if responsefile.endswith(".json"):
                 data = json.loads(util.readfile(responsefile))
@@ -231,6 +237,7 @@ class Main(unittest.TestCase, FerendaTestCase):
    
     @patch('requests.get', side_effect=canned((200, "select-results.xml"),
                                               (200, "select-results.json"),
+                                              (200, "select-results.xml"),
                                               (200, "select-results.xml")))
     def test_sesame_select(self, mock_get):
         store = TripleStore.connect("SESAME", "", "")
@@ -250,12 +257,39 @@ class Main(unittest.TestCase, FerendaTestCase):
         self.assertEqual(want, got)
         self.assertEqual(mock_get.call_count, 3)
 
+        # the streaming variant gives the same rows, parsed from the
+        # raw response
+        got = store.select("the-query", format="iterator")
+        self.assertFalse(isinstance(got, list))
+        self.assertEqual(want, list(got))
+        self.assertTrue(mock_get.call_args[1]['stream'])
+
         with self.assertRaises(errors.TriplestoreError):
             mockresponse = Mock()
             mockresponse.text = "This is the actual error text"
             mock_get.side_effect = requests.exceptions.HTTPError("Server error", response=mockresponse)
             got = store.select("the-query", format="python")
     
+    @patch('requests.post', side_effect=canned((204, None),
+                                               (204, None),
+                                               (204, None)))
+    def test_sesame_replace_subjects(self, mock_post):
+        store = TripleStore.connect("SESAME", "", "")
+        store.replace_batchsize = 2
+        store.replace_subjects(["http://example.org/doc1",
+                                "http://example.org/doc2",
+                                "http://example.org/doc3"],
+                               util.readfile("test/files/triplestore/namedgraph.nt"),
+                               format="nt", context="http://example.org/ctx")
+        # two DELETE queries, then the actual upload
+        self.assertEqual(mock_post.call_count, 3)
+        query = mock_post.call_args_list[0][1]['data']['update']
+        self.assertIn("GRAPH <http://example.org/ctx>", query)
+        self.assertIn("VALUES ?s { <http://example.org/doc1> <http://example.org/doc2> }",
+                      query)
+        query = mock_post.call_args_list[1][1]['data']['update']
+        self.assertIn("VALUES ?s { <http://example.org/doc3> }", query)
+
     @patch('requests.get', side_effect=canned((200, "construct-results.ttl")))
     def test_sesame_construct(self, mock_get):
         store = TripleStore.connect("SESAME", "", "")
@@ -339,7 +373,63 @@ class Main(unittest.TestCase, FerendaTestCase):
     @patch('ferenda.triplestore.ConjunctiveGraph')
     def test_sqlite_triple_count(self, mock_graph):
         store = TripleStore.connect("SQLITE", "", "")
+        # the statements are counted directly in the tables of the
+        # underlying SQLite store
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE x_type_statements (member, klass, context)")
+        db.execute("CREATE TABLE x_asserted_statements (subject, predicate, object, context)")
+        db.execute("CREATE TABLE x_literal_statements (subject, predicate, object, context, objLanguage, objDatatype)")
+        mock_graph.return_value.store._db = db
+        mock_graph.return_value.store._internedId = "x"
         self.assertEqual(0, store.triple_count())
+        self.assertEqual(0, store.triple_count("http://example.org/ctx1"))
+
+        for ctx in ("http://example.org/ctx1", "http://example.org/ctx2"):
+            db.execute("INSERT INTO x_type_statements VALUES (?, ?, ?)",
+                       ("http://example.org/doc1", "http://example.org/Doc", ctx))
+            db.execute("INSERT INTO x_literal_statements VALUES (?, ?, ?, ?, ?, ?)",
+                       ("http://example.org/doc1", str(RDFS.label), "Doc 1", ctx, "en", None))
+        db.execute("INSERT INTO x_asserted_statements VALUES (?, ?, ?, ?)",
+                   ("http://example.org/doc1", str(RDFS.seeAlso),
+                    "http://example.org/doc2", "http://example.org/ctx1"))
+        self.assertEqual(3, store.triple_count("http://example.org/ctx1"))
+        self.assertEqual(2, store.triple_count("http://example.org/ctx2"))
+        # statements in several contexts are only counted once
+        self.assertEqual(3, store.triple_count())
+
+        # if the tables can't be queried, the statements are counted
+        # by iterating over them
+        db.execute("DROP TABLE x_literal_statements")
+        mock_graph.return_value.get_context.return_value.__iter__ = \
+            Mock(return_value=iter([1, 2]))
+        with patch('ferenda.triplestore.logging'):
+            self.assertEqual(2, store.triple_count("http://example.org/ctx1"))
+        del mock_graph.return_value.store._db
+        mock_graph.return_value.__iter__ = Mock(return_value=iter([1, 2, 3, 4]))
+        with patch('ferenda.triplestore.logging'):
+            self.assertEqual(4, store.triple_count())
+
+    @unittest.skipIf(SQLite is None, "SQLite store not available")
+    def test_sqlite_triple_count_real(self):
+        # check the counts against the real store, if available
+        tmpdir = mkdtemp()
+        try:
+            store = TripleStore.connect("SQLITE", tmpdir + "/ferenda.sqlite",
+                                        "ferenda")
+            store.add_serialized(
+                util.readfile("test/files/datasets/dataset2.nt"),
+                format="nt", context="http://example.org/ctx1")
+            store.add_serialized(
+                util.readfile("test/files/datasets/dataset.nt"),
+                format="nt", context="http://example.org/ctx2")
+            for context in ("http://example.org/ctx1",
+                            "http://example.org/ctx2", None):
+                self.assertEqual(
+                    len(list(store._getcontextgraph(context))),
+                    store.triple_count(context))
+            store.close()
+        finally:
+            shutil.rmtree(tmpdir)
 
     @patch('ferenda.triplestore.ConjunctiveGraph')
     def test_sqlite_select(self, mock_graph):
@@ -351,6 +441,7 @@ class Main(unittest.TestCase, FerendaTestCase):
                  "o": "Hello"}]
         res.bindings = want
         self.assertEqual(want, store.select(sq, format="python"))
+        self.assertEqual(want, list(store.select(sq, format="iterator")))
         mock_graph.reset_mock()
         store.select(sq, "sparql")
         mock_graph.return_value.get_context.return_value.query.return_value.serialize.assert_called_with(format="xml")
@@ -388,8 +479,55 @@ class Main(unittest.TestCase, FerendaTestCase):
         g.add((URIRef("http://example.org/doc2"), RDFS.comment, Literal("Ho")))
         mock_graph.return_value.get_context.return_value = g
         store.clear("namedgraph")
-        self.assertEqual(2, mock_graph.return_value.remove.call_count)
+        # the entire context is removed in one call
+        mock_graph.return_value.remove_context.assert_called_once_with(g)
+        self.assertEqual(0, mock_graph.return_value.remove.call_count)
         self.assertEqual(1, mock_graph.return_value.commit.call_count)
+
+        store.clear()
+        mock_graph.return_value.remove.assert_called_once_with((None, None, None))
+        self.assertEqual(2, mock_graph.return_value.commit.call_count)
+
+    def test_rdflib_replace(self):
+        # test the replace methods against a real (in-memory) rdflib
+        # store
+        from ferenda.triplestore import RDFLibStore
+
+        class MemoryStore(RDFLibStore):
+            def _storeid(self):
+                return "IOMemory"
+
+        store = MemoryStore("", "")
+        doc1 = URIRef("http://example.org/doc1")
+        doc2 = URIRef("http://example.org/doc2")
+        store.add_serialized(
+            "<%s> <%s> \"Doc 1\" .\n<%s> <%s> \"Doc 2\" .\n" %
+            (doc1, RDFS.label, doc2, RDFS.label), "nt", "http://example.org/ctx1")
+        store.add_serialized("<%s> <%s> \"Doc 1\" .\n" % (doc1, RDFS.label),
+                             "nt", "http://example.org/ctx2")
+        self.assertEqual(2, store.triple_count())
+        self.assertEqual(2, store.triple_count("http://example.org/ctx1"))
+
+        store.replace_subjects([doc1], "<%s> <%s> \"New doc 1\" .\n" % (doc1, RDFS.comment),
+                               "nt", "http://example.org/ctx1")
+        ctx1 = store.graph.get_context(URIRef("http://example.org/ctx1"))
+        self.assertEqual(set([(doc1, RDFS.comment, Literal("New doc 1")),
+                              (doc2, RDFS.label, Literal("Doc 2"))]),
+                         set(ctx1))
+        # other contexts are unaffected
+        self.assertEqual(1, store.triple_count("http://example.org/ctx2"))
+
+        store.replace_serialized("<%s> <%s> \"Doc 2\" .\n" % (doc2, RDFS.label),
+                                 "nt", "http://example.org/ctx2")
+        self.assertEqual(2, store.triple_count("http://example.org/ctx1"))
+        self.assertEqual(set([(doc2, RDFS.label, Literal("Doc 2"))]),
+                         set(store.graph.get_context(URIRef("http://example.org/ctx2"))))
+
+        store.clear("http://example.org/ctx1")
+        self.assertEqual(0, store.triple_count("http://example.org/ctx1"))
+        self.assertEqual(1, store.triple_count("http://example.org/ctx2"))
+        store.clear()
+        self.assertEqual(0, store.triple_count())
         
     @patch('ferenda.triplestore.ConjunctiveGraph')
     def test_sqlite_initialize_triplestore(self, mock_graph):
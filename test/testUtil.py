@@ -4,6 +4,7 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import tempfile
+import threading
 import shutil
 import os
 import sys
@@ -137,6 +138,71 @@ class Main(unittest.TestCase):
         # test 3: dst does exist, is identical
         self.assertFalse(util.copy_if_different(self.fname, self.fname2))
 
+    def test_writefile_atomic(self):
+        util.writefile_atomic(self.fname, b"one")
+        util.writefile_atomic(self.fname, b"two")
+        self.assertEqual("two", util.readfile(self.fname))
+        self.assertEqual([os.path.basename(self.fname)],
+                         os.listdir(os.path.dirname(self.fname)))
+        # if writing fails, the old file is kept and the temporary
+        # file is removed
+        with self.assertRaises(TypeError):
+            util.writefile_atomic(self.fname, "not bytes")
+        self.assertEqual("two", util.readfile(self.fname))
+        self.assertEqual([os.path.basename(self.fname)],
+                         os.listdir(os.path.dirname(self.fname)))
+
+    def test_perthread(self):
+        closed = []
+        objs = util.PerThread(object, close=closed.append)
+        obj = objs.get()
+        self.assertIs(obj, objs.get())
+        # each thread gets its own object, which is closed when the
+        # thread finishes
+        other = []
+        t = threading.Thread(target=lambda: other.append(objs.get()))
+        t.start()
+        t.join()
+        del t
+        self.assertIsNot(obj, other[0])
+        self.assertEqual(other, closed)
+        # a forked process creates new objects, but doesn't close
+        # those of its parent
+        with patch('ferenda.util.os.getpid', return_value=-1):
+            forked = objs.get()
+            self.assertIsNot(obj, forked)
+            objs.close_all()
+        self.assertEqual([other[0], forked], closed)
+
+    def test_load_graph(self):
+        util.writefile(self.fname, "<http://example.org/1> <http://purl.org/dc/terms/title> \"One\" .")
+        util.writefile(self.fname2, "<http://example.org/2> <http://purl.org/dc/terms/title> \"Two\" .")
+        cachedir = self.datadir + os.sep + "cache"
+        g = util.load_graph([self.fname, self.fname2], cachedir=cachedir)
+        self.assertEqual(2, len(g))
+        self.assertEqual(1, len(os.listdir(cachedir)))
+        # each call returns a separate graph
+        g.remove((None, None, None))
+        self.assertEqual(2, len(util.load_graph([self.fname, self.fname2])))
+        # a new process (or an empty process-wide cache) uses the
+        # pickle in cachedir, without parsing the files
+        with patch('ferenda.util._graphs', {}):
+            with patch('rdflib.Graph.parse') as mockparse:
+                g = util.load_graph([self.fname, self.fname2], cachedir=cachedir)
+                self.assertFalse(mockparse.called)
+        self.assertEqual(2, len(g))
+        # changed content means a different graph
+        util.writefile(self.fname2, "<http://example.org/2> <http://purl.org/dc/terms/title> \"Three\" .")
+        g = util.load_graph([self.fname, self.fname2], cachedir=cachedir)
+        self.assertEqual(["One", "Three"], sorted(str(o) for o in g.objects()))
+        self.assertEqual(2, len(os.listdir(cachedir)))
+        # a corrupt pickle is ignored
+        for f in os.listdir(cachedir):
+            util.writefile(cachedir + os.sep + f, "garbage")
+        with patch('ferenda.util._graphs', {}):
+            g = util.load_graph([self.fname, self.fname2], cachedir=cachedir)
+        self.assertEqual(2, len(g))
+
 
 from ferenda import util
 import doctest
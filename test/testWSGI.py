@@ -9,14 +9,17 @@ import datetime
 import json
 import os
 import shutil
+import threading
 
 from lxml import etree
-from rdflib import Graph
+from rdflib import Graph, URIRef
 
 from ferenda.compat import Mock, patch
 from ferenda import manager, util, fulltextindex
 from ferenda.elements import html
 from ferenda.testutil import RepoTester
+from ferenda.wsgiapp import RouteTable
+from ferenda import DocumentRepository, RequestHandler
 
 # tests the wsgi app in-process, ie not with actual HTTP requests, but
 # simulates what make_server().serve_forever() would send and
@@ -223,6 +226,177 @@ class Fileserving(WSGI):
                             status, headers, content)
 
 
+    def test_validators(self):
+        status, headers, content = self.call_wsgi(self.env)
+        headers = dict(headers)
+        self.assertEqual(util.file_etag(self.datadir + "/index.html"),
+                         headers['ETag'])
+        self.assertIn('Last-Modified', headers)
+        self.assertNotIn('Cache-Control', headers)
+
+        # a conditional request for an unchanged file
+        env = dict(self.env)
+        env['HTTP_IF_NONE_MATCH'] = headers['ETag']
+        status, newheaders, content = self.call_wsgi(env)
+        self.assertResponse("304 Not Modified",
+                            {'ETag': headers['ETag']},
+                            None,
+                            status, newheaders, content)
+        self.assertEqual(b'', content)
+
+        env = dict(self.env)
+        env['HTTP_IF_MODIFIED_SINCE'] = headers['Last-Modified']
+        status, newheaders, content = self.call_wsgi(env)
+        self.assertEqual("304 Not Modified", status)
+
+        # a conditional request for a changed file
+        env = dict(self.env)
+        env['HTTP_IF_NONE_MATCH'] = '"0-0"'
+        env['HTTP_IF_MODIFIED_SINCE'] = headers['Last-Modified']
+        status, newheaders, content = self.call_wsgi(env)
+        self.assertResponse("200 OK", {}, b'<h1>index.html</h1>',
+                            status, newheaders, content)
+
+        env = dict(self.env)
+        env['HTTP_IF_MODIFIED_SINCE'] = 'Sat, 01 Jan 2000 00:00:00 GMT'
+        status, newheaders, content = self.call_wsgi(env)
+        self.assertEqual("200 OK", status)
+
+    def test_range(self):
+        self.env['HTTP_RANGE'] = 'bytes=4-13'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertResponse("206 Partial Content",
+                            {'Content-Range': 'bytes 4-13/19',
+                             'Content-Length': '10'},
+                            b'index.html',
+                            status, headers, content)
+
+        self.env['HTTP_RANGE'] = 'bytes=-5'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertResponse("206 Partial Content",
+                            {'Content-Range': 'bytes 14-18/19'},
+                            b'</h1>',
+                            status, headers, content)
+
+        self.env['HTTP_RANGE'] = 'bytes=19-'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertResponse("416 Range Not Satisfiable",
+                            {'Content-Range': 'bytes */19'},
+                            None,
+                            status, headers, content)
+
+        # a Range request for a changed file returns all of it
+        self.env['HTTP_RANGE'] = 'bytes=4-13'
+        self.env['HTTP_IF_RANGE'] = '"0-0"'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertResponse("200 OK", {}, b'<h1>index.html</h1>',
+                            status, headers, content)
+
+    def test_cachecontrol(self):
+        self.app.config.cachecontrol = ['text/html: no-cache']
+        self.repo.config.cachecontrol = ['application/pdf: max-age=86400',
+                                         'text/*: max-age=60']
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual('no-cache', dict(headers)['Cache-Control'])
+        # files served by a repo use the config of that repo
+        self.env['PATH_INFO'] = '/res/base/123/a'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual("200 OK", status)
+        self.assertEqual('max-age=60', dict(headers)['Cache-Control'])
+
+    def test_vary(self):
+        # static files aren't negotiated...
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertNotIn('Vary', dict(headers))
+        # ...but files served by a repo are, for every kind of response
+        self.env['PATH_INFO'] = '/res/base/123/a'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual("200 OK", status)
+        self.assertEqual('Accept', dict(headers)['Vary'])
+        etag = dict(headers)['ETag']
+        env = dict(self.env)
+        env['HTTP_IF_NONE_MATCH'] = etag
+        status, headers, content = self.call_wsgi(env)
+        self.assertResponse("304 Not Modified", {'Vary': 'Accept'}, None,
+                            status, headers, content)
+        env = dict(self.env)
+        env['HTTP_RANGE'] = 'bytes=0-3'
+        status, headers, content = self.call_wsgi(env)
+        self.assertResponse("206 Partial Content", {'Vary': 'Accept'}, None,
+                            status, headers, content)
+
+
+class Routing(WSGI):
+    def _repo(self, alias, handlerclass=None):
+        repo = DocumentRepository(datadir=self.datadir, alias=alias)
+        repo.alias = alias
+        if handlerclass:
+            repo.requesthandler = handlerclass(repo)
+        return repo
+
+    def test_default_routes(self):
+        repos = [self._repo("base"), self._repo("other")]
+        table = RouteTable(repos)
+        self.assertEqual([], table.fallback)
+        self.assertEqual([], table.conflicts)
+        for path in ("/res/base/123/a", "/dataset/base", "/dataset/base.rdf",
+                     "/dataset/base?title=a", "/dataset/base/feed.atom",
+                     "/res/other/1", "/dataset/other.ttl", "/base/123",
+                     "/res/basement/1", "/dataset/base.x.y", "/res",
+                     "/", "/rsrc/css/ferenda.css"):
+            self.assertEqual([i for (i, repo) in enumerate(repos) if
+                              repo.requesthandler.supports({'PATH_INFO': path})],
+                             table.lookup(path), path)
+
+    def test_custom_routes(self):
+        class PrefixHandler(RequestHandler):
+            def supports(self, environ):
+                return environ['PATH_INFO'].startswith("/prefix/")
+            def routes(self):
+                return ["/prefix/"]
+
+        class UnroutedHandler(RequestHandler):
+            def supports(self, environ):
+                return environ['PATH_INFO'].startswith("/unrouted/")
+
+        repos = [self._repo("base"),
+                 self._repo("prefix", PrefixHandler),
+                 self._repo("unrouted", UnroutedHandler)]
+        table = RouteTable(repos)
+        self.assertEqual([2], table.fallback)
+        self.assertEqual([1, 2], table.lookup("/prefix/123"))
+        self.assertEqual([2], table.lookup("/prefix"))
+        self.assertEqual([0, 2], table.lookup("/res/base/123"))
+
+    def test_conflicts(self):
+        class PrefixHandler(RequestHandler):
+            def routes(self):
+                return ["/res/base/"]
+        log = Mock()
+        repos = [self._repo("base"), self._repo("prefix", PrefixHandler),
+                 self._repo("base")]
+        table = RouteTable(repos, log)
+        self.assertEqual([("base", "prefix", "/res/base/"),
+                          ("base", "base", repos[0].requesthandler.routes()[0].pattern),
+                          ("prefix", "base", "/res/base/")],
+                         table.conflicts)
+        self.assertEqual(3, log.warning.call_count)
+        # all claimants are returned, in order
+        self.assertEqual([0, 1, 2], table.lookup("/res/base/123/a"))
+
+    def test_fallthrough(self):
+        # the first repo claims the path, but has no file for it, so
+        # the next repo that claims the path gets a shot
+        first = self._repo("base")
+        first.requesthandler.handle = Mock(return_value=(None, None, None, None))
+        self.app.repos = [first, self.repo]
+        self.app.routes = RouteTable(self.app.repos)
+        self.env['PATH_INFO'] = '/res/base/123/a'
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual("200 OK", status)
+        self.assertEqual(1, first.requesthandler.handle.call_count)
+
+
 # most parts of the API are tested with integrationAPI
 class API(WSGI):
     def setUp(self):
@@ -289,6 +463,24 @@ class API(WSGI):
         with patch('ferenda.wsgiapp.FulltextIndex', **config):
             status, headers, content = self.call_wsgi(self.env)
             config['connect.return_value'].query.assert_called_once_with(**want)
+
+    def test_persistent_index(self):
+        res = ([], {'firstresult': 1,
+                    'totalresults': 0})
+        config = {'connect.return_value':
+                  Mock(**{'query.return_value': res,
+                          'schema.return_value': {}})}
+        with patch('ferenda.wsgiapp.FulltextIndex', **config) as mock_index:
+            self.call_wsgi(self.env)
+            self.call_wsgi(self.env)
+            # the index is opened once and then reused
+            self.assertEqual(1, mock_index.connect.call_count)
+            self.assertEqual(2, config['connect.return_value'].query.call_count)
+            # but a forked process opens its own
+            with patch('ferenda.wsgiapp.os.getpid', return_value=-1):
+                self.call_wsgi(self.env)
+            self.assertEqual(2, mock_index.connect.call_count)
+
     # this is the same data that can be extracted from
     # test/files/base/distilled/
     fakedata = [{'dcterms_identifier': '123(A)',
@@ -318,6 +510,78 @@ class API(WSGI):
         want = json.load(open("test/files/api/basicapi-stats.json"))
         self.assertEqual(want, got)
 
+    def test_stats_resultset(self):
+        self.app.repos[0].faceted_data = Mock(return_value=self.fakedata)
+        got = self.app.stats([{'iri': 'http://example.org/base/123/b'},
+                              {'iri': 'http://example.org/base/123/c'}])
+        want = {"type": "DataSet",
+                "slices": [{"dimension": "rdf_type",
+                            "observations": [{"count": 2, "term": "bibo:Standard"}]},
+                           {"dimension": "dcterms_publisher",
+                            "observations": [{"count": 2, "ref": "http://example.org/publisher/B"}]},
+                           {"dimension": "dcterms_issued",
+                            "observations": [{"count": 1, "year": "2013"},
+                                             {"count": 1, "year": "2014"}]}]}
+        self.assertEqual(want, got)
+
+    def test_stats_precomputed(self):
+        self.env['PATH_INFO'] += ";stats"
+        self.app.repos[0].faceted_data = Mock(return_value=self.fakedata)
+        cachepath = self.app.repos[0].store.resourcepath("toc/facet_statistics.json")
+        # without precomputed statistics, they're calculated on each
+        # request, but not stored
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual(1, self.app.repos[0].faceted_data.call_count)
+        self.assertFalse(os.path.exists(cachepath))
+        want = json.load(open("test/files/api/basicapi-stats.json"))
+        self.assertEqual(want, json.loads(content.decode("utf-8")))
+        # once toc has computed them...
+        self.app.repos[0].facet_statistics()
+        self.assertEqual(2, self.app.repos[0].faceted_data.call_count)
+        status, headers, content = self.call_wsgi(self.env)
+        # ...they are kept in memory by the app...
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual(2, self.app.repos[0].faceted_data.call_count)
+        got = json.loads(content.decode("utf-8"))
+        want = json.load(open("test/files/api/basicapi-stats.json"))
+        self.assertEqual(want, got)
+        # ...until they are recomputed (eg. by a new toc run)
+        self.app.repos[0].faceted_data = Mock(return_value=self.fakedata[:1])
+        self.app.repos[0].config.force = True
+        self.app.repos[0].facet_statistics()
+        os.utime(cachepath, (0, 0))
+        status, headers, content = self.call_wsgi(self.env)
+        got = json.loads(content.decode("utf-8"))
+        self.assertEqual([{"count": 1, "year": "2014"}],
+                         got["slices"][2]["observations"])
+
+    def test_stats_changed_facets(self):
+        # statistics stored by an earlier toc run, before a facet was
+        # added and the others were reordered, are matched to the
+        # facets by rdftype and binding
+        self.env['PATH_INFO'] += ";stats"
+        repo = self.app.repos[0]
+        repo.faceted_data = Mock(return_value=self.fakedata)
+        stats = repo.facet_statistics()
+        cachepath = repo.store.resourcepath("toc/facet_statistics.json")
+        with open(cachepath, "w") as fp:
+            json.dump(list(reversed(stats[1:])), fp)
+        status, headers, content = self.call_wsgi(self.env)
+        got = json.loads(content.decode("utf-8"))
+        want = json.load(open("test/files/api/basicapi-stats.json"))
+        self.assertEqual(want, got)
+        # the missing facet was calculated from faceted_data
+        self.assertEqual(2, repo.faceted_data.call_count)
+
+    def test_stats_resource_graph(self):
+        # facet selectors get the extra data of all repos, and the
+        # namespaces of all repos, in one graph that's only loaded once
+        g = self.app.resource_graph
+        self.assertIs(g, self.app.resource_graph)
+        self.assertEqual(len(self.app.repos[0].commondata), len(g))
+        self.assertIn(("bibo", URIRef("http://purl.org/ontology/bibo/")),
+                      list(g.namespaces()))
+
     def test_stats_legacy(self):
         self.env['PATH_INFO'] += ";stats"
         self.app.config.legacyapi = True
@@ -727,6 +991,56 @@ class ConNeg(WSGI):
         gotgraph.parse(data=content, format="xml")
         self.assertEqualGraphs(wantgraph, gotgraph)
 
+    def test_dataset_preserialized(self):
+        # if relate_all_teardown has serialized the dump in the
+        # requested format, that file is served as-is
+        self.repoclass._serialize_dump(
+            self.repo.store.resourcepath("distilled/dump.nt"), self.repo.log)
+        dumppath = self.repo.store.resourcepath("distilled/dump.ttl")
+        self.assertTrue(os.path.exists(dumppath))
+        self.env['PATH_INFO'] = "/dataset/base.ttl"
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertResponse("200 OK",
+                            {'Content-Type': 'text/turtle',
+                             'ETag': util.file_etag(dumppath)},
+                            util.readfile(dumppath, "rb"),
+                            status, headers, content)
+        # but not if the dump has changed since
+        os.utime(dumppath, (0, 0))
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual("200 OK", status)
+        self.assertNotIn('ETag', dict(headers))
+
+    def test_serialized_sidecar(self):
+        self.env['PATH_INFO'] = "/res/base/123/a.ttl"
+        status, headers, content = self.call_wsgi(self.env)
+        self.assertEqual("200 OK", status)
+        sidecar = self.repo.store.path("123/a", "serialized", ".ttl")
+        self.assertEqual(util.readfile(sidecar, "rb"), content)
+        # the next request is served from the sidecar file, without
+        # parsing the distilled file
+        with patch('ferenda.requesthandler.Graph') as mock_graph:
+            status, headers, newcontent = self.call_wsgi(self.env)
+            self.assertFalse(mock_graph.called)
+        self.assertEqual(content, newcontent)
+        # until the distilled file changes
+        os.utime(sidecar, (0, 0))
+        with patch('ferenda.requesthandler.Graph') as mock_graph:
+            mock_graph.return_value.serialize.side_effect = \
+                lambda fp, format: fp.write(b"new")
+            status, headers, newcontent = self.call_wsgi(self.env)
+            self.assertTrue(mock_graph.called)
+        self.assertEqual(b"new", newcontent)
+        # if the sidecar can't be written (eg. a read-only datadir),
+        # the statements are serialized for this request only
+        os.utime(sidecar, (0, 0))
+        with patch('ferenda.requesthandler.tempfile.mkstemp',
+                   side_effect=OSError("Permission denied")):
+            status, headers, newcontent = self.call_wsgi(self.env)
+        self.assertEqual("200 OK", status)
+        self.assertEqual(content, newcontent)
+        self.assertEqual(b"new", util.readfile(sidecar, "rb"))
+
 class Search(WSGI):
 
     def setUp(self):
@@ -753,6 +1067,58 @@ class Search(WSGI):
         self.assertEqual("1 match for 'subsection'", resulthead)
 
 
+    def test_search_transformer_thread(self):
+        # a transformer made for a thread is closed, and its template
+        # dir removed, when the thread finishes
+        transformers = []
+        t = threading.Thread(
+            target=lambda: transformers.append(self.app._search_transformer()))
+        t.start()
+        t.join()
+        del t
+        self.assertFalse(os.path.exists(transformers[0].t.templdir))
+        self.assertIsNot(transformers[0], self.app._search_transformer())
+
+    def test_search_cache(self):
+        res = ([{'dcterms_title': 'Result #1',
+                 'uri': 'http://example.org',
+                 'text': 'Text that contains the subsection term'}],
+               {'pagenum': 1,
+                'pagecount': 1,
+                'firstresult': 1,
+                'lastresult': 1,
+                'totalresults': 1})
+        index = Mock(**{'query.return_value': res,
+                        'generation.return_value': 1})
+        config = {'connect.return_value': index}
+        with patch('ferenda.wsgiapp.FulltextIndex', **config):
+            self.env['QUERY_STRING'] = "q=subsection&p=1"
+            status, headers, first = self.call_wsgi(self.env)
+            transformer = self.app._search_transformer()
+            # the same query, normalized, is served from the cache
+            self.env['QUERY_STRING'] = "p=1&q=subsection%20"
+            status, headers, content = self.call_wsgi(self.env)
+            self.assertEqual(first, content)
+            self.assertEqual(1, index.query.call_count)
+            # other queries are not
+            self.env['QUERY_STRING'] = "q=other"
+            status, headers, content = self.call_wsgi(self.env)
+            self.assertEqual(2, index.query.call_count)
+            # and all cached pages are stale once the index changes
+            index.generation.return_value = 2
+            self.env['QUERY_STRING'] = "q=subsection&p=1"
+            status, headers, content = self.call_wsgi(self.env)
+            self.assertEqual(3, index.query.call_count)
+            # the stylesheet is only compiled once (per thread)
+            self.assertIs(transformer, self.app._search_transformer())
+
+            # indexes that can't tell if they've changed aren't cached
+            index.generation.return_value = None
+            status, headers, content = self.call_wsgi(self.env)
+            status, headers, content = self.call_wsgi(self.env)
+            self.assertEqual(5, index.query.call_count)
+
+
     def test_search_multiple(self):
         self.env['QUERY_STRING'] = "q=part"
         res = ([{'dcterms_title':'Introduction',
@@ -870,8 +1236,9 @@ class Search(WSGI):
 
         self.env['QUERY_STRING'] = "q=needle"
         res = mkres()
-        
-        config = {'connect.return_value': Mock(**{'query.return_value': res})}
+        # the app keeps the index it connected to for later requests
+        index = Mock(**{'query.return_value': res})
+        config = {'connect.return_value': index}
         with patch('ferenda.wsgiapp.FulltextIndex', **config):
             status, headers, content = self.call_wsgi(self.env)
         self.assertResponse("200 OK",
@@ -903,7 +1270,7 @@ class Search(WSGI):
 
         self.env['QUERY_STRING'] = "q=needle&p=2"
         res = mkres(page=2)
-        config = {'connect.return_value': Mock(**{'query.return_value': res})}
+        index.query.return_value = res
         with patch('ferenda.wsgiapp.FulltextIndex', **config):
             status, headers, content = self.call_wsgi(self.env)
         t = etree.fromstring(content)
@@ -917,7 +1284,7 @@ class Search(WSGI):
 
         self.env['QUERY_STRING'] = "q=needle&p=3"
         res = mkres(page=3)
-        config = {'connect.return_value': Mock(**{'query.return_value': res})}
+        index.query.return_value = res
         with patch('ferenda.wsgiapp.FulltextIndex', **config):
             status, headers, content = self.call_wsgi(self.env)
         t = etree.fromstring(content)
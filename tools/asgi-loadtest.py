@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compares throughput and latency of the web app when served through
+WSGI and through ASGI, using a sample repo (generated documents and a
+Whoosh index) created in a temporary directory.
+
+Both modes are run in-process with the same number of concurrent
+clients and the same total number of threads: the WSGI app is served
+by a pool of worker threads (like a threaded WSGI server), the ASGI
+app by its own bounded thread pools (see ferenda.asgiapp). Four out
+of five requests are for documents, the rest are API queries against
+the fulltext index. Use --delay to add latency to each fulltext query,
+simulating a slow search backend.
+
+Requires Python 3.5 or newer. Run from the root of the repository:
+
+    $ python tools/asgi-loadtest.py [--requests 2000] [--clients 32] [--delay 0.05]
+
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 3 own code
+sys.path.insert(0, os.getcwd())
+from ferenda import DocumentRepository, FulltextIndex
+from ferenda import manager, util
+from ferenda.asgiapp import ASGIApp
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+def make_sample(datadir, documents):
+    repo = DocumentRepository(datadir=datadir)
+    index = FulltextIndex.connect("WHOOSH", datadir + "/whooshindex", [repo])
+    for i in range(documents):
+        basefile = str(i)
+        text = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(2000))
+        util.writefile(repo.store.generated_path(basefile),
+                       "<html><body><h1>Document %s</h1><p>%s</p></body></html>" %
+                       (i, text))
+        index.update(uri=repo.canonical_uri(basefile), repo=repo.alias,
+                     basefile=basefile, text=text,
+                     dcterms_title="Document %s" % i)
+    index.commit()
+    index.close()
+    return repo
+
+
+def make_app(datadir, repo, delay):
+    app = manager.make_wsgi_app(documentroot=datadir,
+                                apiendpoint="/api/",
+                                searchendpoint="/search/",
+                                url="http://localhost:8000/",
+                                repos=[repo],
+                                storetype="SQLITE",
+                                storelocation=datadir + "/ferenda.sqlite",
+                                storerepository="ferenda",
+                                indextype="WHOOSH",
+                                indexlocation=datadir + "/whooshindex")
+    if delay:
+        index = app.fulltextindex()
+        query = index.query
+
+        def slowquery(*args, **kwargs):
+            time.sleep(delay)
+            return query(*args, **kwargs)
+        index.query = slowquery
+    return app
+
+
+def requests(count, documents):
+    for i in range(count):
+        if i % 5 == 4:
+            yield "query", "/api/", "q=%s" % WORDS[i % len(WORDS)]
+        else:
+            yield "document", "/res/base/%s" % (i % documents), ""
+
+
+def environ(path, query):
+    return {'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '8000',
+            'HTTP_ACCEPT': 'text/html',
+            'wsgi.url_scheme': 'http'}
+
+
+def run_wsgi(app, reqs, clients, workers):
+    server = ThreadPoolExecutor(max_workers=workers)
+    latencies = []
+    reqs = iter(reqs)
+    lock = threading.Lock()
+
+    def handle(path, query):
+        def start_response(status, headers, exc_info=None):
+            assert status.startswith("200"), "%s: %s" % (path, status)
+        iterable = app(environ(path, query), start_response)
+        for chunk in iterable:
+            pass
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+    def client():
+        while True:
+            with lock:
+                req = next(reqs, None)
+            if req is None:
+                return
+            kind, path, query = req
+            start = time.time()
+            server.submit(handle, path, query).result()
+            latencies.append((kind, time.time() - start))
+
+    threads = [threading.Thread(target=client) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.shutdown()
+    return latencies
+
+
+def run_asgi(app, reqs, clients):
+    latencies = []
+    reqs = iter(reqs)
+
+    async def handle(path, query):
+        scope = {'type': 'http',
+                 'http_version': '1.1',
+                 'method': 'GET',
+                 'scheme': 'http',
+                 'path': path,
+                 'query_string': query.encode(),
+                 'headers': [(b'accept', b'text/html')],
+                 'server': ('localhost', 8000)}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                assert message['status'] == 200, "%s: %s" % (path, message['status'])
+        await app(scope, receive, send)
+
+    async def client():
+        for kind, path, query in reqs:
+            start = time.time()
+            await handle(path, query)
+            latencies.append((kind, time.time() - start))
+
+    async def run():
+        await asyncio.gather(*[client() for i in range(clients)])
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(run())
+    loop.close()
+    app.shutdown()
+    return latencies
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def report(mode, latencies, elapsed):
+    print("%-5s %6d requests in %.3f s (%.0f requests/s)" %
+          (mode, len(latencies), elapsed, len(latencies) / elapsed))
+    for kind in ("document", "query"):
+        values = [l for (k, l) in latencies if k == kind]
+        print("      %-8s p50 %7.1f ms  p99 %7.1f ms" %
+              (kind, percentile(values, 50) * 1000, percentile(values, 99) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--documents", type=int, default=100)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds added to each fulltext query")
+    args = parser.parse_args()
+    datadir = tempfile.mkdtemp()
+    try:
+        repo = make_sample(datadir, args.documents)
+        app = make_app(datadir, repo, args.delay)
+        workers = app.config.asgiqueryworkers + app.config.asgistaticworkers
+        print("%s clients, %s threads, %s s query delay" %
+              (args.clients, workers, args.delay))
+        start = time.time()
+        latencies = run_wsgi(app, requests(args.requests, args.documents),
+                             args.clients, workers)
+        report("WSGI", latencies, time.time() - start)
+
+        app = ASGIApp(make_app(datadir, repo, args.delay))
+        start = time.time()
+        latencies = run_asgi(app, requests(args.requests, args.documents),
+                             args.clients)
+        report("ASGI", latencies, time.time() - start)
+    finally:
+        shutil.rmtree(datadir)
+
+
+if __name__ == '__main__':
+    main()
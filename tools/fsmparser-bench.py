@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures FSMParser throughput (chunks/second) by parsing the
+fixtures in test/files/fsmparser with the parser defined in
+test/testFSMParser.py, with and without recognizer memoization.
+
+Run from the root of the repository:
+
+    $ python tools/fsmparser-bench.py [iterations]
+
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import sys
+import os
+import time
+
+# 3 own code
+sys.path.insert(0, os.getcwd())
+sys.path.insert(1, os.getcwd() + os.sep + "test")
+from ferenda import FSMParser
+from testFSMParser import Parse
+
+FIXTUREDIR = "test/files/fsmparser"
+
+
+def bench(filename, iterations, memoize):
+    FSMParser.memoize = memoize
+    tester = Parse("run_test_file")
+    chunks = 0
+    start = time.time()
+    for i in range(iterations):
+        p, b = tester.run_test_file(filename)
+        chunks += p.reader.consumed
+    return chunks, time.time() - start
+
+
+def main(iterations):
+    total = {False: [0, 0], True: [0, 0]}
+    for f in sorted(os.listdir(FIXTUREDIR)):
+        if not f.endswith(".txt"):
+            continue
+        filename = FIXTUREDIR + "/" + f
+        for memoize in (False, True):
+            chunks, elapsed = bench(filename, iterations, memoize)
+            total[memoize][0] += chunks
+            total[memoize][1] += elapsed
+            print("%-20s memoize=%-5s %6d chunks in %.3f s (%.0f chunks/s)" %
+                  (f, memoize, chunks, elapsed, chunks / elapsed))
+    for memoize in (False, True):
+        chunks, elapsed = total[memoize]
+        print("%-20s memoize=%-5s %6d chunks in %.3f s (%.0f chunks/s)" %
+              ("Total", memoize, chunks, elapsed, chunks / elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
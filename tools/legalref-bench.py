@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures LegalRef throughput (paragraphs/second) by parsing the
+SFS and DV fixtures in test/files/legalref, with and without the
+cheap trigger prefilter, and checks that the output is identical.
+
+Run from the root of the repository:
+
+    $ python tools/legalref-bench.py [iterations]
+
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import sys
+import os
+import codecs
+import re
+import time
+
+# 2 third party
+from rdflib import Graph, Namespace, RDF
+
+# 3 own code
+sys.path.insert(0, os.getcwd())
+from ferenda.elements import serialize
+from ferenda.sources.legal.se.legalref import LegalRef
+from ferenda.thirdparty.coin import URIMinter
+
+FIXTURES = (("test/files/legalref/SFS", (LegalRef.LAGRUM,)),
+            ("test/files/legalref/DV", (LegalRef.RATTSFALL,)))
+
+
+def make_minter():
+    space = "lagen/nu/res/uri/swedishlegalsource.space.ttl"
+    slugs = "lagen/nu/res/uri/swedishlegalsource.slugs.ttl"
+    cfg = Graph().parse(space, format="turtle").parse(slugs, format="turtle")
+    COIN = Namespace("http://purl.org/court/def/2009/coin#")
+    return URIMinter(cfg, cfg.value(predicate=RDF.type, object=COIN.URISpace))
+
+
+def load_paragraphs(directory):
+    paras = []
+    for f in sorted(os.listdir(directory)):
+        if not f.endswith(".txt"):
+            continue
+        with codecs.open(directory + "/" + f, encoding="windows-1252") as fp:
+            testdata = re.split('\r?\n\r?\n', fp.read(), 1)[0]
+        # skip the RESET:/BASE: directives used by the test suite
+        paras.extend([p for p in re.split('\r?\n---\r?\n', testdata)
+                      if not re.match("(RESET|NOBASE|BASE):", p)])
+    # running text mostly consists of paragraphs without references,
+    # so add the individual lines without any digits as well.
+    paras.extend([l for p in paras for l in p.split("\n")
+                  if l and not re.search("[0-9]", l)])
+    return paras
+
+
+def bench(paras, args, minter, metadata, iterations, trigger):
+    parser = LegalRef(*args)
+    if not trigger:
+        parser.trigger = None
+    result = []
+    start = time.time()
+    for i in range(iterations):
+        parser.currentlynamedlaws.clear()
+        result = [serialize(parser.parse(p, minter, metadata,
+                                         {'law': '9999:999'}))
+                  for p in paras]
+    return result, time.time() - start
+
+
+def main(iterations):
+    minter = make_minter()
+    metadata = Graph()
+    for ttl in ("lagen/nu/res/extra/swedishlegalsource.ttl",
+                "lagen/nu/res/extra/sfs.ttl"):
+        metadata.parse(ttl, format="turtle")
+    for directory, args in FIXTURES:
+        paras = load_paragraphs(directory)
+        results = {}
+        for trigger in (False, True):
+            results[trigger], elapsed = bench(paras, args, minter, metadata,
+                                              iterations, trigger)
+            count = len(paras) * iterations
+            print("%-30s trigger=%-5s %6d paragraphs in %.3f s (%.0f paragraphs/s)" %
+                  (directory, trigger, count, elapsed, count / elapsed))
+        assert results[False] == results[True], "Output differs for %s" % directory
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures the time to serialize and deserialize element trees in the
+JSON and binary formats supported by ferenda.elements, and checks that
+both formats roundtrip to the same result.
+
+The trees used are the PDFReader objects for the PDF fixtures in
+test/files/pdfreader (Pages/Textboxes/Textelements), and SFS bodies
+created by parsing the fixtures in test/files/sfs/parse (all of them
+combined into a single Body). Any element trees serialized to JSON
+(eg. by the serializeunparsed option) can be given as arguments.
+
+Run from the root of the repository:
+
+    $ python tools/serialize-bench.py [-n iterations] [file.json ...]
+
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+
+# 3 own code
+sys.path.insert(0, os.getcwd())
+from ferenda import PDFReader, TextReader, util
+from ferenda.elements import serialize, deserialize, Body
+
+
+def pdf_trees():
+    for pdffile in ("sample.pdf", "prop_1997_98_44.pdf"):
+        # make sure the intermediate files are used
+        xmlfile = "test/files/pdfreader/intermediate/" + pdffile.replace(".pdf", ".xml")
+        os.utime(xmlfile, None)
+        reader = PDFReader(filename="test/files/pdfreader/" + pdffile,
+                           workdir="test/files/pdfreader/intermediate")
+        yield "PDFReader %s" % pdffile, reader
+
+
+def sfs_tree():
+    from ferenda.sources.legal.se import SFS
+    repo = SFS()
+    body = Body()
+    for filename in sorted(glob.glob("test/files/sfs/parse/*.txt")):
+        reader = TextReader(filename=filename, encoding='iso-8859-1',
+                            linesep=TextReader.DOS)
+        reader.autostrip = True
+        try:
+            b = repo.get_parser("9999:998", reader)(reader)
+            for func, initialstate in repo.visitor_functions("9999:998"):
+                repo.visit_node(b, func, initialstate)
+            repo.lagrum_parser.parse_recursive(b)
+            body.extend(b)
+        except Exception as e:
+            print("skipping %s: %s" % (filename, e))
+        repo.current_section = '0'
+        repo.current_headline_level = 0
+    return "SFS (%s fixtures)" % len(glob.glob("test/files/sfs/parse/*.txt")), body
+
+
+def json_trees(files):
+    for filename in files:
+        yield filename, deserialize(util.readfile(filename), format="json")
+
+
+def timed(func, iterations):
+    start = time.time()
+    for i in range(iterations):
+        res = func()
+    return (time.time() - start) / iterations, res
+
+
+def bench(name, tree, iterations):
+    print(name)
+    results = {}
+    for fmt in ("json", "binary"):
+        sertime, data = timed(lambda: serialize(tree, format=fmt), iterations)
+        destime, newtree = timed(lambda: deserialize(data, format=fmt), iterations)
+        size = len(data.encode("utf-8") if fmt == "json" else data)
+        print("    %-6s %9d bytes  serialize %8.1f ms  deserialize %8.1f ms" %
+              (fmt, size, sertime * 1000, destime * 1000))
+        # objects without content (eg. Document) are serialized with
+        # their repr, including memory address
+        results[fmt] = re.sub(" at 0x[0-9a-f]+", "",
+                              serialize(newtree, format="json"))
+    if results["json"] != results["binary"]:
+        print("    ERROR: JSON and binary roundtrips differ")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--iterations", type=int, default=3)
+    parser.add_argument("files", nargs="*")
+    args = parser.parse_args()
+    for name, tree in pdf_trees():
+        bench(name, tree, args.iterations)
+    name, tree = sfs_tree()
+    bench(name, tree, args.iterations)
+    for name, tree in json_trees(args.files):
+        bench(name, tree, args.iterations)
+
+
+if __name__ == '__main__':
+    main()
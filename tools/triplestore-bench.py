@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measures the time to clear a context, replace the statements about a
+set of subjects and count the statements in a context, using the
+context-level operations of the RDFLib-based triple stores, and
+compares them with removing or counting the statements one by one.
+
+For each store type, a generated dataset is loaded into two contexts
+of a store created in a temporary directory. Only the first context
+is modified, and the statement count of the second context is checked
+after clearing the first. Store types whose backends can't be loaded are
+skipped.
+
+Run from the root of the repository:
+
+    $ python tools/triplestore-bench.py [-n triples] [storetype ...]
+
+"""
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# 2 third party
+from rdflib import Graph, URIRef
+
+# 3 own code
+sys.path.insert(0, os.getcwd())
+from ferenda import TripleStore
+
+CTX1 = "http://example.org/ctx1"
+CTX2 = "http://example.org/ctx2"
+
+
+def dataset(triples, prefix="http://example.org/doc/"):
+    lines = []
+    for i in range(triples // 4):
+        uri = "<%s%s>" % (prefix, i)
+        lines.append('%s <http://purl.org/dc/terms/identifier> "Doc %s" .' % (uri, i))
+        lines.append('%s <http://purl.org/dc/terms/title> "Document number %s"@en .' % (uri, i))
+        lines.append('%s <http://purl.org/dc/terms/references> <%s%s> .' % (uri, prefix, i + 1))
+        lines.append('%s <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> '
+                     '<http://purl.org/ontology/bibo/Document> .' % uri)
+    return "\n".join(lines).encode("utf-8")
+
+
+def connect(storetype, workdir):
+    location = workdir + {"SQLITE": "/ferenda.sqlite",
+                          "SLEEPYCAT": "/ferenda.db"}[storetype]
+    return TripleStore.connect(storetype, location, "ferenda")
+
+
+def load(store, data):
+    store.clear()
+    store.add_serialized(data, format="nt", context=CTX1)
+    store.add_serialized(data, format="nt", context=CTX2)
+
+
+def old_clear(store, context):
+    g = store._getcontextgraph(context)
+    for (s, p, o) in g:
+        store.graph.remove((s, p, o))
+    store.graph.commit()
+
+
+def old_replace_subjects(store, subjects, data, context):
+    g = store._getcontextgraph(context)
+    for subject in subjects:
+        for (s, p, o) in list(g.triples((URIRef(subject), None, None))):
+            store.graph.remove((s, p, o))
+    g.parse(data=data, format="nt")
+    store.graph.commit()
+
+
+def old_triple_count(store, context):
+    return len(list(store._getcontextgraph(context)))
+
+
+def timed(func):
+    start = time.time()
+    res = func()
+    return time.time() - start, res
+
+
+def bench(storetype, triples):
+    workdir = tempfile.mkdtemp()
+    try:
+        try:
+            store = connect(storetype, workdir)
+        except Exception as e:
+            print("skipping %s: %s" % (storetype, e))
+            return
+        print("%s (%s triples per context)" % (storetype, triples))
+        data = dataset(triples)
+        subjects = set(Graph().parse(data=data, format="nt").subjects())
+        # every other subject gets new statements
+        subjects = sorted(subjects)[::2]
+        newdata = b"\n".join(line.replace(b"Document number", b"Doc no")
+                             for line in data.split(b"\n")
+                             if line.split(b" ")[0][1:-1].decode() in subjects)
+
+        load(store, data)
+        old, oldcount = timed(lambda: old_triple_count(store, CTX1))
+        new, newcount = timed(lambda: store.triple_count(CTX1))
+        report("triple_count", old, new, oldcount == newcount)
+
+        # the old loop removes each statement from all contexts, so
+        # only the result of the new method is checked
+        old, res = timed(lambda: old_clear(store, CTX1))
+        load(store, data)
+        new, res = timed(lambda: store.clear(CTX1))
+        report("clear", old, new,
+               store.triple_count(CTX1) == 0 and store.triple_count(CTX2) == newcount)
+
+        load(store, data)
+        old, res = timed(lambda: old_replace_subjects(store, subjects, newdata, CTX1))
+        oldcount = store.triple_count(CTX1)
+        load(store, data)
+        new, res = timed(lambda: store.replace_subjects(subjects, newdata, "nt", CTX1))
+        report("replace_subjects", old, new,
+               store.triple_count(CTX1) == oldcount)
+        store.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+def report(operation, old, new, ok):
+    print("    %-16s old %9.1f ms  new %9.1f ms  %s" %
+          (operation, old * 1000, new * 1000,
+           "" if ok else "ERROR: results differ"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--triples", type=int, default=20000)
+    parser.add_argument("storetypes", nargs="*",
+                        default=["SQLITE", "SLEEPYCAT"])
+    args = parser.parse_args()
+    for storetype in args.storetypes:
+        bench(storetype, args.triples)
+
+
+if __name__ == '__main__':
+    main()